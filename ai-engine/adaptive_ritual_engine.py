@@ -6,10 +6,21 @@ Sistema inteligente que personaliza e adapta rituais baseado no estado do usuár
 import numpy as np
 import json
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
+from types import MappingProxyType
 import logging
+import threading
+import uuid
+
+from ritual_bandit import RitualStepBandit
+from ritual_learning_persistence import RitualLearningRepository
+from ritual_learning_state import UserStateStore, apply_feedback_event
+from ritual_priors import ALL_DAY, TIME_BUCKETS, RitualPriors, time_bucket_for_hour
+from sharded_locks import ShardedLock
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -34,7 +45,15 @@ class RitualComponent(Enum):
     MUSIC = "music"
     NATURE_SOUNDS = "nature_sounds"
 
-@dataclass
+# Padrões de respiração (compartilhados e imutáveis)
+BREATHING_PATTERNS = MappingProxyType({
+    'calm': MappingProxyType({'inhale': 4, 'hold': 4, 'exhale': 6, 'pause': 2}),
+    'energizing': MappingProxyType({'inhale': 4, 'hold': 2, 'exhale': 4, 'pause': 1}),
+    'focus': MappingProxyType({'inhale': 4, 'hold': 7, 'exhale': 8, 'pause': 0}),
+    'stress_relief': MappingProxyType({'inhale': 4, 'hold': 4, 'exhale': 8, 'pause': 2})
+})
+
+@dataclass(frozen=True, slots=True)
 class RitualStep:
     id: str
     name: str
@@ -45,7 +64,373 @@ class RitualStep:
     audio_cue: Optional[str] = None
     visual_cue: Optional[str] = None
     breathing_pattern: Optional[Dict] = None
+    detailed_instructions: str = field(default='', repr=False, compare=False)
+    
+    def __post_init__(self):
+        # Instruções detalhadas são pré-calculadas uma única vez por passo
+        if not self.detailed_instructions:
+            object.__setattr__(self, 'detailed_instructions', _build_detailed_instructions(self))
     
+    @property
+    def base(self) -> 'RitualStep':
+        return self
+    
+    def with_overrides(self, duration_seconds: Optional[int] = None,
+                       instructions: Optional[str] = None) -> 'AdaptedRitualStep':
+        """
+        Cria uma visão leve do passo com duração e/ou instruções sobrescritas
+        """
+        return AdaptedRitualStep(
+            self,
+            self.duration_seconds if duration_seconds is None else duration_seconds,
+            self.instructions if instructions is None else instructions
+        )
+    
+    def to_dict(self) -> Dict:
+        return _serialize_step(self, self.duration_seconds, self.instructions)
+
+class AdaptedRitualStep:
+    """
+    Visão de um RitualStep compartilhado que guarda apenas os campos
+    adaptados (duração e instruções); o restante é lido do passo base.
+    """
+    __slots__ = ('base', 'duration_seconds', 'instructions')
+    
+    def __init__(self, base: RitualStep, duration_seconds: int, instructions: str):
+        self.base = base
+        self.duration_seconds = duration_seconds
+        self.instructions = instructions
+    
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+    
+    def with_overrides(self, duration_seconds: Optional[int] = None,
+                       instructions: Optional[str] = None) -> 'AdaptedRitualStep':
+        return AdaptedRitualStep(
+            self.base,
+            self.duration_seconds if duration_seconds is None else duration_seconds,
+            self.instructions if instructions is None else instructions
+        )
+    
+    def to_dict(self) -> Dict:
+        return _serialize_step(self.base, self.duration_seconds, self.instructions)
+
+def _serialize_step(step: RitualStep, duration_seconds: int, instructions: str) -> Dict:
+    """
+    Serializa um passo em uma única passada, no mesmo formato de `asdict`
+    """
+    return {
+        'id': step.id,
+        'name': step.name,
+        'description': step.description,
+        'component': step.component,
+        'duration_seconds': duration_seconds,
+        'instructions': instructions,
+        'audio_cue': step.audio_cue,
+        'visual_cue': step.visual_cue,
+        'breathing_pattern': dict(step.breathing_pattern) if step.breathing_pattern else None
+    }
+
+def _build_detailed_instructions(component: RitualStep) -> str:
+    """
+    Monta as instruções detalhadas para usuários que preferem mais orientação
+    """
+    base_instructions = component.instructions
+    
+    if component.component == RitualComponent.BREATHING:
+        if component.breathing_pattern:
+            pattern = component.breathing_pattern
+            detailed = f"{base_instructions}\n\nPadrão específico:\n"
+            detailed += f"• Inspire por {pattern['inhale']} segundos\n"
+            detailed += f"• Segure por {pattern['hold']} segundos\n"
+            detailed += f"• Expire por {pattern['exhale']} segundos\n"
+            detailed += f"• Pause por {pattern['pause']} segundos\n"
+            detailed += "Repita este ciclo durante toda a prática."
+            return detailed
+    
+    elif component.component == RitualComponent.MEDITATION:
+        detailed = f"{base_instructions}\n\nDicas adicionais:\n"
+        detailed += "• Sente-se confortavelmente com a coluna ereta\n"
+        detailed += "• Feche os olhos suavemente\n"
+        detailed += "• Se a mente divagar, gentilmente retorne o foco\n"
+        detailed += "• Não julgue os pensamentos, apenas observe"
+        return detailed
+    
+    elif component.component == RitualComponent.VISUALIZATION:
+        detailed = f"{base_instructions}\n\nComo visualizar:\n"
+        detailed += "• Use todos os sentidos na visualização\n"
+        detailed += "• Torne as imagens vívidas e coloridas\n"
+        detailed += "• Inclua sons, cheiros e sensações\n"
+        detailed += "• Mantenha as imagens positivas e inspiradoras"
+        return detailed
+    
+    return base_instructions
+
+@lru_cache(maxsize=None)
+def get_ritual_library() -> Dict[RitualType, Tuple[RitualStep, ...]]:
+    """
+    Constrói a biblioteca de componentes de rituais uma única vez por processo
+    """
+    library = {
+        RitualType.MORNING: [
+            RitualStep(
+                id="morning_breath",
+                name="Respiração Matinal",
+                description="Respiração energizante para começar o dia",
+                component=RitualComponent.BREATHING,
+                duration_seconds=180,
+                instructions="Respire profundamente seguindo o padrão energizante",
+                breathing_pattern=BREATHING_PATTERNS['energizing']
+            ),
+            RitualStep(
+                id="morning_intention",
+                name="Intenção do Dia",
+                description="Definir intenção e foco para o dia",
+                component=RitualComponent.VISUALIZATION,
+                duration_seconds=120,
+                instructions="Visualize como você quer que seu dia transcorra"
+            ),
+            RitualStep(
+                id="morning_affirmation",
+                name="Afirmações Positivas",
+                description="Afirmações para energia e confiança",
+                component=RitualComponent.AFFIRMATION,
+                duration_seconds=60,
+                instructions="Repita mentalmente: 'Estou presente, focado e capaz'"
+            ),
+            RitualStep(
+                id="morning_stretch",
+                name="Alongamento Suave",
+                description="Movimentos para despertar o corpo",
+                component=RitualComponent.MOVEMENT,
+                duration_seconds=240,
+                instructions="Faça alongamentos suaves para ativar a circulação"
+            )
+        ],
+        
+        RitualType.EVENING: [
+            RitualStep(
+                id="evening_reflection",
+                name="Reflexão do Dia",
+                description="Revisão consciente do dia",
+                component=RitualComponent.JOURNALING,
+                duration_seconds=300,
+                instructions="Reflita sobre 3 momentos positivos do dia"
+            ),
+            RitualStep(
+                id="evening_breath",
+                name="Respiração Calmante",
+                description="Respiração para relaxamento",
+                component=RitualComponent.BREATHING,
+                duration_seconds=240,
+                instructions="Respire lentamente para acalmar o sistema nervoso",
+                breathing_pattern=BREATHING_PATTERNS['calm']
+            ),
+            RitualStep(
+                id="evening_gratitude",
+                name="Gratidão",
+                description="Prática de gratidão",
+                component=RitualComponent.AFFIRMATION,
+                duration_seconds=120,
+                instructions="Liste mentalmente 3 coisas pelas quais é grato"
+            ),
+            RitualStep(
+                id="evening_release",
+                name="Liberação do Dia",
+                description="Soltar as tensões do dia",
+                component=RitualComponent.VISUALIZATION,
+                duration_seconds=180,
+                instructions="Visualize liberando todas as tensões e preocupações"
+            )
+        ],
+        
+        RitualType.FOCUS: [
+            RitualStep(
+                id="focus_breath",
+                name="Respiração para Foco",
+                description="Técnica de respiração para concentração",
+                component=RitualComponent.BREATHING,
+                duration_seconds=120,
+                instructions="Use a respiração 4-7-8 para aumentar o foco",
+                breathing_pattern=BREATHING_PATTERNS['focus']
+            ),
+            RitualStep(
+                id="focus_intention",
+                name="Intenção de Foco",
+                description="Definir intenção clara para a tarefa",
+                component=RitualComponent.VISUALIZATION,
+                duration_seconds=60,
+                instructions="Visualize-se completando a tarefa com total concentração"
+            ),
+            RitualStep(
+                id="focus_anchor",
+                name="Âncora de Atenção",
+                description="Estabelecer ponto de ancoragem mental",
+                component=RitualComponent.MEDITATION,
+                duration_seconds=90,
+                instructions="Foque na respiração como âncora para a atenção"
+            )
+        ],
+        
+        RitualType.STRESS_RELIEF: [
+            RitualStep(
+                id="stress_breath",
+                name="Respiração Anti-Stress",
+                description="Respiração para reduzir stress",
+                component=RitualComponent.BREATHING,
+                duration_seconds=300,
+                instructions="Respire lentamente, focando na expiração longa",
+                breathing_pattern=BREATHING_PATTERNS['stress_relief']
+            ),
+            RitualStep(
+                id="stress_body_scan",
+                name="Escaneamento Corporal",
+                description="Relaxamento progressivo",
+                component=RitualComponent.MEDITATION,
+                duration_seconds=480,
+                instructions="Escaneie o corpo da cabeça aos pés, relaxando cada parte"
+            ),
+            RitualStep(
+                id="stress_release",
+                name="Liberação de Tensão",
+                description="Visualização para liberar stress",
+                component=RitualComponent.VISUALIZATION,
+                duration_seconds=240,
+                instructions="Visualize o stress saindo do corpo como fumaça"
+            ),
+            RitualStep(
+                id="stress_affirmation",
+                name="Afirmações Calmantes",
+                description="Frases para tranquilidade",
+                component=RitualComponent.AFFIRMATION,
+                duration_seconds=120,
+                instructions="Repita: 'Estou calmo, seguro e no controle'"
+            )
+        ],
+        
+        RitualType.ENERGY_BOOST: [
+            RitualStep(
+                id="energy_breath",
+                name="Respiração Energizante",
+                description="Técnica para aumentar energia",
+                component=RitualComponent.BREATHING,
+                duration_seconds=120,
+                instructions="Respiração rápida e ritmada para ativar energia",
+                breathing_pattern=BREATHING_PATTERNS['energizing']
+            ),
+            RitualStep(
+                id="energy_movement",
+                name="Movimento Ativador",
+                description="Exercícios para despertar energia",
+                component=RitualComponent.MOVEMENT,
+                duration_seconds=180,
+                instructions="Faça movimentos dinâmicos: pular, alongar, balançar braços"
+            ),
+            RitualStep(
+                id="energy_visualization",
+                name="Visualização de Energia",
+                description="Imaginar energia fluindo pelo corpo",
+                component=RitualComponent.VISUALIZATION,
+                duration_seconds=90,
+                instructions="Visualize luz dourada preenchendo seu corpo com energia"
+            ),
+            RitualStep(
+                id="energy_affirmation",
+                name="Afirmações Energéticas",
+                description="Frases para vitalidade",
+                component=RitualComponent.AFFIRMATION,
+                duration_seconds=60,
+                instructions="Repita: 'Estou cheio de energia e vitalidade'"
+            )
+        ]
+    }
+    
+    return MappingProxyType({ritual_type: tuple(steps) for ritual_type, steps in library.items()})
+
+# Necessidades avaliadas e o tipo de ritual que atende cada uma (mesma ordem)
+NEED_NAMES = ('energy_boost', 'stress_relief', 'focus_enhancement', 'relaxation', 'grounding')
+NEED_RITUAL_TYPES = (
+    RitualType.ENERGY_BOOST,
+    RitualType.STRESS_RELIEF,
+    RitualType.FOCUS,
+    RitualType.EVENING,
+    RitualType.MINDFULNESS
+)
+
+class RitualResponseCache:
+    """
+    Cache LRU de rituais gerados, indexado pelo estado quantizado do usuário.
+    
+    O conteúdo do ritual depende apenas dos níveis de energia/stress/foco, da
+    faixa horária, do tempo disponível, das atividades recentes e da versão
+    do estado aprendido do usuário; por isso usuários em estados equivalentes
+    compartilham a mesma entrada. Campos por requisição (id, created_at e o
+    estado pré-ritual) são carimbados em cada resposta.
+    """
+    
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key) -> Optional[Dict]:
+        with self._lock:
+            ritual = self._entries.get(key)
+            if ritual is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return ritual
+    
+    def put(self, key, ritual: Dict):
+        with self._lock:
+            self._entries[key] = ritual
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+def _new_ritual_id(now: datetime) -> str:
+    return f"adaptive_ritual_{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+def _stamp_ritual(template: Dict, state: Dict) -> Dict:
+    """
+    Copia um ritual em cache com id, timestamp e estado pré-ritual novos
+    """
+    now = datetime.now()
+    return {
+        **template,
+        'id': _new_ritual_id(now),
+        'created_at': now.isoformat(),
+        'components': [
+            {**comp, 'breathing_pattern': dict(comp['breathing_pattern']) if comp['breathing_pattern'] else None}
+            for comp in template['components']
+        ],
+        'effectiveness_tracking': {
+            'pre_ritual_state': state,
+            'expected_outcomes': dict(template['effectiveness_tracking']['expected_outcomes'])
+        }
+    }
+
 class AdaptiveRitualEngine:
     """
     Motor que cria e adapta rituais baseado em:
@@ -55,10 +440,70 @@ class AdaptiveRitualEngine:
     - Preferências pessoais aprendidas
     """
     
-    def __init__(self):
-        self.ritual_library = self._initialize_ritual_library()
-        self.user_preferences = {}
-        self.effectiveness_history = {}
+    def __init__(self, max_tracked_users: Optional[int] = None,
+                 state_ttl_seconds: Optional[float] = None,
+                 state_memory_limit_bytes: Optional[int] = 64 * 1024 * 1024,
+                 persistence: Optional[RitualLearningRepository] = None,
+                 state_refresh_seconds: Optional[float] = 30.0,
+                 response_cache_size: int = 10000,
+                 priors: Optional[RitualPriors] = None):
+        self.ritual_library = get_ritual_library()
+        
+        # Cache de rituais por estado quantizado (0 desativa)
+        self.response_cache = RitualResponseCache(response_cache_size) if response_cache_size else None
+        
+        # Catálogo único de passos e bandit UCB para seleção por usuário
+        self.step_catalog = tuple(step for steps in self.ritual_library.values() for step in steps)
+        self.step_bandit = RitualStepBandit([step.id for step in self.step_catalog])
+        self.step_indices_by_type = {}
+        for i, step in enumerate(self.step_catalog):
+            for ritual_type, steps in self.ritual_library.items():
+                if step in steps:
+                    self.step_indices_by_type.setdefault(ritual_type, []).append(i)
+        self.step_indices_by_type = {
+            ritual_type: np.array(indices) for ritual_type, indices in self.step_indices_by_type.items()
+        }
+        
+        # Priors entre usuários (pré-calculados por ritual_priors.py) por faixa horária;
+        # sem `priors`, lidos do banco da persistência (RitualPriors() desativa)
+        if priors is None and persistence is not None:
+            priors = RitualPriors.load(persistence.db_path)
+        self.priors = priors
+        self.population_step_params = {}
+        if priors:
+            step_types = {}
+            for ritual_type, indices in self.step_indices_by_type.items():
+                for i in indices:
+                    step_types.setdefault(int(i), ritual_type.value)
+            for bucket in [ALL_DAY, 'night', *(name for name, _, _ in TIME_BUCKETS)]:
+                self.population_step_params[bucket] = self.step_bandit.params_from_means([
+                    priors.effectiveness(step_types[i], bucket) for i in range(len(self.step_catalog))
+                ])
+        
+        # Passos entregues em cada ritual recente, para creditar o feedback
+        self.issued_rituals = OrderedDict()
+        self.max_issued_rituals = 10000
+        self._issued_lock = threading.Lock()
+        
+        # Uma instância atende várias threads: o estado de cada usuário é
+        # protegido pelo seu shard, sem serializar usuários de outros shards
+        self.user_locks = ShardedLock()
+        
+        # Persistência opcional (SQLite) do estado aprendido, com escrita em lote
+        self.persistence = persistence
+        
+        # Efetividade (últimos 20 registros por componente) e preferências por usuário
+        self.learning_state = UserStateStore(
+            [component.value for component in RitualComponent],
+            window=20,
+            max_users=max_tracked_users,
+            ttl_seconds=state_ttl_seconds,
+            max_bytes=state_memory_limit_bytes,
+            loader=persistence.load if persistence else None,
+            new_step_params=self._new_step_params,
+            # Com persistência, relê periodicamente o aprendizado gravado por outros workers
+            refresh_seconds=state_refresh_seconds if persistence else None
+        )
         self.adaptation_weights = {
             'user_state': 0.4,
             'historical_effectiveness': 0.3,
@@ -67,192 +512,7 @@ class AdaptiveRitualEngine:
         }
         
         # Padrões de respiração
-        self.breathing_patterns = {
-            'calm': {'inhale': 4, 'hold': 4, 'exhale': 6, 'pause': 2},
-            'energizing': {'inhale': 4, 'hold': 2, 'exhale': 4, 'pause': 1},
-            'focus': {'inhale': 4, 'hold': 7, 'exhale': 8, 'pause': 0},
-            'stress_relief': {'inhale': 4, 'hold': 4, 'exhale': 8, 'pause': 2}
-        }
-    
-    def _initialize_ritual_library(self) -> Dict[RitualType, List[RitualStep]]:
-        """
-        Inicializa a biblioteca de componentes de rituais
-        """
-        library = {
-            RitualType.MORNING: [
-                RitualStep(
-                    id="morning_breath",
-                    name="Respiração Matinal",
-                    description="Respiração energizante para começar o dia",
-                    component=RitualComponent.BREATHING,
-                    duration_seconds=180,
-                    instructions="Respire profundamente seguindo o padrão energizante",
-                    breathing_pattern=self.breathing_patterns['energizing']
-                ),
-                RitualStep(
-                    id="morning_intention",
-                    name="Intenção do Dia",
-                    description="Definir intenção e foco para o dia",
-                    component=RitualComponent.VISUALIZATION,
-                    duration_seconds=120,
-                    instructions="Visualize como você quer que seu dia transcorra"
-                ),
-                RitualStep(
-                    id="morning_affirmation",
-                    name="Afirmações Positivas",
-                    description="Afirmações para energia e confiança",
-                    component=RitualComponent.AFFIRMATION,
-                    duration_seconds=60,
-                    instructions="Repita mentalmente: 'Estou presente, focado e capaz'"
-                ),
-                RitualStep(
-                    id="morning_stretch",
-                    name="Alongamento Suave",
-                    description="Movimentos para despertar o corpo",
-                    component=RitualComponent.MOVEMENT,
-                    duration_seconds=240,
-                    instructions="Faça alongamentos suaves para ativar a circulação"
-                )
-            ],
-            
-            RitualType.EVENING: [
-                RitualStep(
-                    id="evening_reflection",
-                    name="Reflexão do Dia",
-                    description="Revisão consciente do dia",
-                    component=RitualComponent.JOURNALING,
-                    duration_seconds=300,
-                    instructions="Reflita sobre 3 momentos positivos do dia"
-                ),
-                RitualStep(
-                    id="evening_breath",
-                    name="Respiração Calmante",
-                    description="Respiração para relaxamento",
-                    component=RitualComponent.BREATHING,
-                    duration_seconds=240,
-                    instructions="Respire lentamente para acalmar o sistema nervoso",
-                    breathing_pattern=self.breathing_patterns['calm']
-                ),
-                RitualStep(
-                    id="evening_gratitude",
-                    name="Gratidão",
-                    description="Prática de gratidão",
-                    component=RitualComponent.AFFIRMATION,
-                    duration_seconds=120,
-                    instructions="Liste mentalmente 3 coisas pelas quais é grato"
-                ),
-                RitualStep(
-                    id="evening_release",
-                    name="Liberação do Dia",
-                    description="Soltar as tensões do dia",
-                    component=RitualComponent.VISUALIZATION,
-                    duration_seconds=180,
-                    instructions="Visualize liberando todas as tensões e preocupações"
-                )
-            ],
-            
-            RitualType.FOCUS: [
-                RitualStep(
-                    id="focus_breath",
-                    name="Respiração para Foco",
-                    description="Técnica de respiração para concentração",
-                    component=RitualComponent.BREATHING,
-                    duration_seconds=120,
-                    instructions="Use a respiração 4-7-8 para aumentar o foco",
-                    breathing_pattern=self.breathing_patterns['focus']
-                ),
-                RitualStep(
-                    id="focus_intention",
-                    name="Intenção de Foco",
-                    description="Definir intenção clara para a tarefa",
-                    component=RitualComponent.VISUALIZATION,
-                    duration_seconds=60,
-                    instructions="Visualize-se completando a tarefa com total concentração"
-                ),
-                RitualStep(
-                    id="focus_anchor",
-                    name="Âncora de Atenção",
-                    description="Estabelecer ponto de ancoragem mental",
-                    component=RitualComponent.MEDITATION,
-                    duration_seconds=90,
-                    instructions="Foque na respiração como âncora para a atenção"
-                )
-            ],
-            
-            RitualType.STRESS_RELIEF: [
-                RitualStep(
-                    id="stress_breath",
-                    name="Respiração Anti-Stress",
-                    description="Respiração para reduzir stress",
-                    component=RitualComponent.BREATHING,
-                    duration_seconds=300,
-                    instructions="Respire lentamente, focando na expiração longa",
-                    breathing_pattern=self.breathing_patterns['stress_relief']
-                ),
-                RitualStep(
-                    id="stress_body_scan",
-                    name="Escaneamento Corporal",
-                    description="Relaxamento progressivo",
-                    component=RitualComponent.MEDITATION,
-                    duration_seconds=480,
-                    instructions="Escaneie o corpo da cabeça aos pés, relaxando cada parte"
-                ),
-                RitualStep(
-                    id="stress_release",
-                    name="Liberação de Tensão",
-                    description="Visualização para liberar stress",
-                    component=RitualComponent.VISUALIZATION,
-                    duration_seconds=240,
-                    instructions="Visualize o stress saindo do corpo como fumaça"
-                ),
-                RitualStep(
-                    id="stress_affirmation",
-                    name="Afirmações Calmantes",
-                    description="Frases para tranquilidade",
-                    component=RitualComponent.AFFIRMATION,
-                    duration_seconds=120,
-                    instructions="Repita: 'Estou calmo, seguro e no controle'"
-                )
-            ],
-            
-            RitualType.ENERGY_BOOST: [
-                RitualStep(
-                    id="energy_breath",
-                    name="Respiração Energizante",
-                    description="Técnica para aumentar energia",
-                    component=RitualComponent.BREATHING,
-                    duration_seconds=120,
-                    instructions="Respiração rápida e ritmada para ativar energia",
-                    breathing_pattern=self.breathing_patterns['energizing']
-                ),
-                RitualStep(
-                    id="energy_movement",
-                    name="Movimento Ativador",
-                    description="Exercícios para despertar energia",
-                    component=RitualComponent.MOVEMENT,
-                    duration_seconds=180,
-                    instructions="Faça movimentos dinâmicos: pular, alongar, balançar braços"
-                ),
-                RitualStep(
-                    id="energy_visualization",
-                    name="Visualização de Energia",
-                    description="Imaginar energia fluindo pelo corpo",
-                    component=RitualComponent.VISUALIZATION,
-                    duration_seconds=90,
-                    instructions="Visualize luz dourada preenchendo seu corpo com energia"
-                ),
-                RitualStep(
-                    id="energy_affirmation",
-                    name="Afirmações Energéticas",
-                    description="Frases para vitalidade",
-                    component=RitualComponent.AFFIRMATION,
-                    duration_seconds=60,
-                    instructions="Repita: 'Estou cheio de energia e vitalidade'"
-                )
-            ]
-        }
-        
-        return library
+        self.breathing_patterns = BREATHING_PATTERNS
     
     def analyze_user_state(self, user_data: Dict) -> Dict:
         """
@@ -344,29 +604,185 @@ class AdaptiveRitualEngine:
         
         # Se nenhuma necessidade específica, usar contexto temporal
         if not recommendations:
-            hour = datetime.now().hour
-            if 6 <= hour <= 10:
-                recommendations.append(RitualType.MORNING)
-            elif 19 <= hour <= 23:
-                recommendations.append(RitualType.EVENING)
-            else:
-                recommendations.append(RitualType.MINDFULNESS)
+            recommendations.append(self._temporal_ritual_type())
         
         return recommendations[:2]  # Máximo 2 tipos
     
+    def _temporal_ritual_type(self) -> RitualType:
+        """
+        Tipo de ritual baseado apenas no horário atual
+        """
+        hour = datetime.now().hour
+        if 6 <= hour <= 10:
+            return RitualType.MORNING
+        elif 19 <= hour <= 23:
+            return RitualType.EVENING
+        return RitualType.MINDFULNESS
+    
     def create_adaptive_ritual(self, user_data: Dict) -> Dict:
         """
         Cria um ritual personalizado baseado no estado do usuário
         """
         analysis = self.analyze_user_state(user_data)
+        return self._assemble_ritual(analysis, user_data.get('user_id', 'default'))
+    
+    def create_adaptive_rituals_batch(self, user_states: Dict[str, Sequence]) -> List[Dict]:
+        """
+        Cria rituais para muitos usuários de uma vez.
+        
+        `user_states` é colunar: cada chave de `user_data` (user_id, energy_level,
+        stress_level, focus_level, time_of_day, available_time_minutes, mood,
+        environment, recent_activities) mapeia para uma sequência com um valor
+        por usuário. Colunas ausentes usam os mesmos padrões de
+        `analyze_user_state`. As necessidades e os tipos de ritual são
+        calculados de forma vetorizada; os rituais saem na ordem de entrada.
+        """
+        user_ids = list(user_states['user_id'])
+        n_users = len(user_ids)
+        
+        def column(name, default, dtype=None):
+            values = user_states.get(name)
+            if values is None:
+                return np.full(n_users, default, dtype=dtype)
+            return np.asarray(values, dtype=dtype)
+        
+        def object_column(name, default):
+            values = user_states.get(name)
+            if values is None:
+                return [default() for _ in range(n_users)]
+            return list(values)
+        
+        energy = column('energy_level', 3, np.int64)
+        stress = column('stress_level', 3, np.int64)
+        focus = column('focus_level', 3, np.int64)
+        hours = column('time_of_day', datetime.now().hour, np.int64)
+        available = column('available_time_minutes', 10)
+        moods = object_column('mood', lambda: 'neutral')
+        environments = object_column('environment', lambda: 'office')
+        activities = object_column('recent_activities', list)
+        grounding = np.fromiter(
+            ('meeting' in acts or 'presentation' in acts for acts in activities),
+            dtype=bool, count=n_users
+        )
+        
+        needs_matrix = self._calculate_needs_batch(energy, stress, focus, hours, grounding)
+        recommended = self._recommend_ritual_types_batch(needs_matrix)
+        
+        rituals = []
+        for i in range(n_users):
+            state = {
+                'energy_level': int(energy[i]),
+                'stress_level': int(stress[i]),
+                'focus_level': int(focus[i]),
+                'mood': moods[i],
+                'time_of_day': int(hours[i]),
+                'available_time': available[i].item(),
+                'environment': environments[i],
+                'recent_activities': activities[i]
+            }
+            analysis = {
+                'current_state': state,
+                'identified_needs': dict(zip(NEED_NAMES, needs_matrix[i].tolist())),
+                'recommended_ritual_types': recommended[i]
+            }
+            rituals.append(self._assemble_ritual(analysis, user_ids[i]))
+        
+        return rituals
+    
+    def _calculate_needs_batch(self, energy: np.ndarray, stress: np.ndarray, focus: np.ndarray,
+                               hours: np.ndarray, grounding: np.ndarray) -> np.ndarray:
+        """
+        Versão vetorizada de `_calculate_needs`: matriz (usuários x NEED_NAMES)
+        """
+        needs = np.zeros((len(energy), len(NEED_NAMES)))
+        needs[:, 0] = np.where(energy <= 2, 0.8, np.where(energy == 3, 0.3, 0.0))
+        needs[:, 1] = np.where(stress >= 4, 0.9, np.where(stress == 3, 0.4, 0.0))
+        needs[:, 2] = np.where(focus <= 2, 0.7, np.where(focus == 3, 0.3, 0.0))
+        needs[:, 3] = np.where(hours >= 19, 0.6, np.where(hours <= 7, 0.3, 0.0))
+        needs[:, 4] = np.where(grounding, 0.5, 0.0)
+        return needs
+    
+    def _recommend_ritual_types_batch(self, needs: np.ndarray) -> List[List[RitualType]]:
+        """
+        Versão vetorizada de `_recommend_ritual_types` (até 2 tipos por usuário)
+        """
+        # Ordenação estável decrescente, como `sorted(..., reverse=True)`
+        top = np.argsort(-needs, axis=1, kind='stable')[:, :2]
+        selected = np.take_along_axis(needs, top, axis=1) > 0.5
+        
+        fallback = [self._temporal_ritual_type()]
+        return [
+            [NEED_RITUAL_TYPES[j] for j, keep in zip(row, mask) if keep] or fallback
+            for row, mask in zip(top.tolist(), selected.tolist())
+        ]
+    
+    def _assemble_ritual(self, analysis: Dict, user_id: str) -> Dict:
+        """
+        Monta o ritual a partir da análise de estado de um usuário,
+        reaproveitando o cache quando o estado quantizado já foi visto
+        """
+        with self.user_locks.for_key(user_id):
+            ritual = self._cached_ritual(analysis, user_id)
+        
+        with self._issued_lock:
+            self.issued_rituals[ritual['id']] = [comp['id'] for comp in ritual['components']]
+            if len(self.issued_rituals) > self.max_issued_rituals:
+                self.issued_rituals.popitem(last=False)
+        
+        return ritual
+    
+    def _cached_ritual(self, analysis: Dict, user_id: str) -> Dict:
+        if self.response_cache is None:
+            return self._build_ritual(analysis, user_id)
+        
+        key = self._cache_key(analysis, user_id)
+        try:
+            template = self.response_cache.get(key)
+        except TypeError:
+            # Estado com valores não hasheáveis: não cacheável
+            return self._build_ritual(analysis, user_id)
+        
+        if template is None:
+            template = self._build_ritual(analysis, user_id)
+            self.response_cache.put(key, template)
+        
+        return _stamp_ritual(template, analysis['current_state'])
+    
+    def _cache_key(self, analysis: Dict, user_id: str) -> Tuple:
+        """
+        Chave do estado quantizado que determina o conteúdo do ritual
+        """
+        state = analysis['current_state']
+        hour = state['time_of_day']
+        hour_bucket = 2 if hour >= 19 else (0 if hour <= 7 else 1)
+        activities = state['recent_activities']
+        grounding = 'meeting' in activities or 'presentation' in activities
+        
+        # Usuários sem estado aprendido compartilham a personalização padrão
+        user_state = self.learning_state.get(user_id)
+        personalization = (user_id, user_state.version) if user_state is not None else None
+        prior_bucket = time_bucket_for_hour(hour) if self.population_step_params else None
+        
+        return (
+            state['energy_level'], state['stress_level'], state['focus_level'],
+            hour_bucket, prior_bucket, state['available_time'], grounding,
+            tuple(analysis['recommended_ritual_types']), personalization
+        )
+    
+    def _build_ritual(self, analysis: Dict, user_id: str) -> Dict:
+        """
+        Constrói o ritual completo (sem cache)
+        """
         state = analysis['current_state']
         recommended_types = analysis['recommended_ritual_types']
         
         # Selecionar tipo principal de ritual
         primary_type = recommended_types[0] if recommended_types else RitualType.MINDFULNESS
         
-        # Obter componentes base
-        base_components = self.ritual_library.get(primary_type, [])
+        # Selecionar componentes (bandit sobre os tipos recomendados)
+        base_components = self._select_components(
+            recommended_types, primary_type, user_id, state['time_of_day']
+        )
         
         # Adaptar componentes baseado no tempo disponível
         adapted_components = self._adapt_for_time_constraint(
@@ -375,20 +791,22 @@ class AdaptiveRitualEngine:
         
         # Personalizar baseado no histórico
         personalized_components = self._personalize_components(
-            adapted_components, user_data.get('user_id', 'default')
+            adapted_components, user_id
         )
         
         # Calcular duração total
         total_duration = sum(comp.duration_seconds for comp in personalized_components)
         
+        now = datetime.now()
         ritual = {
-            'id': f"adaptive_ritual_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            'id': _new_ritual_id(now),
+            'created_at': now.isoformat(),
             'name': f"Ritual Personalizado - {primary_type.value.title()}",
             'description': f"Ritual adaptado para suas necessidades atuais",
             'type': primary_type.value,
             'total_duration_seconds': total_duration,
             'total_duration_minutes': round(total_duration / 60, 1),
-            'components': [asdict(comp) for comp in personalized_components],
+            'components': [comp.to_dict() for comp in personalized_components],
             'adaptation_reasoning': self._generate_adaptation_reasoning(analysis),
             'effectiveness_tracking': {
                 'pre_ritual_state': state,
@@ -398,6 +816,36 @@ class AdaptiveRitualEngine:
         
         return ritual
     
+    def _select_components(self, recommended_types: List[RitualType], primary_type: RitualType,
+                           user_id: str, hour: int) -> Tuple[RitualStep, ...]:
+        """
+        Seleciona os passos do ritual entre os candidatos dos tipos recomendados.
+        
+        O ritual mantém o tamanho da biblioteca do tipo principal; com
+        posteriores ainda no prior neutro, o resultado é exatamente essa
+        biblioteca. Usuários sem histórico usam os priors entre usuários da
+        faixa horária, quando carregados.
+        """
+        base_components = self.ritual_library.get(primary_type, ())
+        if not base_components:
+            return base_components
+        
+        user_state = self.learning_state.get(user_id)
+        if user_state is not None and user_state.step_params is not None:
+            step_params = user_state.step_params
+        else:
+            step_params = self.population_step_params.get(time_bucket_for_hour(hour))
+        if step_params is None:
+            return base_components
+        
+        candidates = np.concatenate([
+            self.step_indices_by_type[ritual_type]
+            for ritual_type in dict.fromkeys([primary_type, *recommended_types])
+            if ritual_type in self.step_indices_by_type
+        ])
+        chosen = self.step_bandit.select(step_params, candidates, len(base_components))
+        return tuple(self.step_catalog[i] for i in chosen)
+    
     def _adapt_for_time_constraint(self, components: List[RitualStep], 
                                  available_minutes: int) -> List[RitualStep]:
         """
@@ -407,117 +855,60 @@ class AdaptiveRitualEngine:
         total_duration = sum(comp.duration_seconds for comp in components)
         
         if total_duration <= available_seconds:
-            return components  # Não precisa adaptar
+            return list(components)  # Não precisa adaptar
         
         # Calcular fator de redução
         reduction_factor = available_seconds / total_duration
         
-        adapted_components = []
-        for comp in components:
-            # Criar nova instância com duração reduzida
-            new_duration = max(30, int(comp.duration_seconds * reduction_factor))
-            
-            adapted_comp = RitualStep(
-                id=comp.id,
-                name=comp.name,
-                description=comp.description,
-                component=comp.component,
-                duration_seconds=new_duration,
-                instructions=comp.instructions,
-                audio_cue=comp.audio_cue,
-                visual_cue=comp.visual_cue,
-                breathing_pattern=comp.breathing_pattern
-            )
-            
-            adapted_components.append(adapted_comp)
-        
-        return adapted_components
+        # Visões com duração reduzida; o passo base continua compartilhado
+        return [
+            comp.with_overrides(duration_seconds=max(30, int(comp.duration_seconds * reduction_factor)))
+            for comp in components
+        ]
     
     def _personalize_components(self, components: List[RitualStep], 
                               user_id: str) -> List[RitualStep]:
         """
         Personaliza componentes baseado no histórico do usuário
         """
-        user_prefs = self.user_preferences.get(user_id, {})
-        user_effectiveness = self.effectiveness_history.get(user_id, {})
+        user_state = self.learning_state.get(user_id)
+        if user_state is None:
+            return components
+        
+        detailed = user_state.preferences.get('detailed_instructions', False)
+        # Médias de todos os componentes em O(1) cada, via somas acumuladas
+        effectiveness_means = user_state.effectiveness.means()
+        component_index = self.learning_state.component_index
         
         personalized = []
         
         for comp in components:
-            # Verificar preferências do usuário
-            component_type = comp.component.value
-            
             # Ajustar duração baseado na efetividade histórica
-            if component_type in user_effectiveness:
-                avg_effectiveness = np.mean(user_effectiveness[component_type])
+            duration = None
+            avg_effectiveness = effectiveness_means[component_index[comp.component.value]]
+            if not np.isnan(avg_effectiveness):
                 if avg_effectiveness > 0.7:
                     # Componente efetivo: manter ou aumentar duração
-                    duration_multiplier = 1.1
+                    duration = int(comp.duration_seconds * 1.1)
                 elif avg_effectiveness < 0.4:
                     # Componente pouco efetivo: reduzir duração
-                    duration_multiplier = 0.8
-                else:
-                    duration_multiplier = 1.0
-                
-                new_duration = int(comp.duration_seconds * duration_multiplier)
-            else:
-                new_duration = comp.duration_seconds
+                    duration = int(comp.duration_seconds * 0.8)
             
             # Personalizar instruções baseado em preferências
-            instructions = comp.instructions
-            if user_prefs.get('detailed_instructions', False):
-                instructions = self._add_detailed_instructions(comp)
+            instructions = self._add_detailed_instructions(comp) if detailed else None
             
-            personalized_comp = RitualStep(
-                id=comp.id,
-                name=comp.name,
-                description=comp.description,
-                component=comp.component,
-                duration_seconds=new_duration,
-                instructions=instructions,
-                audio_cue=comp.audio_cue,
-                visual_cue=comp.visual_cue,
-                breathing_pattern=comp.breathing_pattern
-            )
-            
-            personalized.append(personalized_comp)
+            if duration is None and instructions is None:
+                personalized.append(comp)
+            else:
+                personalized.append(comp.with_overrides(duration, instructions))
         
         return personalized
     
     def _add_detailed_instructions(self, component: RitualStep) -> str:
         """
-        Adiciona instruções mais detalhadas para usuários que preferem
-        """
-        base_instructions = component.instructions
-        
-        if component.component == RitualComponent.BREATHING:
-            if component.breathing_pattern:
-                pattern = component.breathing_pattern
-                detailed = f"{base_instructions}\n\nPadrão específico:\n"
-                detailed += f"• Inspire por {pattern['inhale']} segundos\n"
-                detailed += f"• Segure por {pattern['hold']} segundos\n"
-                detailed += f"• Expire por {pattern['exhale']} segundos\n"
-                detailed += f"• Pause por {pattern['pause']} segundos\n"
-                detailed += "Repita este ciclo durante toda a prática."
-                return detailed
-        
-        elif component.component == RitualComponent.MEDITATION:
-            detailed = f"{base_instructions}\n\nDicas adicionais:\n"
-            detailed += "• Sente-se confortavelmente com a coluna ereta\n"
-            detailed += "• Feche os olhos suavemente\n"
-            detailed += "• Se a mente divagar, gentilmente retorne o foco\n"
-            detailed += "• Não julgue os pensamentos, apenas observe"
-            return detailed
-        
-        elif component.component == RitualComponent.VISUALIZATION:
-            detailed = f"{base_instructions}\n\nComo visualizar:\n"
-            detailed += "• Use todos os sentidos na visualização\n"
-            detailed += "• Torne as imagens vívidas e coloridas\n"
-            detailed += "• Inclua sons, cheiros e sensações\n"
-            detailed += "• Mantenha as imagens positivas e inspiradoras"
-            return detailed
-        
-        return base_instructions
+        Retorna as instruções detalhadas pré-calculadas do passo
+        """
+        return component.base.detailed_instructions
     
     def _generate_adaptation_reasoning(self, analysis: Dict) -> str:
         """
@@ -583,58 +974,53 @@ class AdaptiveRitualEngine:
         """
         Registra feedback do usuário sobre a efetividade do ritual
         """
-        if user_id not in self.effectiveness_history:
-            self.effectiveness_history[user_id] = {}
+        effectiveness_score = feedback.get('effectiveness_score', 0.5)  # 0-1
         
-        # Extrair componentes do ritual (seria obtido do banco de dados)
-        # Por simplicidade, assumindo que temos acesso aos componentes
+        # Passos do ritual: informados no feedback ou lembrados na criação
+        with self._issued_lock:
+            issued_steps = self.issued_rituals.pop(ritual_id, None)
+        step_indices = self.step_bandit.indices(feedback.get('step_ids') or issued_steps or [])
         
-        effectiveness_score = feedback.get('effectiveness_score', 0.5)  # 0-1
+        if not step_indices:
+            logger.warning(f"Passos do ritual {ritual_id} desconhecidos; efetividade não creditada")
         
-        # Registrar efetividade por tipo de componente
-        for component_type in ['breathing', 'meditation', 'movement', 'visualization']:
-            if component_type not in self.effectiveness_history[user_id]:
-                self.effectiveness_history[user_id][component_type] = []
-            
-            # Adicionar score (em implementação real, seria mais específico)
-            self.effectiveness_history[user_id][component_type].append(effectiveness_score)
-            
-            # Manter apenas os últimos 20 registros
-            if len(self.effectiveness_history[user_id][component_type]) > 20:
-                self.effectiveness_history[user_id][component_type].pop(0)
+        # Evento com o efeito do feedback: posteriores do bandit dos passos
+        # executados, efetividade por tipo de componente presente e preferências.
+        # O mesmo evento é aplicado em memória e persistido (incremental entre workers).
+        component_index = self.learning_state.component_index
+        event = {
+            'steps': [int(i) for i in step_indices],
+            'components': sorted({component_index[self.step_catalog[i].component.value] for i in step_indices}),
+            'score': float(effectiveness_score),
+            'preferences': {
+                key: feedback[key] for key in ('duration_feedback', 'instruction_clarity') if key in feedback
+            }
+        }
         
-        # Atualizar preferências do usuário
-        self._update_user_preferences(user_id, feedback)
+        with self.user_locks.for_key(user_id):
+            user_state = self.learning_state.get_or_create(user_id)
+            # Nova geração (em apply_feedback_event): rituais em cache com a personalização anterior deixam de ser usados
+            apply_feedback_event(user_state, event)
+            
+            if self.persistence:
+                self.persistence.record(user_id, event)
         
         logger.info(f"Feedback registrado para ritual {ritual_id} do usuário {user_id}")
     
-    def _update_user_preferences(self, user_id: str, feedback: Dict):
+    def _new_step_params(self) -> np.ndarray:
         """
-        Atualiza preferências do usuário baseado no feedback
+        Posteriores iniciais de um novo usuário: priors entre usuários, se houver
         """
-        if user_id not in self.user_preferences:
-            self.user_preferences[user_id] = {
-                'preferred_duration': 10,  # minutos
-                'detailed_instructions': False,
-                'preferred_components': [],
-                'avoided_components': []
-            }
-        
-        prefs = self.user_preferences[user_id]
-        
-        # Atualizar duração preferida
-        if 'duration_feedback' in feedback:
-            if feedback['duration_feedback'] == 'too_short':
-                prefs['preferred_duration'] = min(30, prefs['preferred_duration'] + 2)
-            elif feedback['duration_feedback'] == 'too_long':
-                prefs['preferred_duration'] = max(5, prefs['preferred_duration'] - 2)
-        
-        # Atualizar preferência por instruções detalhadas
-        if 'instruction_clarity' in feedback:
-            if feedback['instruction_clarity'] < 0.5:
-                prefs['detailed_instructions'] = True
-        
-        logger.info(f"Preferências atualizadas para usuário {user_id}")
+        if ALL_DAY in self.population_step_params:
+            return self.population_step_params[ALL_DAY].copy()
+        return self.step_bandit.new_params()
+    
+    def close(self):
+        """
+        Grava o estado de aprendizado pendente (chamar no encerramento do processo)
+        """
+        if self.persistence:
+            self.persistence.close()
 
 def main():
     """
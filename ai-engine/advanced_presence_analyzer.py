@@ -6,19 +6,51 @@ Utiliza algoritmos de machine learning para análise profunda de padrões de pre
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier, IsolationForest
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.linear_model import SGDClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
-import joblib
 from datetime import datetime, timedelta
 import json
 import logging
 
+from compiled_forest import CompiledPresenceModels
+from model_registry import ModelRegistry
+from feature_store import session_features, session_labels
+from synthetic_presence_data import FEATURE_NAMES, generate_synthetic_presence_data
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Nome do pacote de modelos no registro
+MODEL_NAME = 'advanced_presence'
+
+# Candidatos do cronograma: horas avaliadas e sessão simulada em cada hora
+SCHEDULE_HOURS = np.arange(6, 23)
+SCHEDULE_BASE_SESSION = {
+    'tasks_completed': 3,
+    'time_focused_minutes': 60,
+    'interruptions': 2,
+    'heart_rate_variability': 50,
+    'stress_level': 2,
+    'pause_frequency': 1,
+    'ritual_completion_rate': 0.7,
+    'environment_noise_level': 2,
+    'social_interactions': 3
+}
+FOCUS_STATES = (1, 3)  # Focado, Equilibrado
+
+# Modo incremental: todos os estados declarados no primeiro partial_fit e
+# amostra de reservatório (features brutas) usada pelo detector de anomalias
+PRESENCE_STATE_CLASSES = np.arange(5)
+ANOMALY_RESERVOIR_SIZE = 2048
+
+def user_model_name(user_id):
+    """Nome no registro do modelo personalizado de um usuário"""
+    return f'{MODEL_NAME}_user_{user_id}'
+
 class AdvancedPresenceAnalyzer:
     """
     Analisador avançado que combina múltiplos algoritmos de ML para:
@@ -26,14 +58,34 @@ class AdvancedPresenceAnalyzer:
     - Identificar anomalias comportamentais
     - Prever estados de energia e foco
     - Recomendar pausas e rituais
+    
+    Os modelos são treinados fora do caminho das requisições (`train_models` +
+    `save_models`) e publicados no registro; os processos que atendem
+    requisições os carregam na subida com `from_registry`. A inferência usa
+    a forma compilada dos modelos (`compiled_forest`), mesmas saídas do
+    scikit-learn com uma fração da memória e da latência.
+    
+    Modo incremental (`partial_fit`): estimadores com atualização por lote
+    (StandardScaler com média/variância acumuladas, SGDClassifier logístico,
+    MiniBatchKMeans) para personalização noturna com custo proporcional
+    apenas às sessões novas.
     """
     
-    def __init__(self):
+    def __init__(self, registry: ModelRegistry = None, model_name: str = MODEL_NAME):
         self.presence_classifier = RandomForestClassifier(n_estimators=100, random_state=42)
         self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
         self.energy_clusterer = KMeans(n_clusters=4, random_state=42)
         self.scaler = StandardScaler()
         self.is_trained = False
+        self.registry = registry or ModelRegistry()
+        self.model_name = model_name
+        self.incremental = False  # estimadores do modo partial_fit
+        self.incremental_state = None  # reservatório do detector de anomalias
+        self.model_version = None  # versão carregada/publicada no registro
+        self.training_info = {}
+        self.compiled_models = None  # CompiledPresenceModels usado na inferência
+        self._sklearn_fitted = False  # estimadores do scikit-learn treinados/carregados
+        self._focus_cache = {}  # (versão do modelo, dia da semana) -> scores por hora
         
         # Estados de presença
         self.presence_states = {
@@ -52,126 +104,50 @@ class AdvancedPresenceAnalyzer:
             3: 'Energia Pico'
         }
     
+    @classmethod
+    def from_registry(cls, registry: ModelRegistry = None, version=None, mmap_mode='r',
+                      model_name: str = MODEL_NAME):
+        """
+        Analisador com os modelos publicados no registro (uso na subida do processo)
+        """
+        analyzer = cls(registry, model_name)
+        analyzer.load_models(version, mmap_mode)
+        return analyzer
+    
     def extract_features(self, user_data):
         """
-        Extrai features relevantes dos dados do usuário
+        Extrai features relevantes dos dados do usuário (ordem de FEATURE_NAMES;
+        valores ausentes recebem FEATURE_DEFAULTS)
         """
-        features = []
-        
-        for session in user_data:
-            # Features temporais
-            hour = session.get('hour', 12)
-            day_of_week = session.get('day_of_week', 1)
-            
-            # Features de atividade
-            tasks_completed = session.get('tasks_completed', 0)
-            time_focused = session.get('time_focused_minutes', 0)
-            interruptions = session.get('interruptions', 0)
-            
-            # Features fisiológicas (simuladas)
-            heart_rate_var = session.get('heart_rate_variability', 50)
-            stress_level = session.get('stress_level', 3)
-            
-            # Features comportamentais
-            pause_frequency = session.get('pause_frequency', 0)
-            ritual_completion = session.get('ritual_completion_rate', 0.5)
-            
-            # Features contextuais
-            environment_noise = session.get('environment_noise_level', 3)
-            social_interactions = session.get('social_interactions', 2)
-            
-            feature_vector = [
-                hour, day_of_week, tasks_completed, time_focused,
-                interruptions, heart_rate_var, stress_level,
-                pause_frequency, ritual_completion, environment_noise,
-                social_interactions
-            ]
-            
-            features.append(feature_vector)
-        
-        return np.array(features)
+        return session_features(user_data)
     
-    def generate_synthetic_training_data(self, n_samples=1000):
+    def _training_arrays(self, user_data, features, labels):
         """
-        Gera dados sintéticos para treinamento inicial
+        (X, y) do treino: arrays prontos (ex.: PresenceFeatureStore), sessões ou dados sintéticos
         """
-        np.random.seed(42)
-        
-        data = []
-        labels = []
-        
-        for _ in range(n_samples):
-            # Simular diferentes padrões de presença
-            hour = np.random.randint(6, 23)
-            day_of_week = np.random.randint(1, 8)
-            
-            # Padrões baseados no horário
-            if 9 <= hour <= 11:  # Manhã produtiva
-                base_focus = 0.8
-                base_energy = 0.7
-            elif 14 <= hour <= 16:  # Tarde focada
-                base_focus = 0.6
-                base_energy = 0.6
-            elif hour >= 20:  # Noite relaxada
-                base_focus = 0.3
-                base_energy = 0.4
-            else:
-                base_focus = 0.5
-                base_energy = 0.5
-            
-            # Adicionar variabilidade
-            focus_noise = np.random.normal(0, 0.2)
-            energy_noise = np.random.normal(0, 0.15)
-            
-            tasks_completed = max(0, int((base_focus + focus_noise) * 10))
-            time_focused = max(0, int((base_focus + focus_noise) * 120))
-            interruptions = max(0, int((1 - base_focus) * 8))
-            
-            heart_rate_var = 40 + (base_energy + energy_noise) * 30
-            stress_level = max(1, min(5, int((1 - base_focus) * 5)))
-            
-            pause_frequency = max(0, int((1 - base_focus) * 6))
-            ritual_completion = min(1, max(0, base_focus + np.random.normal(0, 0.1)))
-            
-            environment_noise = np.random.randint(1, 6)
-            social_interactions = np.random.randint(0, 8)
-            
-            feature_vector = [
-                hour, day_of_week, tasks_completed, time_focused,
-                interruptions, heart_rate_var, stress_level,
-                pause_frequency, ritual_completion, environment_noise,
-                social_interactions
-            ]
-            
-            # Determinar label baseado nas features
-            if base_focus > 0.7 and stress_level <= 2:
-                label = 3  # Equilibrado
-            elif base_focus > 0.6 and stress_level <= 3:
-                label = 1  # Focado
-            elif stress_level >= 4:
-                label = 2  # Estressado
-            elif base_focus < 0.4:
-                label = 0  # Disperso
-            else:
-                label = 4  # Criativo
-            
-            data.append(feature_vector)
-            labels.append(label)
-        
-        return np.array(data), np.array(labels)
+        if features is not None:
+            return np.asarray(features), np.asarray(labels)
+        if user_data is None:
+            return self.generate_synthetic_training_data()
+        return self.extract_features(user_data), session_labels(user_data)
     
-    def train_models(self, user_data=None):
+    def generate_synthetic_training_data(self, n_samples=1000, random_state=42):
+        """
+        Gera dados sintéticos para treinamento inicial (vetorizado, com
+        Generator local; ver synthetic_presence_data)
+        """
+        return generate_synthetic_presence_data(n_samples, random_state)
+    
+    def train_models(self, user_data=None, features=None, labels=None):
         """
         Treina todos os modelos de ML
+        
+        Sem dados, usa o conjunto sintético; `features`/`labels` recebem
+        arrays já calculados (ex.: PresenceFeatureStore.load_training_arrays).
         """
         logger.info("Iniciando treinamento dos modelos...")
         
-        if user_data is None:
-            # Usar dados sintéticos para treinamento inicial
-            X, y = self.generate_synthetic_training_data()
-        else:
-            X = self.extract_features(user_data)
-            y = [session.get('presence_state', 1) for session in user_data]
+        X, y = self._training_arrays(user_data, features, labels)
         
         # Normalizar features
         X_scaled = self.scaler.fit_transform(X)
@@ -185,8 +161,15 @@ class AdvancedPresenceAnalyzer:
         
         # Avaliar modelo
         y_pred = self.presence_classifier.predict(X_test)
-        logger.info("Relatório de classificação:")
-        logger.info(classification_report(y_test, y_pred))
+        self.training_info = {
+            'training_data': 'synthetic' if user_data is None and features is None else 'user_data',
+            'n_samples': int(len(X)),
+            'test_accuracy': float(np.mean(y_pred == np.asarray(y_test)))
+        }
+        logger.info(f"Acurácia no conjunto de teste: {self.training_info['test_accuracy']:.3f}")
+        if logger.isEnabledFor(logging.DEBUG):
+            # Relatório completo só em debug: caro e ruidoso em treinos em massa
+            logger.debug("Relatório de classificação:\n" + classification_report(y_test, y_pred))
         
         # Treinar detector de anomalias
         self.anomaly_detector.fit(X_scaled)
@@ -194,44 +177,169 @@ class AdvancedPresenceAnalyzer:
         # Treinar clusterer de energia
         self.energy_clusterer.fit(X_scaled)
         
+        self.compile_models()
+        self._sklearn_fitted = True
         self.is_trained = True
+        self.incremental = False
+        self.incremental_state = None
+        self.model_version = None  # ainda não publicado
+        self._focus_cache = {}
         logger.info("Treinamento concluído com sucesso!")
     
+    def _init_incremental_models(self):
+        """
+        Troca os estimadores pelos do modo incremental (sem histórico)
+        """
+        self.presence_classifier = SGDClassifier(loss='log_loss', random_state=42)
+        self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
+        self.energy_clusterer = MiniBatchKMeans(n_clusters=4, random_state=42, n_init=3)
+        self.scaler = StandardScaler()
+        self.incremental_state = {
+            'reservoir': np.empty((ANOMALY_RESERVOIR_SIZE, len(FEATURE_NAMES))),
+            'seen': 0,
+            'rng': np.random.default_rng(42)
+        }
+        self.training_info = {'mode': 'incremental', 'n_samples': 0, 'batches': 0}
+        self.incremental = True
+        self._sklearn_fitted = False
+        self.is_trained = False
+    
+    def _update_reservoir(self, X):
+        """
+        Amostragem de reservatório (algoritmo R) vetorizada: cada sessão já
+        vista tem a mesma chance de estar entre as ANOMALY_RESERVOIR_SIZE guardadas
+        """
+        state = self.incremental_state
+        reservoir = state['reservoir']
+        positions = state['seen'] + np.arange(len(X))
+        
+        filling = positions < len(reservoir)
+        reservoir[positions[filling]] = X[filling]
+        
+        # Atribuição em ordem: em posições repetidas vence a sessão mais recente
+        slots = state['rng'].integers(0, positions[~filling] + 1)
+        replaced = slots < len(reservoir)
+        reservoir[slots[replaced]] = X[~filling][replaced]
+        
+        state['seen'] += len(X)
+        return reservoir[:min(state['seen'], len(reservoir))]
+    
+    def partial_fit(self, user_data=None, features=None, labels=None):
+        """
+        Atualiza os modelos com um novo lote de sessões, sem retreinar o histórico
+        
+        Scaler, classificador e clusters são atualizados apenas com o lote; o
+        IsolationForest (sem partial_fit) é reajustado sobre o reservatório de
+        tamanho fixo. A acurácia do modelo anterior sobre o lote, antes da
+        atualização, fica em training_info['progressive_accuracy'].
+        Aceita sessões ou arrays `features`/`labels` já calculados.
+        """
+        if not self.incremental:
+            logger.info("Iniciando modelos do modo incremental")
+            self._init_incremental_models()
+        elif not self._sklearn_fitted and self.is_trained:
+            raise ValueError("Estimadores não carregados; use load_models(sklearn_models=True)")
+        
+        X, y = self._training_arrays(user_data, features, labels)
+        if len(X) == 0:
+            return self.training_info
+        if not self._sklearn_fitted and len(X) < self.energy_clusterer.n_clusters:
+            raise ValueError(
+                f"O primeiro lote precisa de ao menos {self.energy_clusterer.n_clusters} sessões"
+            )
+        
+        self.scaler.partial_fit(X)
+        X_scaled = self.scaler.transform(X)
+        
+        progressive_accuracy = None
+        if self._sklearn_fitted:
+            progressive_accuracy = float(np.mean(self.presence_classifier.predict(X_scaled) == y))
+        
+        self.presence_classifier.partial_fit(X_scaled, y, classes=PRESENCE_STATE_CLASSES)
+        self.energy_clusterer.partial_fit(X_scaled)
+        
+        reservoir = self._update_reservoir(X)
+        self.anomaly_detector.fit(self.scaler.transform(reservoir))
+        
+        self.training_info = {
+            'mode': 'incremental',
+            'n_samples': self.training_info.get('n_samples', 0) + int(len(X)),
+            'batches': self.training_info.get('batches', 0) + 1,
+            'last_batch_samples': int(len(X)),
+            'progressive_accuracy': progressive_accuracy
+        }
+        
+        self.compile_models()
+        self._sklearn_fitted = True
+        self.is_trained = True
+        self.model_version = None  # ainda não publicado
+        self._focus_cache = {}
+        logger.info(
+            f"Atualização incremental: {len(X)} sessões "
+            f"({self.training_info['n_samples']} no total, lote {self.training_info['batches']})"
+        )
+        return self.training_info
+    
     def analyze_current_state(self, current_session):
         """
         Analisa o estado atual de presença do usuário
         """
         if not self.is_trained:
-            logger.warning("Modelos não treinados. Executando treinamento...")
-            self.train_models()
+            # Nunca treinar no caminho da requisição
+            logger.warning("Modelos não carregados. Publique um modelo treinado no registro.")
+            return {'message': 'Modelos de presença indisponíveis'}
+        
+        return self.analyze_batch([current_session])[0]
+    
+    def analyze_batch(self, sessions=None, features=None):
+        """
+        Analisa várias sessões de uma vez: cada modelo roda uma única vez sobre
+        a matriz empilhada (3 chamadas por lote, em vez de 5 por sessão)
         
-        # Extrair features da sessão atual
-        features = self.extract_features([current_session])
-        features_scaled = self.scaler.transform(features)
+        `features` aceita a matriz já calculada (ex.: PresenceFeatureStore.load)
+        no lugar das sessões.
+        """
+        if features is None:
+            # Extrair features das sessões
+            sessions = sessions or []
+            features = self.extract_features(sessions)
+        elif sessions is None:
+            sessions = [None] * len(features)
+        
+        if not self.is_trained:
+            logger.warning("Modelos não carregados. Publique um modelo treinado no registro.")
+            return [{'message': 'Modelos de presença indisponíveis'} for _ in sessions]
+        if not len(sessions):
+            return []
         
-        # Predições
-        presence_state = self.presence_classifier.predict(features_scaled)[0]
-        presence_prob = self.presence_classifier.predict_proba(features_scaled)[0]
+        models = self.compiled_models
+        features_scaled = models.transform(features)
         
-        energy_cluster = self.energy_clusterer.predict(features_scaled)[0]
+        # Predições; predict do classificador e do detector derivam das mesmas saídas
+        presence_prob = models.classifier.predict_proba(features_scaled)
+        presence_states = models.classifier.predict(proba=presence_prob)
         
-        anomaly_score = self.anomaly_detector.decision_function(features_scaled)[0]
-        is_anomaly = self.anomaly_detector.predict(features_scaled)[0] == -1
+        energy_clusters = models.predict_clusters(features_scaled)
+        
+        anomaly_scores = models.anomaly_detector.decision_function(features_scaled)
+        anomalies = models.anomaly_detector.predict(decision=anomaly_scores) == -1
         
         # Análise detalhada
-        analysis = {
-            'presence_state': self.presence_states[presence_state],
-            'presence_confidence': float(max(presence_prob)),
-            'energy_level': self.energy_clusters[energy_cluster],
-            'anomaly_score': float(anomaly_score),
-            'is_anomalous_behavior': bool(is_anomaly),
-            'recommendations': self._generate_recommendations(
-                presence_state, energy_cluster, is_anomaly, current_session
-            ),
-            'insights': self._generate_insights(features_scaled[0], current_session)
-        }
+        analyses = []
+        for i, session in enumerate(sessions):
+            analyses.append({
+                'presence_state': self.presence_states[presence_states[i]],
+                'presence_confidence': float(presence_prob[i].max()),
+                'energy_level': self.energy_clusters[energy_clusters[i]],
+                'anomaly_score': float(anomaly_scores[i]),
+                'is_anomalous_behavior': bool(anomalies[i]),
+                'recommendations': self._generate_recommendations(
+                    presence_states[i], energy_clusters[i], anomalies[i], session
+                ),
+                'insights': self._generate_insights(features_scaled[i], session)
+            })
         
-        return analysis
+        return analyses
     
     def _generate_recommendations(self, presence_state, energy_cluster, is_anomaly, session):
         """
@@ -318,94 +426,167 @@ class AdvancedPresenceAnalyzer:
         
         return insights
     
+    def _focus_scores(self, days_of_week):
+        """
+        Score de foco (P(Focado) + P(Equilibrado)) de cada hora de SCHEDULE_HOURS
+        para cada dia da semana, com uma única chamada a predict_proba para os
+        dias ainda fora do cache da versão atual do modelo
+        """
+        missing = sorted({day for day in days_of_week if (self.model_version, day) not in self._focus_cache})
+        if missing:
+            sessions = [
+                {**SCHEDULE_BASE_SESSION, 'hour': int(hour), 'day_of_week': day}
+                for day in missing for hour in SCHEDULE_HOURS
+            ]
+            classifier = self.compiled_models.classifier
+            features_scaled = self.compiled_models.transform(self.extract_features(sessions))
+            presence_prob = classifier.predict_proba(features_scaled)
+            
+            # Colunas pelas classes do modelo (nem todo treino tem todos os estados)
+            focus_columns = np.isin(classifier.classes_, FOCUS_STATES)
+            focus = presence_prob[:, focus_columns].sum(axis=1).reshape(len(missing), len(SCHEDULE_HOURS))
+            for day, scores in zip(missing, focus):
+                self._focus_cache[(self.model_version, day)] = scores
+        
+        return {day: self._focus_cache[(self.model_version, day)] for day in days_of_week}
+    
     def predict_optimal_schedule(self, user_preferences, upcoming_tasks):
         """
         Prediz o cronograma ótimo baseado nos padrões do usuário
+        
+        Tarefas podem ser nomes ou dicts com 'day_of_week' (1-7; padrão: hoje).
+        Todos os candidatos (dia, hora) são avaliados em lote e reutilizados
+        entre chamadas enquanto a versão do modelo não mudar.
         """
         if not self.is_trained:
-            self.train_models()
+            logger.warning("Modelos não carregados. Publique um modelo treinado no registro.")
+            return []
+        
+        today = datetime.now().weekday() + 1
+        task_days = [
+            task.get('day_of_week', today) if isinstance(task, dict) else today
+            for task in upcoming_tasks
+        ]
+        focus_by_day = self._focus_scores(set(task_days))
         
         optimal_schedule = []
         
-        for task in upcoming_tasks:
-            best_time = None
-            best_score = -1
-            
-            # Testar diferentes horários
-            for hour in range(6, 23):
-                # Simular sessão neste horário
-                test_session = {
-                    'hour': hour,
-                    'day_of_week': datetime.now().weekday() + 1,
-                    'tasks_completed': 3,
-                    'time_focused_minutes': 60,
-                    'interruptions': 2,
-                    'heart_rate_variability': 50,
-                    'stress_level': 2,
-                    'pause_frequency': 1,
-                    'ritual_completion_rate': 0.7,
-                    'environment_noise_level': 2,
-                    'social_interactions': 3
-                }
-                
-                features = self.extract_features([test_session])
-                features_scaled = self.scaler.transform(features)
-                
-                # Calcular score de adequação
-                presence_prob = self.presence_classifier.predict_proba(features_scaled)[0]
-                focus_score = presence_prob[1] + presence_prob[3]  # Focado + Equilibrado
-                
-                if focus_score > best_score:
-                    best_score = focus_score
-                    best_time = hour
+        for task, day in zip(upcoming_tasks, task_days):
+            # Primeiro horário com o maior score
+            scores = focus_by_day[day]
+            best = int(np.argmax(scores))
+            best_score = float(scores[best])
             
             optimal_schedule.append({
                 'task': task,
-                'optimal_time': best_time,
+                'optimal_time': int(SCHEDULE_HOURS[best]),
                 'confidence_score': best_score,
                 'reasoning': f"Melhor horário baseado em padrões de foco (score: {best_score:.2f})"
             })
         
         return optimal_schedule
     
-    def save_models(self, filepath_prefix="kairos_ai_models"):
+    def compile_models(self):
         """
-        Salva os modelos treinados
+        Exporta os modelos treinados para a forma compilada usada na inferência
         """
-        if not self.is_trained:
+        self.compiled_models = CompiledPresenceModels.from_sklearn(
+            self.scaler, self.presence_classifier, self.anomaly_detector, self.energy_clusterer
+        )
+        return self.compiled_models
+    
+    def save_models(self, metadata=None):
+        """
+        Publica os modelos treinados (estimadores do scikit-learn + forma
+        compilada) como uma nova versão no registro
+        """
+        if not self._sklearn_fitted:
             logger.warning("Modelos não treinados. Nada para salvar.")
-            return
-        
-        joblib.dump(self.presence_classifier, f"{filepath_prefix}_presence_classifier.pkl")
-        joblib.dump(self.anomaly_detector, f"{filepath_prefix}_anomaly_detector.pkl")
-        joblib.dump(self.energy_clusterer, f"{filepath_prefix}_energy_clusterer.pkl")
-        joblib.dump(self.scaler, f"{filepath_prefix}_scaler.pkl")
+            return None
+        
+        components = {
+            'presence_classifier': self.presence_classifier,
+            'anomaly_detector': self.anomaly_detector,
+            'energy_clusterer': self.energy_clusterer,
+            'scaler': self.scaler,
+            'compiled_models': self.compiled_models
+        }
+        if self.incremental:
+            components['incremental_state'] = self.incremental_state
         
-        logger.info(f"Modelos salvos com prefixo: {filepath_prefix}")
+        self.model_version = self.registry.publish(
+            self.model_name, components, {'training': self.training_info, **(metadata or {})}
+        )
+        return self.model_version
     
-    def load_models(self, filepath_prefix="kairos_ai_models"):
+    def load_models(self, version=None, mmap_mode='r', sklearn_models=False):
         """
-        Carrega modelos previamente treinados
+        Carrega uma versão publicada (padrão: a mais recente) com memory-map
+        
+        Por padrão só a forma compilada é carregada (basta para a inferência);
+        `sklearn_models=True` carrega também os estimadores do scikit-learn.
+        Versões publicadas sem a forma compilada são compiladas na carga.
         """
-        try:
-            self.presence_classifier = joblib.load(f"{filepath_prefix}_presence_classifier.pkl")
-            self.anomaly_detector = joblib.load(f"{filepath_prefix}_anomaly_detector.pkl")
-            self.energy_clusterer = joblib.load(f"{filepath_prefix}_energy_clusterer.pkl")
-            self.scaler = joblib.load(f"{filepath_prefix}_scaler.pkl")
-            
-            self.is_trained = True
-            logger.info("Modelos carregados com sucesso!")
-        except FileNotFoundError:
-            logger.warning("Arquivos de modelo não encontrados. Execute o treinamento primeiro.")
+        wanted = None if sklearn_models else ('compiled_models',)
+        bundle = self.registry.load(self.model_name, version, mmap_mode=mmap_mode, components=wanted)
+        if bundle is None:
+            logger.warning("Nenhum modelo publicado no registro. Execute o treinamento primeiro.")
+            return False
+        if 'compiled_models' not in bundle.components and 'scaler' not in bundle.components:
+            bundle = self.registry.load(self.model_name, bundle.version, mmap_mode=mmap_mode)
+        
+        self._sklearn_fitted = 'scaler' in bundle.components
+        if self._sklearn_fitted:
+            self.presence_classifier = bundle['presence_classifier']
+            self.anomaly_detector = bundle['anomaly_detector']
+            self.energy_clusterer = bundle['energy_clusterer']
+            self.scaler = bundle['scaler']
+        self.compiled_models = bundle.components.get('compiled_models') or self.compile_models()
+        self.training_info = bundle.metadata.get('training', {})
+        self.incremental = self.training_info.get('mode') == 'incremental'
+        self.incremental_state = bundle.components.get('incremental_state')
+        self.model_version = bundle.version
+        self._focus_cache = {}
+        
+        self.is_trained = True
+        logger.info(f"Modelos carregados com sucesso (versão {bundle.version})!")
+        return True
+
+def train_and_publish(registry: ModelRegistry = None, user_data=None):
+    """
+    Treina os modelos e publica uma nova versão (job offline / deploy)
+    """
+    analyzer = AdvancedPresenceAnalyzer(registry)
+    analyzer.train_models(user_data)
+    return analyzer.save_models()
+
+def update_and_publish(user_id, new_sessions, registry: ModelRegistry = None):
+    """
+    Personalização noturna: aplica as sessões novas do usuário ao seu modelo
+    incremental (criado no primeiro lote) e publica uma nova versão
+    
+    `new_sessions` pode ser uma lista de sessões ou um par (X, y) já calculado
+    (ex.: feature_store.load_new_features).
+    """
+    analyzer = AdvancedPresenceAnalyzer(registry, user_model_name(user_id))
+    if analyzer.registry.latest_version(analyzer.model_name) is not None:
+        # Atualização em memória: o reservatório é alterado in-place
+        analyzer.load_models(sklearn_models=True, mmap_mode=None)
+    if isinstance(new_sessions, tuple):
+        analyzer.partial_fit(features=new_sessions[0], labels=new_sessions[1])
+    else:
+        analyzer.partial_fit(new_sessions)
+    return analyzer.save_models({'user_id': user_id})
 
 def main():
     """
     Função principal para demonstração
     """
-    analyzer = AdvancedPresenceAnalyzer()
-    
-    # Treinar modelos
-    analyzer.train_models()
+    # Carregar a versão publicada; treinar e publicar apenas se o registro estiver vazio
+    analyzer = AdvancedPresenceAnalyzer.from_registry()
+    if not analyzer.is_trained:
+        analyzer.train_models()
+        analyzer.save_models()
     
     # Simular análise de sessão atual
     current_session = {
@@ -0,0 +1,300 @@
+"""
+Florestas Compiladas - Kairos AI Engine
+Exporta RandomForestClassifier e IsolationForest treinados para arrays NumPy
+contíguos (feature, limiar float32, filhos, valores das folhas) e avalia todas
+as árvores de uma vez com percurso vetorizado, sem o overhead do scikit-learn.
+Classificadores lineares do modo incremental (SGDClassifier) são exportados
+como coeficientes + intercepto.
+"""
+
+import logging
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from scipy.special import expit
+
+logger = logging.getLogger(__name__)
+
+def _float32_floor(thresholds: np.ndarray) -> np.ndarray:
+    """
+    Maior float32 <= limiar. O scikit-learn compara X convertido para float32
+    com o limiar em float64; para qualquer x float32, x <= t equivale a
+    x <= floor32(t), então a troca de precisão não altera nenhuma decisão.
+    """
+    thresholds32 = thresholds.astype(np.float32)
+    above = thresholds32.astype(np.float64) > thresholds
+    thresholds32[above] = np.nextafter(thresholds32[above], np.float32(-np.inf))
+    return thresholds32
+
+def _node_depths(children_left: np.ndarray, children_right: np.ndarray) -> np.ndarray:
+    """Profundidade de cada nó (raiz = 1, como no scikit-learn); filhos têm índice maior que o pai"""
+    depths = np.ones(len(children_left), dtype=np.int64)
+    for node in range(len(children_left)):
+        if children_left[node] != -1:
+            depths[children_left[node]] = depths[node] + 1
+            depths[children_right[node]] = depths[node] + 1
+    return depths
+
+def _average_path_length(n_samples: np.ndarray) -> np.ndarray:
+    """Comprimento médio de caminho em uma iTree com n amostras (Liu et al.)"""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    lengths = np.zeros(n_samples.shape)
+    lengths[n_samples == 2] = 1.0
+    larger = n_samples > 2
+    lengths[larger] = (
+        2.0 * (np.log(n_samples[larger] - 1.0) + np.euler_gamma)
+        - 2.0 * (n_samples[larger] - 1.0) / n_samples[larger]
+    )
+    return lengths
+
+class CompiledForest:
+    """
+    Nós de todas as árvores concatenados em arrays planos.
+
+    - `feature` (int32) e `threshold` (float32): teste x[feature] <= threshold
+    - `children` (int32, 2 por nó): [esquerda, direita]; folhas apontam para
+      si mesmas com limiar +inf, então o percurso roda `max_depth` passos fixos
+      para todas as linhas e árvores ao mesmo tempo
+    - `roots`: primeiro nó de cada árvore
+    - `leaf_values`: saída de cada nó (apenas as folhas são lidas)
+    """
+    __slots__ = ('feature', 'threshold', 'children', 'roots', 'leaf_values', 'max_depth')
+
+    def __init__(self, feature, threshold, children, roots, leaf_values, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.roots = roots
+        self.leaf_values = leaf_values
+        self.max_depth = max_depth
+
+    def __setstate__(self, state):
+        # Arrays vindos de joblib.load(mmap_mode=...) chegam como np.memmap; a
+        # view ndarray comum mantém o mapeamento e evita o custo da subclasse
+        # em cada operação do percurso
+        _, slots = state
+        for name, value in slots.items():
+            setattr(self, name, np.asarray(value) if isinstance(value, np.ndarray) else value)
+
+    @classmethod
+    def _flatten(cls, trees: Sequence, leaf_values: Sequence[np.ndarray],
+                 feature_maps: Optional[Sequence[np.ndarray]] = None) -> Dict[str, np.ndarray]:
+        features, thresholds, children, roots = [], [], [], []
+        offset = 0
+        max_depth = 0
+        for index, tree in enumerate(trees):
+            left = tree.children_left
+            right = tree.children_right
+            leaf = left == -1
+            own = np.arange(tree.node_count) + offset
+
+            feature = np.where(leaf, 0, tree.feature)
+            if feature_maps is not None:
+                # Árvore treinada sobre um subconjunto de features
+                feature = np.where(leaf, 0, np.asarray(feature_maps[index])[np.maximum(tree.feature, 0)])
+            threshold = _float32_floor(tree.threshold)
+            threshold[leaf] = np.inf
+
+            pairs = np.empty((tree.node_count, 2), dtype=np.int64)
+            pairs[:, 0] = np.where(leaf, own, left + offset)
+            pairs[:, 1] = np.where(leaf, own, right + offset)
+
+            features.append(feature.astype(np.int32))
+            thresholds.append(threshold)
+            children.append(pairs.astype(np.int32).ravel())
+            roots.append(offset)
+            max_depth = max(max_depth, int(tree.max_depth))
+            offset += tree.node_count
+
+        return {
+            'feature': np.concatenate(features),
+            'threshold': np.concatenate(thresholds),
+            'children': np.concatenate(children),
+            'roots': np.asarray(roots, dtype=np.int32),
+            'leaf_values': np.concatenate(leaf_values),
+            'max_depth': max_depth
+        }
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ('feature', 'threshold', 'children', 'roots', 'leaf_values'))
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Folha alcançada por cada linha em cada árvore: array (n_árvores, n_linhas)"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_offsets = np.arange(n_rows, dtype=np.intp) * n_features if n_rows > 1 else None
+
+        # take() em vez de indexação avançada: menos overhead por passo, que
+        # domina a latência de uma sessão isolada
+        nodes = np.repeat(self.roots[:, None], n_rows, axis=1).astype(np.intp)
+        for _ in range(self.max_depth):
+            positions = self.feature.take(nodes)
+            if row_offsets is not None:
+                positions = positions + row_offsets
+            go_right = flat.take(positions) > self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + go_right)
+        return nodes
+
+class CompiledForestClassifier(CompiledForest):
+    """RandomForestClassifier compilado; `leaf_values` tem as probabilidades por classe"""
+    __slots__ = ('classes_',)
+
+    def __init__(self, classes, **arrays):
+        super().__init__(**arrays)
+        self.classes_ = classes
+
+    @classmethod
+    def from_sklearn(cls, forest) -> 'CompiledForestClassifier':
+        n_classes = len(forest.classes_)
+        leaf_values = []
+        for estimator in forest.estimators_:
+            # Mesma normalização de DecisionTreeClassifier.predict_proba
+            proba = estimator.tree_.value[:, 0, :n_classes].astype(np.float64)
+            normalizer = proba.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            leaf_values.append(proba / normalizer)
+        arrays = cls._flatten([estimator.tree_ for estimator in forest.estimators_], leaf_values)
+        return cls(np.asarray(forest.classes_), **arrays)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        leaves = self.apply(X)
+        # Soma ao longo do eixo 0 é sequencial, na mesma ordem do acúmulo árvore a árvore do sklearn
+        return self.leaf_values[leaves].sum(axis=0) / self.n_trees
+
+    def predict(self, X: np.ndarray = None, proba: np.ndarray = None) -> np.ndarray:
+        """Classe mais provável; reaproveita `proba` quando já calculado"""
+        if proba is None:
+            proba = self.predict_proba(X)
+        return self.classes_[np.argmax(proba, axis=1)]
+
+class CompiledIsolationForest(CompiledForest):
+    """IsolationForest compilado; `leaf_values` tem a profundidade efetiva de cada folha"""
+    __slots__ = ('offset_', 'denominator')
+
+    def __init__(self, offset, denominator, **arrays):
+        super().__init__(**arrays)
+        self.offset_ = offset
+        self.denominator = denominator
+
+    @classmethod
+    def from_sklearn(cls, forest) -> 'CompiledIsolationForest':
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        leaf_values = [
+            # Comprimento do caminho até a folha + caminho médio esperado abaixo dela
+            _node_depths(tree.children_left, tree.children_right)
+            + _average_path_length(tree.n_node_samples) - 1.0
+            for tree in trees
+        ]
+        feature_maps = None
+        if forest._max_features != forest.n_features_in_:
+            feature_maps = forest.estimators_features_
+        arrays = cls._flatten(trees, leaf_values, feature_maps)
+        denominator = len(trees) * float(_average_path_length(np.array([forest._max_samples]))[0])
+        return cls(float(forest.offset_), denominator, **arrays)
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        depths = self.leaf_values[self.apply(X)].sum(axis=0)
+        if self.denominator == 0:
+            return -np.ones(len(depths))
+        return -(2 ** (-depths / self.denominator))
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X: np.ndarray = None, decision: np.ndarray = None) -> np.ndarray:
+        """+1 normal, -1 anomalia; reaproveita `decision` quando já calculado"""
+        if decision is None:
+            decision = self.decision_function(X)
+        return np.where(decision < 0, -1, 1)
+
+class CompiledLinearClassifier:
+    """SGDClassifier (loss='log_loss') compilado: coeficientes, interceptos e classes"""
+    __slots__ = ('coef', 'intercept', 'classes_')
+
+    def __init__(self, coef, intercept, classes):
+        self.coef = coef
+        self.intercept = intercept
+        self.classes_ = classes
+
+    def __setstate__(self, state):
+        _, slots = state
+        for name, value in slots.items():
+            setattr(self, name, np.asarray(value))
+
+    @classmethod
+    def from_sklearn(cls, classifier) -> 'CompiledLinearClassifier':
+        return cls(
+            np.asarray(classifier.coef_, dtype=np.float64),
+            np.asarray(classifier.intercept_, dtype=np.float64),
+            np.asarray(classifier.classes_)
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.coef.nbytes + self.intercept.nbytes + self.classes_.nbytes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Regressão logística um-contra-todos normalizada, como o scikit-learn"""
+        prob = expit(np.asarray(X, dtype=np.float64) @ self.coef.T + self.intercept)
+        if len(self.classes_) == 2:
+            return np.column_stack([1 - prob[:, 0], prob[:, 0]])
+        prob_sum = prob.sum(axis=1)
+        all_zero = prob_sum == 0
+        prob[all_zero, :] = 1
+        prob_sum[all_zero] = len(self.classes_)
+        return prob / prob_sum[:, None]
+
+    def predict(self, X: np.ndarray = None, proba: np.ndarray = None) -> np.ndarray:
+        """Classe mais provável; reaproveita `proba` quando já calculado"""
+        if proba is None:
+            proba = self.predict_proba(X)
+        return self.classes_[np.argmax(proba, axis=1)]
+
+class CompiledPresenceModels:
+    """
+    Modelos do AdvancedPresenceAnalyzer em forma compacta: normalização do
+    StandardScaler, classificador (floresta ou linear) e detector compilados e
+    centróides do KMeans/MiniBatchKMeans.
+    Todos os atributos são arrays NumPy, carregáveis com memory-map.
+    """
+    __slots__ = ('mean', 'scale', 'classifier', 'anomaly_detector', 'cluster_centers')
+
+    def __init__(self, mean, scale, classifier, anomaly_detector, cluster_centers):
+        self.mean = mean
+        self.scale = scale
+        self.classifier = classifier
+        self.anomaly_detector = anomaly_detector
+        self.cluster_centers = cluster_centers
+
+    @classmethod
+    def from_sklearn(cls, scaler, classifier, anomaly_detector, energy_clusterer) -> 'CompiledPresenceModels':
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(scaler.n_features_in_)
+        scale = scaler.scale_ if scaler.with_std else np.ones(scaler.n_features_in_)
+        compiled = cls(
+            np.asarray(mean, dtype=np.float64),
+            np.asarray(scale, dtype=np.float64),
+            (CompiledForestClassifier if hasattr(classifier, 'estimators_')
+             else CompiledLinearClassifier).from_sklearn(classifier),
+            CompiledIsolationForest.from_sklearn(anomaly_detector),
+            np.asarray(energy_clusterer.cluster_centers_, dtype=np.float64)
+        )
+        logger.info(f"Modelos compilados: {compiled.nbytes / 1024:.0f} KiB")
+        return compiled
+
+    @property
+    def nbytes(self) -> int:
+        return (self.mean.nbytes + self.scale.nbytes + self.cluster_centers.nbytes
+                + self.classifier.nbytes + self.anomaly_detector.nbytes)
+
+    def transform(self, features: np.ndarray) -> np.ndarray:
+        return (np.asarray(features, dtype=np.float64) - self.mean) / self.scale
+
+    def predict_clusters(self, features_scaled: np.ndarray) -> np.ndarray:
+        distances = ((features_scaled[:, None, :] - self.cluster_centers[None, :, :]) ** 2).sum(axis=2)
+        return np.argmin(distances, axis=1)
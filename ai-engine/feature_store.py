@@ -0,0 +1,273 @@
+"""
+Feature Store de Presença - Kairos AI Engine
+Vetores de features (float32) das sessões de presença, calculados uma vez na
+ingestão e gravados em arquivos de append por usuário, lidos com memory-map
+como arrays contíguos para treino e pontuação em lote
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from synthetic_presence_data import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.environ.get(
+    'KAIROS_FEATURE_STORE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feature_store')
+)
+
+# Valores usados quando a sessão não traz a feature (mesmos do extract_features original)
+FEATURE_DEFAULTS = {
+    'hour': 12,
+    'day_of_week': 1,
+    'tasks_completed': 0,
+    'time_focused_minutes': 0,
+    'interruptions': 0,
+    'heart_rate_variability': 50,
+    'stress_level': 3,
+    'pause_frequency': 0,
+    'ritual_completion_rate': 0.5,
+    'environment_noise_level': 3,
+    'social_interactions': 2
+}
+DEFAULT_PRESENCE_STATE = 1
+
+N_FEATURES = len(FEATURE_NAMES)
+
+# Uma coluna por arquivo, linhas de tamanho fixo: anexar é O(lote) e ler é um mmap
+USER_ID_FILE = 'user_id'
+
+COLUMNS = {
+    'features': (np.float32, (N_FEATURES,)),
+    'labels': (np.int8, ()),
+    'timestamps': (np.int64, ())
+}
+
+def session_features(sessions: Iterable[Dict[str, Any]], dtype=np.float64) -> np.ndarray:
+    """Matriz (n_sessões, N_FEATURES) na ordem de FEATURE_NAMES"""
+    defaults = [(name, FEATURE_DEFAULTS[name]) for name in FEATURE_NAMES]
+    rows = [[session.get(name, default) for name, default in defaults] for session in sessions]
+    return np.array(rows, dtype=dtype).reshape(len(rows), N_FEATURES)
+
+def session_labels(sessions: Iterable[Dict[str, Any]]) -> np.ndarray:
+    return np.array([session.get('presence_state', DEFAULT_PRESENCE_STATE) for session in sessions], dtype=np.int8)
+
+def _epoch(value) -> int:
+    """Segundos desde a época; datas sem fuso são UTC, como no backend"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+class PresenceFeatureStore:
+    """
+    Feature store em disco: `<root>/<user_id>/{features,labels,timestamps}.bin`.
+
+    - `append` é chamado na ingestão: calcula as features das sessões uma vez
+      e anexa as linhas aos três arquivos, sob flock por usuário. Sessões
+      rotuladas entram pelo PersonalizedModelCache (`feature_store=`); o
+      histórico anterior entra em lote por `ingest` (ver `main`)
+    - `load` devolve (features float32 (n, 11), rótulos, timestamps) como
+      memmaps somente leitura, opcionalmente a partir de uma linha (`start`,
+      ex.: sessões já treinadas) ou de um intervalo de tempo
+    - Uma escrita interrompida deixa no máximo uma linha incompleta no fim de
+      algum arquivo; a leitura considera apenas as linhas completas nos três
+    - O nome do diretório é o user_id sanitizado; o ID original fica em
+      `<diretório>/user_id`, devolvido por `session_counts`. IDs distintos que
+      sanitizam para o mesmo diretório são recusados em `append`
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_PATH):
+        self.root = root
+
+    def _user_dir(self, user_id) -> str:
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', str(user_id))
+        return os.path.join(self.root, safe_id)
+
+    def _path(self, user_id, column: str) -> str:
+        return os.path.join(self._user_dir(user_id), f'{column}.bin')
+
+    @staticmethod
+    def _row_bytes(column: str) -> int:
+        dtype, shape = COLUMNS[column]
+        return np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+
+    def _stored_id(self, directory: str) -> Optional[str]:
+        """ID original gravado no diretório (None em diretórios sem o arquivo)"""
+        try:
+            with open(os.path.join(directory, USER_ID_FILE), encoding='utf-8') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def _owned_by(self, user_id) -> bool:
+        stored = self._stored_id(self._user_dir(user_id))
+        return stored is None or stored == str(user_id)
+
+    @contextmanager
+    def _locked(self, user_id):
+        os.makedirs(self._user_dir(user_id), exist_ok=True)
+        with open(os.path.join(self._user_dir(user_id), '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _claim(self, user_id):
+        """Grava o ID original no diretório (sob o lock) ou recusa um ID que colide"""
+        directory = self._user_dir(user_id)
+        stored = self._stored_id(directory)
+        if stored is None:
+            with open(os.path.join(directory, USER_ID_FILE), 'w', encoding='utf-8') as file:
+                file.write(str(user_id))
+        elif stored != str(user_id):
+            raise ValueError(f"user_id {user_id!r} colide com {stored!r} no diretório {directory}")
+
+    def count(self, user_id) -> int:
+        """Sessões completas gravadas para o usuário"""
+        if not self._owned_by(user_id):
+            return 0  # diretório de outro usuário com o mesmo nome sanitizado
+        counts = []
+        for column in COLUMNS:
+            path = self._path(user_id, column)
+            counts.append(os.path.getsize(path) // self._row_bytes(column) if os.path.exists(path) else 0)
+        return min(counts)
+
+    def append(self, user_id, sessions, timestamps: Optional[Iterable] = None) -> int:
+        """
+        Anexa as sessões (dicts com as features e, opcionalmente,
+        'presence_state' e 'timestamp'); devolve o total de sessões do usuário
+        """
+        sessions = list(sessions)
+        if not sessions:
+            return self.count(user_id)
+        if timestamps is None:
+            timestamps = [session.get('timestamp', 0) for session in sessions]
+
+        arrays = {
+            'features': session_features(sessions, np.float32),
+            'labels': session_labels(sessions),
+            'timestamps': np.array([_epoch(value) for value in timestamps], dtype=np.int64)
+        }
+        with self._locked(user_id):
+            self._claim(user_id)
+            rows = self.count(user_id)
+            for column, array in arrays.items():
+                path = self._path(user_id, column)
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+                    # Sobrescreve restos de uma escrita interrompida
+                    file.seek(rows * self._row_bytes(column))
+                    file.write(np.ascontiguousarray(array).tobytes())
+                    file.truncate()
+                    file.flush()
+                    os.fsync(file.fileno())
+            return rows + len(sessions)
+
+    def ingest(self, rows: Iterable[Tuple[Any, Dict[str, Any]]], batch_size: int = 10_000) -> int:
+        """
+        Anexa um fluxo de (user_id, sessão) em lotes (uma chamada de `append`
+        por usuário a cada `batch_size` linhas), ex.: backfill do histórico;
+        devolve o número de sessões gravadas
+        """
+        ingested = 0
+        batch: Dict[str, Tuple[Any, list]] = {}
+        pending = 0
+        for user_id, session in rows:
+            batch.setdefault(str(user_id), (user_id, []))[1].append(session)
+            pending += 1
+            if pending >= batch_size:
+                ingested += self._append_batch(batch)
+                batch, pending = {}, 0
+        return ingested + self._append_batch(batch)
+
+    def _append_batch(self, batch: Dict[str, Tuple[Any, list]]) -> int:
+        for user_id, sessions in batch.values():
+            self.append(user_id, sessions)
+        return sum(len(sessions) for _, sessions in batch.values())
+
+    def load(self, user_id, start: int = 0, since=None, until=None
+             ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (features, rótulos, timestamps) das sessões do usuário a partir da linha
+        `start`; `since`/`until` filtram por timestamp (cópia em vez de memmap)
+        """
+        rows = self.count(user_id)
+        loaded = []
+        for column, (dtype, shape) in COLUMNS.items():
+            if rows == 0:
+                loaded.append(np.empty((0,) + shape, dtype=dtype))
+                continue
+            array = np.memmap(self._path(user_id, column), dtype=dtype, mode='r', shape=(rows,) + shape)
+            loaded.append(np.asarray(array)[start:])
+        features, labels, timestamps = loaded
+
+        if since is not None or until is not None:
+            mask = np.ones(len(timestamps), dtype=bool)
+            if since is not None:
+                mask &= timestamps >= _epoch(since)
+            if until is not None:
+                mask &= timestamps < _epoch(until)
+            features, labels, timestamps = features[mask], labels[mask], timestamps[mask]
+        return features, labels, timestamps
+
+    def load_training_arrays(self, user_id, start: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """(X, y) a partir da linha `start`, no formato de AdvancedPresenceAnalyzer.partial_fit"""
+        features, labels, _ = self.load(user_id, start)
+        return features, labels
+
+    def session_counts(self) -> Dict[str, int]:
+        """{user_id original: sessões gravadas}, entrada do TrainingOrchestrator"""
+        if not os.path.isdir(self.root):
+            return {}
+        counts = {}
+        for entry in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, entry)
+            if os.path.isdir(directory):
+                # Diretórios anteriores ao arquivo user_id usam o próprio nome
+                user_id = self._stored_id(directory) or entry
+                counts[user_id] = self.count(user_id)
+        return counts
+
+def load_new_features(user_id, trained_sessions: int, root: str = DEFAULT_STORE_PATH
+                      ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Carregador do TrainingOrchestrator: (X, y) das sessões ainda não treinadas.
+    Use functools.partial(load_new_features, root=...) para outro diretório.
+    """
+    return PresenceFeatureStore(root).load_training_arrays(user_id, trained_sessions)
+
+def _jsonl_sessions(path: str) -> Iterable[Tuple[Any, Dict[str, Any]]]:
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                session = json.loads(line)
+                yield session.pop('user_id'), session
+
+def main():
+    """
+    Backfill: python feature_store.py sessoes.jsonl [raiz], com uma sessão
+    rotulada por linha ({"user_id": ..., <features>, "presence_state": ..., "timestamp": ...})
+    """
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        return
+    store = PresenceFeatureStore(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STORE_PATH)
+    ingested = store.ingest(_jsonl_sessions(sys.argv[1]))
+    print(f"{ingested} sessões gravadas em {store.root}")
+
+if __name__ == "__main__":
+    main()
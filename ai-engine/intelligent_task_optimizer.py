@@ -8,6 +8,7 @@ import random
 from datetime import datetime, timedelta
 import json
 import logging
+import threading
 from typing import List, Dict, Tuple
 from dataclasses import dataclass
 from enum import Enum
@@ -73,6 +74,9 @@ class IntelligentTaskOptimizer:
             'dependency_order': 0.10,
             'workload_balance': 0.05
         }
+        # Cópia na escrita: feedbacks trocam o dicionário inteiro, e cada
+        # otimização usa uma referência estável aos pesos do seu início
+        self._weights_lock = threading.Lock()
         
         # Histórico de performance para aprendizado
         self.performance_history = []
@@ -110,13 +114,16 @@ class IntelligentTaskOptimizer:
         return chromosome
     
     def calculate_fitness(self, chromosome: List[int], tasks: List[Task], 
-                         available_slots: List[Tuple[datetime, int]]) -> float:
+                         available_slots: List[Tuple[datetime, int]],
+                         weights: Dict[str, float] = None) -> float:
         """
         Calcula a fitness de um cromossomo baseado em múltiplos critérios
         """
         if len(chromosome) != len(tasks):
             return 0.0
         
+        weights = weights if weights is not None else self.weights
+        
         total_score = 0.0
         scheduled_tasks = 0
         
@@ -179,12 +186,12 @@ class IntelligentTaskOptimizer:
             
             # Combinar scores com pesos
             task_score = (
-                self.weights['deadline_urgency'] * urgency_score +
-                self.weights['priority_importance'] * priority_score +
-                self.weights['energy_alignment'] * energy_alignment +
-                self.weights['context_switching'] * context_score +
-                self.weights['time_preference'] * time_preference +
-                self.weights['dependency_order'] * dependency_score
+                weights['deadline_urgency'] * urgency_score +
+                weights['priority_importance'] * priority_score +
+                weights['energy_alignment'] * energy_alignment +
+                weights['context_switching'] * context_score +
+                weights['time_preference'] * time_preference +
+                weights['dependency_order'] * dependency_score
             )
             
             total_score += task_score
@@ -192,7 +199,7 @@ class IntelligentTaskOptimizer:
         # 7. Balanceamento de carga de trabalho
         if scheduled_tasks > 0:
             workload_balance = self._calculate_workload_balance(chromosome, tasks, available_slots)
-            total_score += self.weights['workload_balance'] * workload_balance * scheduled_tasks
+            total_score += weights['workload_balance'] * workload_balance * scheduled_tasks
         
         # Penalizar soluções que não agendam todas as tarefas
         completion_bonus = scheduled_tasks / len(tasks)
@@ -294,6 +301,9 @@ class IntelligentTaskOptimizer:
         """
         logger.info(f"Iniciando otimização para {len(tasks)} tarefas em {len(available_slots)} slots")
         
+        # Pesos fixos durante toda a otimização, mesmo com feedbacks concorrentes
+        weights = self.weights
+        
         # Inicializar população
         population = []
         for _ in range(self.population_size):
@@ -308,7 +318,7 @@ class IntelligentTaskOptimizer:
             # Calcular fitness para toda a população
             fitness_scores = []
             for chromosome in population:
-                fitness = self.calculate_fitness(chromosome, tasks, available_slots)
+                fitness = self.calculate_fitness(chromosome, tasks, available_slots, weights)
                 fitness_scores.append(fitness)
             
             # Encontrar melhor solução desta geração
@@ -414,23 +424,29 @@ class IntelligentTaskOptimizer:
         """
         Adapta os pesos baseado no feedback do usuário
         """
-        if 'satisfaction_score' in feedback:
-            satisfaction = feedback['satisfaction_score']  # 0-1
+        with self._weights_lock:
+            weights = dict(self.weights)
             
-            # Ajustar pesos baseado na satisfação
-            if satisfaction < 0.5:
-                # Baixa satisfação: aumentar peso de prioridade e deadline
-                self.weights['priority_importance'] *= 1.1
-                self.weights['deadline_urgency'] *= 1.1
-                self.weights['energy_alignment'] *= 0.9
-            else:
-                # Alta satisfação: manter ou aumentar peso de energia
-                self.weights['energy_alignment'] *= 1.05
-        
-        # Normalizar pesos
-        total_weight = sum(self.weights.values())
-        for key in self.weights:
-            self.weights[key] /= total_weight
+            if 'satisfaction_score' in feedback:
+                satisfaction = feedback['satisfaction_score']  # 0-1
+                
+                # Ajustar pesos baseado na satisfação
+                if satisfaction < 0.5:
+                    # Baixa satisfação: aumentar peso de prioridade e deadline
+                    weights['priority_importance'] *= 1.1
+                    weights['deadline_urgency'] *= 1.1
+                    weights['energy_alignment'] *= 0.9
+                else:
+                    # Alta satisfação: manter ou aumentar peso de energia
+                    weights['energy_alignment'] *= 1.05
+            
+            # Normalizar pesos
+            total_weight = sum(weights.values())
+            for key in weights:
+                weights[key] /= total_weight
+            
+            # Troca atômica da referência
+            self.weights = weights
         
         logger.info("Pesos adaptados baseado no feedback")
     
@@ -0,0 +1,200 @@
+"""
+Registro de Modelos - Kairos AI Engine
+Pacotes versionados de artefatos (joblib) com metadados e checksums, publicados de
+forma atômica e carregados com memory-map para compartilhar páginas entre processos
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import joblib
+import numpy as np
+import sklearn
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_PATH = os.environ.get(
+    'KAIROS_MODEL_REGISTRY',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+)
+
+METADATA_FILE = 'metadata.json'
+LATEST_FILE = 'LATEST'
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_atomic(path: str, text: str):
+    """Grava `text` em `path` via arquivo temporário + os.replace"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+class ModelBundle:
+    """Conjunto de componentes de uma versão publicada (ex.: classificador + scaler)"""
+    __slots__ = ('name', 'version', 'metadata', 'components')
+
+    def __init__(self, name: str, version: int, metadata: Dict[str, Any], components: Dict[str, Any]):
+        self.name = name
+        self.version = version
+        self.metadata = metadata
+        self.components = components
+
+    def __getitem__(self, component: str):
+        return self.components[component]
+
+class ModelRegistry:
+    """
+    Registro de modelos em disco: `<root>/<nome>/<versão>/` com um arquivo
+    joblib por componente e um `metadata.json` (versão, data, versões das
+    bibliotecas, sha256 e tamanho de cada arquivo, metadados do treino).
+
+    - Publicação atômica: o pacote é montado em um diretório temporário e
+      renomeado para a versão; o ponteiro `LATEST` é trocado por os.replace,
+      então leitores nunca veem um pacote incompleto
+    - Carga com `mmap_mode='r'`: os arrays NumPy dos componentes (médias do
+      scaler, centróides...) são mapeados do arquivo, sem compressão, e workers
+      no mesmo host compartilham as páginas. As árvores do scikit-learn copiam
+      seus nós para buffers próprios ao serem restauradas.
+    - Integridade: checksums conferidos na carga
+    """
+
+    def __init__(self, root: str = DEFAULT_REGISTRY_PATH):
+        self.root = root
+
+    def _model_dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _version_dir(self, name: str, version: int) -> str:
+        return os.path.join(self._model_dir(name), f'{version:06d}')
+
+    def versions(self, name: str) -> List[int]:
+        model_dir = self._model_dir(name)
+        if not os.path.isdir(model_dir):
+            return []
+        return sorted(int(entry) for entry in os.listdir(model_dir) if entry.isdigit())
+
+    def latest_version(self, name: str) -> Optional[int]:
+        try:
+            with open(os.path.join(self._model_dir(name), LATEST_FILE)) as file:
+                return int(file.read().strip())
+        except (FileNotFoundError, ValueError):
+            versions = self.versions(name)
+            return versions[-1] if versions else None
+
+    def publish(self, name: str, components: Dict[str, Any],
+                metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Publica uma nova versão com os componentes e a marca como a mais recente"""
+        model_dir = self._model_dir(name)
+        os.makedirs(model_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=model_dir, prefix='.staging-')
+        try:
+            files = {}
+            for component, obj in components.items():
+                filename = f'{component}.joblib'
+                path = os.path.join(staging, filename)
+                # Sem compressão: requisito para o memory-map na carga
+                joblib.dump(obj, path)
+                files[component] = {
+                    'file': filename,
+                    'sha256': _sha256(path),
+                    'bytes': os.path.getsize(path)
+                }
+
+            # Versão = maior existente + 1; se outro processo publicar a mesma, tenta a seguinte
+            version = (self.versions(name) or [0])[-1] + 1
+            while True:
+                bundle_metadata = {
+                    'name': name,
+                    'version': version,
+                    'created_at': datetime.now(timezone.utc).isoformat(),
+                    'libraries': {
+                        'numpy': np.__version__,
+                        'scikit-learn': sklearn.__version__,
+                        'joblib': joblib.__version__
+                    },
+                    'components': files,
+                    **(metadata or {})
+                }
+                with open(os.path.join(staging, METADATA_FILE), 'w') as file:
+                    json.dump(bundle_metadata, file, indent=2, ensure_ascii=False)
+                try:
+                    os.rename(staging, self._version_dir(name, version))
+                    break
+                except OSError:
+                    if not os.path.exists(self._version_dir(name, version)):
+                        raise
+                    version += 1
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        _write_atomic(os.path.join(model_dir, LATEST_FILE), str(version))
+        logger.info(f"Modelo '{name}' publicado na versão {version}")
+        return version
+
+    def read_metadata(self, name: str, version: int) -> Dict[str, Any]:
+        with open(os.path.join(self._version_dir(name, version), METADATA_FILE)) as file:
+            return json.load(file)
+
+    def load(self, name: str, version: Optional[int] = None, mmap_mode: Optional[str] = 'r',
+             verify: bool = True, components: Optional[Sequence[str]] = None) -> Optional[ModelBundle]:
+        """
+        Carrega uma versão (padrão: a mais recente); None se não houver versão
+        publicada. Com `components`, carrega apenas os componentes listados
+        que existirem na versão. Checksum divergente gera ValueError.
+        """
+        version = version if version is not None else self.latest_version(name)
+        if version is None:
+            return None
+
+        version_dir = self._version_dir(name, version)
+        metadata = self.read_metadata(name, version)
+        if metadata.get('libraries', {}).get('scikit-learn') != sklearn.__version__:
+            logger.warning(
+                f"Modelo '{name}' v{version} treinado com scikit-learn "
+                f"{metadata.get('libraries', {}).get('scikit-learn')}; em uso {sklearn.__version__}"
+            )
+
+        loaded = {}
+        for component, info in metadata['components'].items():
+            if components is not None and component not in components:
+                continue
+            path = os.path.join(version_dir, info['file'])
+            if verify and _sha256(path) != info['sha256']:
+                raise ValueError(f"Checksum inválido para {name} v{version}: {info['file']}")
+            loaded[component] = joblib.load(path, mmap_mode=mmap_mode)
+
+        logger.info(f"Modelo '{name}' v{version} carregado (mmap_mode={mmap_mode})")
+        return ModelBundle(name, version, metadata, loaded)
+
+    def load_latest(self, name: str, mmap_mode: Optional[str] = 'r') -> Optional[ModelBundle]:
+        return self.load(name, mmap_mode=mmap_mode)
+
+    def prune(self, name: str, keep: int = 3) -> List[int]:
+        """Remove versões antigas, mantendo as `keep` mais recentes e a marcada como LATEST"""
+        latest = self.latest_version(name)
+        versions = self.versions(name)
+        removed = [version for version in versions[:max(len(versions) - keep, 0)] if version != latest]
+        for version in removed:
+            shutil.rmtree(self._version_dir(name, version), ignore_errors=True)
+        return removed
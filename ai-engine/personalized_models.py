@@ -0,0 +1,166 @@
+"""
+Modelos Personalizados de Presença - Kairos AI Engine
+Cache LRU, limitado em bytes, dos modelos incrementais por usuário carregados do
+registro sob demanda, com fallback para o modelo global
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from advanced_presence_analyzer import MODEL_NAME, AdvancedPresenceAnalyzer, user_model_name
+from feature_store import PresenceFeatureStore
+from model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+class _CacheEntry:
+    __slots__ = ('analyzer', 'nbytes', 'version', 'checked_at')
+
+    def __init__(self, analyzer: Optional[AdvancedPresenceAnalyzer], nbytes: int,
+                 version: Optional[int], checked_at: float):
+        self.analyzer = analyzer  # None: usuário servido pelo modelo global
+        self.nbytes = nbytes
+        self.version = version
+        self.checked_at = checked_at
+
+class PersonalizedModelCache:
+    """
+    Analisador de presença de cada usuário.
+
+    - Usuários com modelo publicado (`user_model_name`) e ao menos
+      `min_user_samples` sessões de treino usam o próprio modelo; os demais
+      usam o modelo global, carregado uma única vez
+    - Apenas a forma compilada é carregada, com memory-map; o tamanho de cada
+      entrada é o dos arrays compilados
+    - Entradas menos usadas são descartadas quando a soma passa de `max_bytes`
+      (o modelo global não entra na conta); decisões de fallback também ficam
+      em cache, limitadas a `max_entries`
+    - Após `refresh_seconds` a entrada confere a versão mais recente no
+      registro e recarrega se houve nova publicação
+    - `stats()` expõe hits, misses, taxa de acerto, bytes residentes e descartes
+    - Com `feature_store`, `analyze` é a ingestão: sessões rotuladas (com
+      'presence_state', ex.: estado confirmado pelo usuário) são anexadas ao
+      store para o próximo treino; sem rótulo, entrariam com o rótulo padrão
+    """
+
+    def __init__(self, registry: ModelRegistry = None, max_bytes: int = 64 * 1024 * 1024,
+                 min_user_samples: int = 200, max_entries: int = 10_000,
+                 refresh_seconds: float = 3600.0,
+                 feature_store: Optional[PresenceFeatureStore] = None):
+        self.registry = registry or ModelRegistry()
+        self.feature_store = feature_store
+        self.max_bytes = max_bytes
+        self.min_user_samples = min_user_samples
+        self.max_entries = max_entries
+        self.refresh_seconds = refresh_seconds
+
+        self._entries: 'OrderedDict[str, _CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._global = None
+        self._resident_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._fallbacks = 0
+        self._evictions = 0
+
+    def global_analyzer(self) -> AdvancedPresenceAnalyzer:
+        if self._global is None:
+            self._global = AdvancedPresenceAnalyzer.from_registry(self.registry, model_name=MODEL_NAME)
+        return self._global
+
+    def _load_user(self, user_id) -> _CacheEntry:
+        """Carrega o modelo do usuário, ou registra o fallback se ele não se qualificar"""
+        name = user_model_name(user_id)
+        now = time.monotonic()
+        version = self.registry.latest_version(name)
+        if version is None:
+            return _CacheEntry(None, 0, None, now)
+
+        # Metadados antes dos arrays: usuários com poucos dados não custam memória
+        n_samples = self.registry.read_metadata(name, version).get('training', {}).get('n_samples', 0)
+        if n_samples < self.min_user_samples:
+            return _CacheEntry(None, 0, version, now)
+
+        analyzer = AdvancedPresenceAnalyzer(self.registry, name)
+        if not analyzer.load_models(version):
+            return _CacheEntry(None, 0, None, now)
+        return _CacheEntry(analyzer, analyzer.compiled_models.nbytes, version, now)
+
+    def _is_stale(self, user_id, entry: _CacheEntry) -> bool:
+        """Confere no registro (fora do lock) se há versão nova após `refresh_seconds`"""
+        if time.monotonic() - entry.checked_at < self.refresh_seconds:
+            return False
+        if self.registry.latest_version(user_model_name(user_id)) != entry.version:
+            return True
+        entry.checked_at = time.monotonic()
+        return False
+
+    def get(self, user_id) -> AdvancedPresenceAnalyzer:
+        """Analisador do usuário (personalizado ou global)"""
+        # IDs int (backend) e str (feature store, orquestrador) são o mesmo usuário
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None and not self._is_stale(key, entry):
+            with self._lock:
+                self._hits += 1
+            return entry.analyzer or self.global_analyzer()
+
+        # Carga fora do lock; duas cargas simultâneas do mesmo usuário são inofensivas
+        entry = self._load_user(key)
+
+        with self._lock:
+            self._misses += 1
+            if entry.analyzer is None:
+                self._fallbacks += 1
+            self._store(key, entry)
+        return entry.analyzer or self.global_analyzer()
+
+    def _store(self, user_id, entry: _CacheEntry):
+        previous = self._entries.pop(user_id, None)
+        if previous is not None:
+            self._resident_bytes -= previous.nbytes
+        if entry.nbytes > self.max_bytes:
+            logger.warning(f"Modelo do usuário {user_id} ({entry.nbytes} bytes) excede o limite do cache")
+            entry = _CacheEntry(None, 0, entry.version, entry.checked_at)
+
+        self._entries[user_id] = entry
+        self._resident_bytes += entry.nbytes
+        while self._resident_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._resident_bytes -= evicted.nbytes
+            self._evictions += 1
+
+    def invalidate(self, user_id):
+        """Descarta a entrada do usuário (ex.: após publicar um novo modelo dele)"""
+        with self._lock:
+            entry = self._entries.pop(str(user_id), None)
+            if entry is not None:
+                self._resident_bytes -= entry.nbytes
+
+    def analyze(self, user_id, session: Dict[str, Any]) -> Dict[str, Any]:
+        analysis = self.get(user_id).analyze_current_state(session)
+        if self.feature_store is not None and session.get('presence_state') is not None:
+            self.feature_store.append(user_id, [session])
+        return analysis
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'fallbacks': self._fallbacks,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'personalized_entries': sum(1 for entry in self._entries.values() if entry.analyzer),
+                'resident_bytes': self._resident_bytes,
+                'max_bytes': self.max_bytes
+            }
@@ -1,9 +1,447 @@
 # ai-engine/presence-analyzer.py
 import json
 import numpy as np
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Tuple
-from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
+
+from presence_forecaster import HourOfWeekSums, PresenceForecaster
+from timezone_buckets import local_time_fields
+
+WEEKDAY_NAMES = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+# Ordem padrão dos campos quando as linhas chegam como tuplas (ex.: cursor do banco)
+PRESENCE_ROW_FIELDS = ('logged_at', 'presence_score', 'mood', 'context')
+DEFAULT_CHUNK_SIZE = 5000
+
+def _iter_chunks(rows: Iterable, chunk_size: int, fields: Sequence[str]):
+    """Blocos de até `chunk_size` logs como dicts (tuplas são nomeadas por `fields`)"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield [row if isinstance(row, dict) else dict(zip(fields, row)) for row in chunk]
+
+def _parse_logged_at(value):
+    """Converte `logged_at` (ISO 8601, com ou sem 'Z'); None se ausente ou inválido"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _parse_timestamps(values: List, timezone_name: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Interpreta uma coluna de `logged_at` de uma vez
+    
+    Retorna epoch (segundos UTC; horários sem fuso são tratados como UTC) e
+    hora/dia da semana (NaN / -1 quando inválido): no fuso `timezone_name`
+    (ex.: 'America/Sao_Paulo'), convertidos em lote pela tabela de transições
+    do fuso, ou, sem fuso, do relógio local do log.
+    Horários em UTC ou sem fuso são convertidos em lote pelo NumPy; os com
+    deslocamento explícito (ex.: -03:00) e os que o NumPy rejeita passam por
+    `datetime.fromisoformat`, um a um.
+    """
+    n = len(values)
+    epoch = np.full(n, np.nan)
+    local = np.zeros(n, dtype=np.int64)
+    valid = np.zeros(n, dtype=bool)
+    
+    fast_index, fast_text, slow_index = [], [], []
+    for i, value in enumerate(values):
+        if isinstance(value, datetime):
+            slow_index.append(i)  # ex.: colunas DateTime lidas direto do banco
+            continue
+        if not value or not isinstance(value, str):
+            continue
+        text = value[:-1] if value.endswith('Z') else value
+        if text[4:5] != '-' or '+' in text[10:] or '-' in text[10:]:
+            slow_index.append(i)
+        else:
+            fast_index.append(i)
+            fast_text.append(text)
+    
+    if fast_index:
+        try:
+            parsed = np.array(fast_text, dtype='datetime64[us]').astype(np.int64)
+        except ValueError:
+            slow_index.extend(fast_index)
+        else:
+            fast_index = np.array(fast_index)
+            epoch[fast_index] = parsed / 1e6
+            local[fast_index] = parsed // 1000000
+            valid[fast_index] = True
+    
+    for i in slow_index:
+        value = values[i]
+        log_time = value if isinstance(value, datetime) else _parse_logged_at(value)
+        if log_time is None:
+            continue
+        aware = log_time if log_time.tzinfo else log_time.replace(tzinfo=timezone.utc)
+        epoch[i] = aware.timestamp()
+        wall_clock = log_time.replace(tzinfo=None) - datetime(1970, 1, 1)
+        local[i] = wall_clock.days * 86400 + wall_clock.seconds
+        valid[i] = True
+    
+    if timezone_name:
+        hour, weekday, _ = local_time_fields(epoch, timezone_name)
+        return epoch, hour, weekday
+    
+    # 01/01/1970 foi uma quinta-feira (weekday 3; 0=Monday, 6=Sunday)
+    days = local // 86400
+    hour = np.where(valid, (local % 86400) // 3600, -1)
+    weekday = np.where(valid, (days + 3) % 7, -1)
+    return epoch, hour, weekday
+
+class PresenceColumns:
+    """Logs de presença em colunas NumPy, montadas em uma única passada
+    
+    Cada `logged_at` é interpretado uma só vez. Colunas:
+    - epoch, hour, weekday: horário do log (NaN / -1 se ausente ou inválido);
+      hora e dia da semana no fuso `timezone_name`, quando informado
+    - score: presence_score (NaN se ausente)
+    - context, mood: códigos nos vocabulários `contexts` e `moods`, em ordem de
+      primeira ocorrência (-1 quando o log não entra no agrupamento)
+    """
+    
+    def __init__(self, logs: List[Dict], timezone_name: Optional[str] = None):
+        logged_at, scores, truthy = [], [], []
+        contexts, moods = [], []
+        context_codes, mood_codes = {}, {}
+        integer_scores = True
+        
+        for log in logs:
+            logged_at.append(log.get('logged_at'))
+            score = log.get('presence_score')
+            if score is None:
+                scores.append(np.nan)
+                truthy.append(False)
+                contexts.append(-1)
+                moods.append(-1)
+                continue
+            
+            scores.append(score)
+            truthy.append(bool(score))
+            integer_scores = integer_scores and isinstance(score, int)
+            contexts.append(context_codes.setdefault(log.get('context', 'unknown'), len(context_codes)))
+            mood = log.get('mood')
+            moods.append(mood_codes.setdefault(mood, len(mood_codes)) if mood else -1)
+        
+        self.n_logs = len(logs)
+        self.epoch, self.hour, self.weekday = _parse_timestamps(logged_at, timezone_name)
+        self.score = np.array(scores, dtype=np.float64)
+        self.context = np.array(contexts, dtype=np.int64)
+        self.mood = np.array(moods, dtype=np.int64)
+        self.contexts = list(context_codes)
+        self.moods = list(mood_codes)
+        self.integer_scores = integer_scores
+        
+        self.has_score = ~np.isnan(self.score)
+        # Padrões diário e semanal exigem score não nulo e horário válido
+        self.timed = np.array(truthy, dtype=bool) & (self.hour >= 0)
+    
+    def take(self, rows) -> 'PresenceColumns':
+        """Subconjunto das linhas (slice gera views, sem cópia), com os mesmos vocabulários"""
+        subset = PresenceColumns.__new__(PresenceColumns)
+        for name in ('epoch', 'hour', 'weekday', 'score', 'context', 'mood', 'has_score', 'timed'):
+            setattr(subset, name, getattr(self, name)[rows])
+        subset.n_logs = len(subset.epoch)
+        subset.contexts = self.contexts
+        subset.moods = self.moods
+        subset.integer_scores = self.integer_scores
+        return subset
+
+class TimeIndexedPresenceLogs:
+    """Logs de presença ordenados por horário, com janelas em O(log n)
+    
+    Os logs são ordenados uma única vez na construção (nada é reordenado se já
+    vierem em ordem); logs sem horário válido ficam no fim e não entram em
+    janelas. `row_index` mapeia cada linha ordenada para a posição original.
+    As janelas são fatias contíguas (views) localizadas por busca binária.
+    As somas por hora da semana de todo o histórico (`hour_of_week`) são
+    calculadas uma única vez por índice.
+    """
+    
+    def __init__(self, logs, timezone_name: Optional[str] = None):
+        columns = logs if isinstance(logs, PresenceColumns) else PresenceColumns(logs, timezone_name)
+        epoch = columns.epoch
+        timed = ~np.isnan(epoch)
+        self.n_timed = int(np.count_nonzero(timed))
+        
+        in_order = timed[:self.n_timed].all() and bool(np.all(np.diff(epoch[:self.n_timed]) >= 0))
+        if in_order:
+            self.columns = columns
+            self.row_index = np.arange(columns.n_logs)
+        else:
+            # argsort coloca NaN (horário inválido) no fim
+            self.row_index = np.argsort(epoch, kind='stable')
+            self.columns = columns.take(self.row_index)
+        self._hour_of_week = None
+    
+    def __len__(self) -> int:
+        return self.columns.n_logs
+    
+    @property
+    def first_epoch(self) -> Optional[float]:
+        return float(self.columns.epoch[0]) if self.n_timed else None
+    
+    @property
+    def last_epoch(self) -> Optional[float]:
+        return float(self.columns.epoch[self.n_timed - 1]) if self.n_timed else None
+    
+    @property
+    def hour_of_week(self) -> HourOfWeekSums:
+        """Somas do modelo de previsão sobre todo o histórico (O(n) só na primeira consulta)"""
+        if self._hour_of_week is None:
+            self._hour_of_week = _hour_of_week_sums(self.columns)
+        return self._hour_of_week
+    
+    def window(self, start: float = None, end: float = None) -> PresenceColumns:
+        """Logs com start < epoch <= end (limites opcionais), sem percorrer os demais"""
+        epoch = self.columns.epoch[:self.n_timed]
+        lo = 0 if start is None else int(np.searchsorted(epoch, start, side='right'))
+        hi = self.n_timed if end is None else int(np.searchsorted(epoch, end, side='right'))
+        return self.columns.take(slice(lo, max(lo, hi)))
+
+def _hour_of_week_sums(columns: PresenceColumns) -> HourOfWeekSums:
+    seasonal = columns.has_score & (columns.hour >= 0)
+    return HourOfWeekSums.from_arrays(
+        columns.weekday[seasonal] * 24 + columns.hour[seasonal],
+        columns.epoch[seasonal], columns.score[seasonal]
+    )
+
+def _least_squares_slope(count, sum_y, sum_xy):
+    """Inclinação da regressão de y sobre x = 0..n-1 a partir das somas (forma fechada)"""
+    count = np.asarray(count, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sum_x = count * (count - 1) / 2
+        sum_xx = (count - 1) * count * (2 * count - 1) / 6
+        return (sum_xy - sum_x * sum_y / count) / (sum_xx - sum_x * sum_x / count)
+
+def _trend_label(slope: float, count: int) -> str:
+    if count < 3:
+        return 'insufficient_data'
+    if slope > 0.1:
+        return 'improving'
+    elif slope < -0.1:
+        return 'declining'
+    else:
+        return 'stable'
+
+# Colunas de cada grupo: contagem, soma, soma dos quadrados, soma de posição * score
+# (posição = ordem do log dentro do grupo, a variável x da tendência), mínimo e máximo
+GROUP_FIELDS = ('count', 'sum', 'sum_sq', 'sum_xy', 'min', 'max')
+HISTOGRAM_BUCKETS = 10
+
+def _score_buckets(scores: np.ndarray) -> np.ndarray:
+    """Balde do histograma: [1, 2) -> 0, ..., [10, ∞) -> 9 (abaixo de 1 também cai no 0)"""
+    return np.clip(np.floor(scores).astype(np.int64) - 1, 0, HISTOGRAM_BUCKETS - 1)
+
+class PresenceGroups:
+    """Somas de presença por grupo (hora, dia da semana, contexto, humor...)
+    
+    `names` segue a ordem de primeira ocorrência; `table` tem uma linha por
+    grupo com as colunas de GROUP_FIELDS. As somas bastam para média, desvio
+    padrão e tendência (mínimos quadrados em forma fechada).
+    """
+    __slots__ = ('names', 'table')
+    
+    def __init__(self, names: List = None, table: np.ndarray = None):
+        self.names = list(names or [])
+        self.table = table if table is not None else np.empty((0, len(GROUP_FIELDS)))
+    
+    @classmethod
+    def from_codes(cls, codes: np.ndarray, values: np.ndarray, names: List) -> 'PresenceGroups':
+        """Agrupa `values` pelos códigos (índices em `names`) com bincount / ufunc.at"""
+        n_groups = len(names)
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.searchsorted(sorted_codes, np.arange(n_groups))
+        positions = np.empty(len(codes), dtype=np.float64)
+        positions[order] = np.arange(len(codes)) - starts[sorted_codes]
+        
+        table = np.empty((n_groups, len(GROUP_FIELDS)))
+        table[:, 0] = np.bincount(codes, minlength=n_groups)
+        table[:, 1] = np.bincount(codes, weights=values, minlength=n_groups)
+        table[:, 2] = np.bincount(codes, weights=values * values, minlength=n_groups)
+        table[:, 3] = np.bincount(codes, weights=positions * values, minlength=n_groups)
+        table[:, 4] = np.inf
+        table[:, 5] = -np.inf
+        np.minimum.at(table[:, 4], codes, values)
+        np.maximum.at(table[:, 5], codes, values)
+        first_seen = np.full(n_groups, len(codes))
+        np.minimum.at(first_seen, codes, np.arange(len(codes)))
+        
+        present = np.flatnonzero(table[:, 0])
+        present = present[np.argsort(first_seen[present], kind='stable')]
+        return cls([names[code] for code in present], table[present])
+    
+    @classmethod
+    def from_dict(cls, data: Dict, key_type=None) -> 'PresenceGroups':
+        names = [key_type(name) if key_type else name for name in data]
+        table = np.array(list(data.values()), dtype=np.float64).reshape(len(names), len(GROUP_FIELDS))
+        return cls(names, table)
+    
+    def to_dict(self) -> Dict:
+        return {name: row.tolist() for name, row in zip(self.names, self.table)}
+    
+    def merge(self, later: 'PresenceGroups') -> 'PresenceGroups':
+        """Incorpora os grupos de um bloco posterior de logs (in-place)
+        
+        As posições do bloco posterior são deslocadas pela contagem já
+        acumulada de cada grupo, então a soma da tendência continua exata.
+        """
+        index = {name: i for i, name in enumerate(self.names)}
+        new_names = [name for name in later.names if name not in index]
+        if new_names:
+            empty = np.zeros((len(new_names), len(GROUP_FIELDS)))
+            empty[:, 4] = np.inf
+            empty[:, 5] = -np.inf
+            for name in new_names:
+                index[name] = len(self.names)
+                self.names.append(name)
+            self.table = np.vstack([self.table, empty])
+        
+        rows = np.array([index[name] for name in later.names], dtype=np.int64)
+        table = self.table
+        table[rows, 3] += later.table[:, 3] + table[rows, 0] * later.table[:, 1]
+        table[rows, 0:3] += later.table[:, 0:3]
+        table[rows, 4] = np.minimum(table[rows, 4], later.table[:, 4])
+        table[rows, 5] = np.maximum(table[rows, 5], later.table[:, 5])
+        return self
+    
+    def summary(self) -> Dict[str, np.ndarray]:
+        """Média, desvio padrão (populacional) e inclinação da tendência por grupo"""
+        count, sums, sums_sq, sums_xy = self.table[:, 0], self.table[:, 1], self.table[:, 2], self.table[:, 3]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sums / count
+            std = np.sqrt(np.maximum(sums_sq / count - mean * mean, 0.0))
+        return {
+            'count': count.astype(np.int64),
+            'mean': mean,
+            'std': std,
+            'slope': _least_squares_slope(count, sums, sums_xy),
+            'min': self.table[:, 4],
+            'max': self.table[:, 5]
+        }
+
+class PresenceAggregate:
+    """Agregado de presença de um usuário, independente do tamanho do histórico
+    
+    Reúne as somas por hora, dia da semana, contexto e humor, o agregado geral,
+    um histograma de 10 baldes (percentis exatos para scores inteiros de 1 a 10),
+    as somas por hora da semana do modelo de previsão e o epoch do primeiro e
+    do último log. Pode ser montado a partir dos logs
+    (`from_columns`) ou recebido pronto do backend (`from_dict`), que o mantém
+    atualizado a cada log registrado.
+    """
+    
+    def __init__(self):
+        self.total_logs = 0
+        self.first_epoch = None
+        self.last_epoch = None
+        self.hourly = PresenceGroups()
+        self.weekday = PresenceGroups()
+        self.context = PresenceGroups()
+        self.mood = PresenceGroups()
+        self.overall = PresenceGroups()
+        self.histogram = np.zeros(HISTOGRAM_BUCKETS, dtype=np.int64)
+        self.hour_of_week = HourOfWeekSums()
+        self.integer_scores = True
+    
+    @classmethod
+    def from_columns(cls, columns: PresenceColumns) -> 'PresenceAggregate':
+        aggregate = cls()
+        aggregate.total_logs = columns.n_logs
+        epochs = columns.epoch[~np.isnan(columns.epoch)]
+        if len(epochs):
+            aggregate.first_epoch = float(epochs.min())
+            aggregate.last_epoch = float(epochs.max())
+        
+        timed = columns.timed
+        aggregate.hourly = PresenceGroups.from_codes(columns.hour[timed], columns.score[timed], range(24))
+        aggregate.weekday = PresenceGroups.from_codes(columns.weekday[timed], columns.score[timed], range(7))
+        
+        scored = columns.has_score
+        aggregate.context = PresenceGroups.from_codes(columns.context[scored], columns.score[scored],
+                                                      columns.contexts)
+        with_mood = columns.mood >= 0
+        aggregate.mood = PresenceGroups.from_codes(columns.mood[with_mood], columns.score[with_mood],
+                                                   columns.moods)
+        scores = columns.score[scored]
+        aggregate.overall = PresenceGroups.from_codes(np.zeros(len(scores), dtype=np.int64), scores, ['all'])
+        aggregate.histogram = np.bincount(_score_buckets(scores), minlength=HISTOGRAM_BUCKETS)
+        aggregate.hour_of_week = _hour_of_week_sums(columns)
+        aggregate.integer_scores = columns.integer_scores
+        return aggregate
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'PresenceAggregate':
+        aggregate = cls()
+        aggregate.total_logs = int(data.get('total_logs', 0))
+        for attribute, key in (('first_epoch', 'first_logged_at'), ('last_epoch', 'last_logged_at')):
+            log_time = _parse_logged_at(data.get(key))
+            if log_time is not None:
+                aware = log_time if log_time.tzinfo else log_time.replace(tzinfo=timezone.utc)
+                setattr(aggregate, attribute, aware.timestamp())
+        aggregate.hourly = PresenceGroups.from_dict(data.get('hourly', {}), int)
+        aggregate.weekday = PresenceGroups.from_dict(data.get('weekday', {}), int)
+        aggregate.context = PresenceGroups.from_dict(data.get('context', {}))
+        aggregate.mood = PresenceGroups.from_dict(data.get('mood', {}))
+        overall = data.get('overall')
+        aggregate.overall = PresenceGroups.from_dict({'all': overall} if overall and overall[0] else {})
+        aggregate.histogram = np.array(data.get('histogram', [0] * HISTOGRAM_BUCKETS), dtype=np.int64)
+        aggregate.hour_of_week = HourOfWeekSums.from_dict(data.get('hour_of_week'))
+        aggregate.integer_scores = data.get('integer_scores', True)
+        return aggregate
+    
+    def to_dict(self) -> Dict[str, Any]:
+        def iso(epoch):
+            return datetime.fromtimestamp(epoch, timezone.utc).isoformat() if epoch is not None else None
+        
+        return {
+            'total_logs': self.total_logs,
+            'first_logged_at': iso(self.first_epoch),
+            'last_logged_at': iso(self.last_epoch),
+            'hourly': self.hourly.to_dict(),
+            'weekday': self.weekday.to_dict(),
+            'context': self.context.to_dict(),
+            'mood': self.mood.to_dict(),
+            'overall': self.overall.table[0].tolist() if self.overall.names else None,
+            'histogram': self.histogram.tolist(),
+            'hour_of_week': self.hour_of_week.to_dict(),
+            'integer_scores': self.integer_scores
+        }
+    
+    def merge(self, later: 'PresenceAggregate') -> 'PresenceAggregate':
+        """Incorpora o agregado de um bloco posterior de logs (in-place)"""
+        self.total_logs += later.total_logs
+        if later.first_epoch is not None:
+            self.first_epoch = later.first_epoch if self.first_epoch is None else min(self.first_epoch, later.first_epoch)
+            self.last_epoch = later.last_epoch if self.last_epoch is None else max(self.last_epoch, later.last_epoch)
+        for family in ('hourly', 'weekday', 'context', 'mood', 'overall'):
+            getattr(self, family).merge(getattr(later, family))
+        self.histogram = self.histogram + later.histogram
+        self.hour_of_week.merge(later.hour_of_week)
+        self.integer_scores = self.integer_scores and later.integer_scores
+        return self
+    
+    def as_score(self, value: float):
+        """Devolve o score no tipo original (int quando todos os scores são inteiros)"""
+        return int(value) if self.integer_scores else float(value)
+    
+    def percentiles(self, quantiles: List[float]) -> List[float]:
+        """Percentis (interpolação linear, como np.percentile) a partir do histograma"""
+        cumulative = np.cumsum(self.histogram)
+        total = cumulative[-1]
+        positions = np.asarray(quantiles, dtype=np.float64) / 100.0 * (total - 1)
+        lower = np.floor(positions)
+        upper = np.ceil(positions)
+        # Valor do k-ésimo score ordenado = balde onde a contagem acumulada passa de k
+        lower_values = np.searchsorted(cumulative, lower, side='right') + 1.0
+        upper_values = np.searchsorted(cumulative, upper, side='right') + 1.0
+        return (lower_values + (positions - lower) * (upper_values - lower_values)).tolist()
 
 class PresenceAnalyzer:
     def __init__(self):
@@ -16,19 +454,60 @@ class PresenceAnalyzer:
             'tenso', 'cansado', 'sobrecarregado', 'frustrado'
         ]
     
-    def analyze_presence_patterns(self, presence_logs: List[Dict]) -> Dict[str, Any]:
-        """Analisa padrões de presença ao longo do tempo"""
-        if not presence_logs:
+    def analyze_presence_patterns(self, presence_logs, timezone_name: Optional[str] = None) -> Dict[str, Any]:
+        """Analisa padrões de presença ao longo do tempo
+        
+        Aceita a lista de logs ou um TimeIndexedPresenceLogs já construído.
+        Horas e dias da semana são os do fuso `timezone_name` (User.timezone).
+        """
+        if not len(presence_logs):
             return {'message': 'Dados insuficientes para análise de presença'}
         
+        # Uma única passada sobre os logs, em ordem cronológica; todos os agrupamentos usam as colunas
+        columns = self._time_indexed(presence_logs, timezone_name).columns
+        aggregate = PresenceAggregate.from_columns(columns)
+        
+        # Com os scores em mãos, os percentis são exatos para qualquer escala
+        scores = columns.score[columns.has_score]
+        percentiles = np.percentile(scores, [25, 50, 75]).tolist() if len(scores) else None
+        return self._analyze_aggregate(aggregate, percentiles)
+    
+    def analyze_presence_stream(self, rows: Iterable, fields: Sequence[str] = None,
+                                chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                timezone_name: Optional[str] = None) -> Dict[str, Any]:
+        """Analisa logs lidos em blocos de um iterável qualquer (ex.: cursor do banco)
+        
+        Cada bloco vira colunas, é agregado e mesclado ao agregado parcial, então
+        a memória é limitada pelo tamanho do bloco e não pelo histórico. As linhas
+        podem ser dicts ou tuplas com os campos em `fields` (padrão:
+        PRESENCE_ROW_FIELDS), por exemplo um `yield_per` do SQLAlchemy sobre
+        (logged_at, presence_score, mood, context). O fluxo deve vir em ordem
+        cronológica (ORDER BY logged_at); os percentis vêm do histograma.
+        """
+        aggregate = PresenceAggregate()
+        for chunk in _iter_chunks(rows, chunk_size, fields or PRESENCE_ROW_FIELDS):
+            aggregate.merge(PresenceAggregate.from_columns(TimeIndexedPresenceLogs(chunk, timezone_name).columns))
+        
+        if not aggregate.total_logs:
+            return {'message': 'Dados insuficientes para análise de presença'}
+        return self._analyze_aggregate(aggregate)
+    
+    def analyze_from_aggregate(self, aggregate: Dict) -> Dict[str, Any]:
+        """Analisa a partir do agregado mantido pelo backend, em tempo constante"""
+        presence_aggregate = PresenceAggregate.from_dict(aggregate)
+        if not presence_aggregate.total_logs:
+            return {'message': 'Dados insuficientes para análise de presença'}
+        return self._analyze_aggregate(presence_aggregate)
+    
+    def _analyze_aggregate(self, aggregate: PresenceAggregate, percentiles: List[float] = None) -> Dict[str, Any]:
         # Organizar dados por período
-        daily_patterns = self._analyze_daily_patterns(presence_logs)
-        weekly_patterns = self._analyze_weekly_patterns(presence_logs)
-        contextual_patterns = self._analyze_contextual_patterns(presence_logs)
-        mood_patterns = self._analyze_mood_patterns(presence_logs)
+        daily_patterns = self._analyze_daily_patterns(aggregate)
+        weekly_patterns = self._analyze_weekly_patterns(aggregate)
+        contextual_patterns = self._analyze_contextual_patterns(aggregate)
+        mood_patterns = self._analyze_mood_patterns(aggregate)
         
         # Calcular métricas gerais
-        overall_metrics = self._calculate_overall_metrics(presence_logs)
+        overall_metrics = self._calculate_overall_metrics(aggregate, percentiles)
         
         # Gerar insights e recomendações
         insights = self._generate_presence_insights(daily_patterns, contextual_patterns, mood_patterns)
@@ -45,27 +524,19 @@ class PresenceAnalyzer:
             'analysis_date': datetime.now().isoformat()
         }
     
-    def _analyze_daily_patterns(self, logs: List[Dict]) -> Dict[str, Any]:
+    def _analyze_daily_patterns(self, aggregate: PresenceAggregate) -> Dict[str, Any]:
         """Analisa padrões diários de presença"""
-        hourly_scores = defaultdict(list)
-        
-        for log in logs:
-            if log.get('logged_at') and log.get('presence_score'):
-                try:
-                    log_time = datetime.fromisoformat(log['logged_at'].replace('Z', '+00:00'))
-                    hour = log_time.hour
-                    hourly_scores[hour].append(log['presence_score'])
-                except:
-                    continue
+        hourly = aggregate.hourly
+        stats = hourly.summary()
         
         # Calcular médias por hora
         hourly_averages = {
             hour: {
-                'average_score': np.mean(scores),
-                'count': len(scores),
-                'std_dev': np.std(scores)
+                'average_score': float(stats['mean'][i]),
+                'count': int(stats['count'][i]),
+                'std_dev': float(stats['std'][i])
             }
-            for hour, scores in hourly_scores.items()
+            for i, hour in enumerate(hourly.names)
         }
         
         # Identificar picos e vales
@@ -83,32 +554,21 @@ class PresenceAnalyzer:
                                   for h, data in best_hours],
             'low_presence_hours': [{'hour': h, 'score': data['average_score']} 
                                  for h, data in worst_hours],
-            'total_daily_logs': len(logs)
+            'total_daily_logs': aggregate.total_logs
         }
     
-    def _analyze_weekly_patterns(self, logs: List[Dict]) -> Dict[str, Any]:
+    def _analyze_weekly_patterns(self, aggregate: PresenceAggregate) -> Dict[str, Any]:
         """Analisa padrões semanais de presença"""
-        weekday_scores = defaultdict(list)
-        
-        for log in logs:
-            if log.get('logged_at') and log.get('presence_score'):
-                try:
-                    log_time = datetime.fromisoformat(log['logged_at'].replace('Z', '+00:00'))
-                    weekday = log_time.weekday()  # 0=Monday, 6=Sunday
-                    weekday_scores[weekday].append(log['presence_score'])
-                except:
-                    continue
-        
-        weekday_names = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+        weekday = aggregate.weekday
+        stats = weekday.summary()
         
         weekly_averages = {}
-        for weekday, scores in weekday_scores.items():
-            if scores:
-                weekly_averages[weekday_names[weekday]] = {
-                    'average_score': np.mean(scores),
-                    'count': len(scores),
-                    'trend': self._calculate_trend(scores)
-                }
+        for i, day in enumerate(weekday.names):
+            weekly_averages[WEEKDAY_NAMES[day]] = {
+                'average_score': float(stats['mean'][i]),
+                'count': int(stats['count'][i]),
+                'trend': _trend_label(stats['slope'][i], stats['count'][i])
+            }
         
         return {
             'weekly_averages': weekly_averages,
@@ -118,25 +578,19 @@ class PresenceAnalyzer:
                                      key=lambda x: x[1]['average_score'])[0] if weekly_averages else None
         }
     
-    def _analyze_contextual_patterns(self, logs: List[Dict]) -> Dict[str, Any]:
+    def _analyze_contextual_patterns(self, aggregate: PresenceAggregate) -> Dict[str, Any]:
         """Analisa presença por contexto (trabalho, casa, lazer, etc.)"""
-        context_scores = defaultdict(list)
-        
-        for log in logs:
-            context = log.get('context', 'unknown')
-            score = log.get('presence_score')
-            if score is not None:
-                context_scores[context].append(score)
+        contexts = aggregate.context
+        stats = contexts.summary()
         
         context_analysis = {}
-        for context, scores in context_scores.items():
-            if scores:
-                context_analysis[context] = {
-                    'average_score': np.mean(scores),
-                    'count': len(scores),
-                    'consistency': 1.0 - (np.std(scores) / 10.0),  # Normalizado para 0-1
-                    'improvement_trend': self._calculate_trend(scores)
-                }
+        for i, context in enumerate(contexts.names):
+            context_analysis[context] = {
+                'average_score': float(stats['mean'][i]),
+                'count': int(stats['count'][i]),
+                'consistency': float(1.0 - (stats['std'][i] / 10.0)),  # Normalizado para 0-1
+                'improvement_trend': _trend_label(stats['slope'][i], stats['count'][i])
+            }
         
         # Identificar melhor e pior contexto
         if context_analysis:
@@ -152,27 +606,21 @@ class PresenceAnalyzer:
             'context_recommendations': self._generate_context_recommendations(context_analysis)
         }
     
-    def _analyze_mood_patterns(self, logs: List[Dict]) -> Dict[str, Any]:
+    def _analyze_mood_patterns(self, aggregate: PresenceAggregate) -> Dict[str, Any]:
         """Analisa correlação entre humor e presença"""
-        mood_presence = defaultdict(list)
-        
-        for log in logs:
-            mood = log.get('mood')
-            score = log.get('presence_score')
-            if mood and score is not None:
-                mood_presence[mood].append(score)
+        moods = aggregate.mood
+        stats = moods.summary()
         
         mood_analysis = {}
-        for mood, scores in mood_presence.items():
-            if scores:
-                mood_analysis[mood] = {
-                    'average_presence': np.mean(scores),
-                    'count': len(scores),
-                    'presence_range': {
-                        'min': min(scores),
-                        'max': max(scores)
-                    }
+        for i, mood in enumerate(moods.names):
+            mood_analysis[mood] = {
+                'average_presence': float(stats['mean'][i]),
+                'count': int(stats['count'][i]),
+                'presence_range': {
+                    'min': aggregate.as_score(stats['min'][i]),
+                    'max': aggregate.as_score(stats['max'][i])
                 }
+            }
         
         # Identificar humores mais e menos conducentes à presença
         if mood_analysis:
@@ -188,40 +636,41 @@ class PresenceAnalyzer:
             'mood_presence_correlation': self._calculate_mood_correlation(mood_analysis)
         }
     
-    def _calculate_overall_metrics(self, logs: List[Dict]) -> Dict[str, Any]:
+    def _calculate_overall_metrics(self, aggregate: PresenceAggregate,
+                                   percentiles: List[float] = None) -> Dict[str, Any]:
         """Calcula métricas gerais de presença"""
-        if not logs:
+        if not aggregate.total_logs or not aggregate.overall.names:
             return {}
         
-        scores = [log['presence_score'] for log in logs if log.get('presence_score') is not None]
-        
-        if not scores:
-            return {}
+        stats = aggregate.overall.summary()
+        count = int(stats['count'][0])
         
         # Métricas básicas
-        avg_presence = np.mean(scores)
-        consistency = 1.0 - (np.std(scores) / 10.0)  # Normalizado
-        improvement_trend = self._calculate_trend(scores)
+        avg_presence = stats['mean'][0]
+        consistency = 1.0 - (stats['std'][0] / 10.0)  # Normalizado
+        improvement_trend = _trend_label(stats['slope'][0], count)
         
-        # Distribuição de scores
-        high_presence_count = len([s for s in scores if s >= 8])
-        medium_presence_count = len([s for s in scores if 5 <= s < 8])
-        low_presence_count = len([s for s in scores if s < 5])
+        # Distribuição de scores (baldes do histograma: 0-3 < 5, 4-6 entre 5 e 8, 7-9 >= 8)
+        histogram = aggregate.histogram
+        high_presence_count = int(histogram[7:].sum())
+        medium_presence_count = int(histogram[4:7].sum())
+        low_presence_count = int(histogram[:4].sum())
         
         # Frequência de logging (logs por dia)
-        if len(logs) > 1:
-            first_log = datetime.fromisoformat(logs[0]['logged_at'].replace('Z', '+00:00'))
-            last_log = datetime.fromisoformat(logs[-1]['logged_at'].replace('Z', '+00:00'))
-            days_span = (last_log - first_log).days + 1
-            logs_per_day = len(logs) / days_span
+        if aggregate.total_logs > 1 and aggregate.first_epoch is not None and aggregate.last_epoch is not None:
+            days_span = int((aggregate.last_epoch - aggregate.first_epoch) // 86400) + 1
+            logs_per_day = aggregate.total_logs / days_span
         else:
             logs_per_day = 1
         
+        if percentiles is None:
+            percentiles = aggregate.percentiles([25, 50, 75])
+        
         return {
             'average_presence': round(avg_presence, 2),
             'consistency_score': round(consistency, 2),
             'improvement_trend': improvement_trend,
-            'total_logs': len(logs),
+            'total_logs': aggregate.total_logs,
             'logs_per_day': round(logs_per_day, 2),
             'presence_distribution': {
                 'high': high_presence_count,
@@ -229,27 +678,21 @@ class PresenceAnalyzer:
                 'low': low_presence_count
             },
             'presence_percentiles': {
-                '25th': np.percentile(scores, 25),
-                '50th': np.percentile(scores, 50),
-                '75th': np.percentile(scores, 75)
+                '25th': float(percentiles[0]),
+                '50th': float(percentiles[1]),
+                '75th': float(percentiles[2])
             }
         }
     
-    def _calculate_trend(self, scores: List[float]) -> str:
+    def _calculate_trend(self, scores) -> str:
         """Calcula tendência de melhoria/piora"""
         if len(scores) < 3:
             return 'insufficient_data'
         
-        # Usar regressão linear simples
-        x = np.arange(len(scores))
-        slope = np.polyfit(x, scores, 1)[0]
-        
-        if slope > 0.1:
-            return 'improving'
-        elif slope < -0.1:
-            return 'declining'
-        else:
-            return 'stable'
+        # Regressão linear simples em forma fechada (sem ajuste iterativo)
+        y = np.asarray(scores, dtype=np.float64)
+        slope = _least_squares_slope(len(y), y.sum(), np.dot(np.arange(len(y)), y))
+        return _trend_label(slope, len(y))
     
     def _calculate_mood_correlation(self, mood_analysis: Dict) -> float:
         """Calcula correlação geral entre humor e presença"""
@@ -341,7 +784,7 @@ class PresenceAnalyzer:
         recommendations = []
         
         for context, data in context_analysis.items():
-            avg_score = data['average_presence']
+            avg_score = data['average_score']
             consistency = data['consistency']
             
             if avg_score < 5:
@@ -353,25 +796,36 @@ class PresenceAnalyzer:
         
         return recommendations
 
-    def predict_presence_challenges(self, logs: List[Dict], days_ahead: int = 7) -> Dict[str, Any]:
-        """Prediz possíveis desafios de presença nos próximos dias"""
-        if not logs:
+    def _time_indexed(self, logs, timezone_name: Optional[str] = None) -> TimeIndexedPresenceLogs:
+        return logs if isinstance(logs, TimeIndexedPresenceLogs) else TimeIndexedPresenceLogs(logs, timezone_name)
+    
+    def predict_presence_challenges(self, logs, days_ahead: int = 7,
+                                    timezone_name: Optional[str] = None,
+                                    aggregate: Optional[PresenceAggregate] = None) -> Dict[str, Any]:
+        """Prediz possíveis desafios de presença nos próximos dias
+        
+        Aceita a lista de logs ou um TimeIndexedPresenceLogs já construído
+        (montado no mesmo `timezone_name`); apenas as linhas da janela recente
+        são lidas. A previsão usa as somas por hora da semana do `aggregate`
+        mantido pelo backend (PresenceAggregate.from_dict), quando informado,
+        ou as do índice, calculadas uma vez por índice.
+        """
+        if not len(logs):
             return {'message': 'Dados insuficientes para predição'}
         
-        # Analisar padrões recentes
-        recent_logs = [log for log in logs 
-                      if datetime.fromisoformat(log['logged_at'].replace('Z', '+00:00')) 
-                      > datetime.now() - timedelta(days=14)]
+        # Analisar padrões recentes (janela localizada por busca binária)
+        indexed = self._time_indexed(logs, timezone_name)
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=14)).timestamp()
+        recent = indexed.window(start=cutoff)
         
-        if not recent_logs:
+        if not recent.n_logs:
             return {'message': 'Dados recentes insuficientes'}
         
         # Identificar tendências
-        recent_scores = [log['presence_score'] for log in recent_logs 
-                        if log.get('presence_score') is not None]
+        recent_scores = recent.score[recent.has_score]
         
         trend = self._calculate_trend(recent_scores)
-        avg_recent = np.mean(recent_scores) if recent_scores else 0
+        avg_recent = np.mean(recent_scores) if len(recent_scores) else 0
         
         # Gerar predições
         predictions = []
@@ -393,7 +847,7 @@ class PresenceAnalyzer:
             })
         
         # Predições baseadas em padrões semanais
-        weekly_patterns = self._analyze_weekly_patterns(recent_logs)
+        weekly_patterns = self._analyze_weekly_patterns(PresenceAggregate.from_columns(recent))
         challenging_day = weekly_patterns.get('challenging_weekday')
         
         if challenging_day:
@@ -404,6 +858,23 @@ class PresenceAnalyzer:
                 'confidence': 0.6
             })
         
+        # Previsão hora a hora (sazonalidade semanal + tendência) sobre todo o histórico
+        hour_of_week = aggregate.hour_of_week if aggregate is not None else indexed.hour_of_week
+        forecast = PresenceForecaster().forecast(
+            hour_of_week, days=days_ahead,
+            timezone_name=timezone_name
+        )
+        low_windows = forecast.get('low_presence_windows', [])
+        if low_windows:
+            window = min(low_windows, key=lambda w: w['expected_presence'])
+            predictions.append({
+                'type': 'forecast',
+                'message': f"Presença prevista baixa ({window['expected_presence']}) "
+                           f"a partir de {window['start']} por {window['hours']}h",
+                'recommendation': 'Agende uma pausa consciente antes dessa janela',
+                'confidence': 0.5
+            })
+        
         return {
             'predictions': predictions,
             'trend_analysis': {
@@ -411,13 +882,23 @@ class PresenceAnalyzer:
                 'recent_average': round(avg_recent, 2),
                 'data_points': len(recent_scores)
             },
+            'presence_forecast': forecast,
             'prediction_date': datetime.now().isoformat()
         }
 
-def analyze_presence_api(presence_logs: List[Dict]) -> Dict[str, Any]:
-    """Função de API para análise de presença"""
+def analyze_presence_api(presence_logs: Iterable, fields: Sequence[str] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         timezone_name: Optional[str] = None) -> Dict[str, Any]:
+    """Função de API para análise de presença
+    
+    Listas de dicts são analisadas de uma vez; qualquer outro iterável (cursor,
+    gerador, lista de tuplas) é consumido em blocos de `chunk_size` linhas.
+    `timezone_name` é o fuso do usuário para o agrupamento por hora e dia.
+    """
     analyzer = PresenceAnalyzer()
-    return analyzer.analyze_presence_patterns(presence_logs)
+    if isinstance(presence_logs, list) and (not presence_logs or isinstance(presence_logs[0], dict)):
+        return analyzer.analyze_presence_patterns(presence_logs, timezone_name)
+    return analyzer.analyze_presence_stream(presence_logs, fields, chunk_size, timezone_name)
 
 if __name__ == "__main__":
     # Exemplo de uso
@@ -0,0 +1,127 @@
+"""
+Micro-lotes de Inferência de Presença - Kairos AI Engine
+Agrupa análises concorrentes por alguns milissegundos e executa os modelos uma
+única vez por lote (AdvancedPresenceAnalyzer.analyze_batch)
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class PresenceMicroBatcher:
+    """
+    Fila de sessões a analisar, consumida por uma thread que monta lotes.
+
+    - `submit` enfileira a sessão e devolve um Future; `analyze` espera o resultado
+    - O lote é fechado ao atingir `max_batch_size` sessões ou `max_wait_ms`
+      após a chegada da primeira, o que vier antes; com pouca carga a espera
+      extra é no máximo `max_wait_ms`
+    - Uma falha no lote é propagada para todos os Futures do lote
+    - `stats()` expõe lotes, sessões e tamanho médio do lote
+    """
+
+    def __init__(self, analyzer, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.analyzer = analyzer
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._sessions = 0
+        self._max_batch_seen = 0
+
+        self._worker = threading.Thread(target=self._run, name='presence-batcher', daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, session: Dict[str, Any]) -> Future:
+        if self._closed:
+            raise RuntimeError('PresenceMicroBatcher encerrado')
+        future = Future()
+        self._queue.put((session, future))
+        return future
+
+    def analyze(self, session: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Analisa uma sessão (bloqueia até o lote dela ser processado)"""
+        return self.submit(session).result(timeout)
+
+    def _next_batch(self):
+        """Espera a primeira sessão e completa o lote até o limite de tamanho ou de tempo"""
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # encerra depois deste lote
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Futures cancelados pelo chamador não entram no lote
+            batch = [(session, future) for session, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = self.analyzer.analyze_batch([session for session, _ in batch])
+            except Exception as error:
+                logger.exception(f"Falha ao analisar lote de {len(batch)} sessões")
+                for _, future in batch:
+                    future.set_exception(error)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._sessions += len(batch)
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'batches': self._batches,
+                'sessions': self._sessions,
+                'average_batch_size': round(self._sessions / self._batches, 2) if self._batches else 0.0,
+                'max_batch_size': self._max_batch_seen,
+                'queued': self._queue.qsize()
+            }
+
+    def close(self):
+        """Processa o que já estiver na fila e encerra a thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._worker.join()
+        # Sessões enfileiradas durante o encerramento
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError('PresenceMicroBatcher encerrado'))
+        atexit.unregister(self.close)
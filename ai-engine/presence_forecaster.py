@@ -0,0 +1,206 @@
+"""
+Previsão de Presença por Hora da Semana - Kairos AI Engine
+Linha de base sazonal (168 horas da semana) + tendência linear, ajustadas em forma
+fechada sobre os agregados do usuário e previstas de forma vetorizada
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from timezone_buckets import local_time_fields
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+
+# Origem da variável de tempo da tendência (dias desde 01/01/2020 UTC).
+# O backend usa a mesma origem ao manter o agregado `hour_of_week`.
+TIME_ORIGIN_EPOCH = 1577836800.0
+
+def time_in_days(epoch) -> np.ndarray:
+    return (np.asarray(epoch, dtype=np.float64) - TIME_ORIGIN_EPOCH) / 86400.0
+
+class HourOfWeekSums:
+    """
+    Somas suficientes para o modelo sazonal, por hora da semana
+    (bin = dia da semana * 24 + hora, no fuso do usuário ou no relógio local do log):
+    contagem, soma dos scores e soma dos tempos, mais as somas globais
+    de t² e t*y. Atualização e mescla são somas; o tamanho é fixo (168 bins).
+    """
+    __slots__ = ('bins', 'sum_tt', 'sum_ty')
+
+    def __init__(self, bins: Optional[np.ndarray] = None, sum_tt: float = 0.0, sum_ty: float = 0.0):
+        self.bins = bins if bins is not None else np.zeros((HOURS_PER_WEEK, 3))
+        self.sum_tt = float(sum_tt)
+        self.sum_ty = float(sum_ty)
+
+    @classmethod
+    def from_arrays(cls, hour_of_week: np.ndarray, epoch: np.ndarray, scores: np.ndarray) -> 'HourOfWeekSums':
+        t = time_in_days(epoch)
+        bins = np.empty((HOURS_PER_WEEK, 3))
+        bins[:, 0] = np.bincount(hour_of_week, minlength=HOURS_PER_WEEK)
+        bins[:, 1] = np.bincount(hour_of_week, weights=scores, minlength=HOURS_PER_WEEK)
+        bins[:, 2] = np.bincount(hour_of_week, weights=t, minlength=HOURS_PER_WEEK)
+        return cls(bins, np.dot(t, t), np.dot(t, scores))
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> 'HourOfWeekSums':
+        sums = cls()
+        if not data:
+            return sums
+        for hour_of_week, row in data.get('bins', {}).items():
+            sums.bins[int(hour_of_week)] = row
+        sums.sum_tt = float(data.get('sum_tt', 0.0))
+        sums.sum_ty = float(data.get('sum_ty', 0.0))
+        return sums
+
+    def to_dict(self) -> Dict:
+        present = np.flatnonzero(self.bins[:, 0])
+        return {
+            'bins': {int(i): self.bins[i].tolist() for i in present},
+            'sum_tt': self.sum_tt,
+            'sum_ty': self.sum_ty
+        }
+
+    def merge(self, other: 'HourOfWeekSums') -> 'HourOfWeekSums':
+        self.bins = self.bins + other.bins
+        self.sum_tt += other.sum_tt
+        self.sum_ty += other.sum_ty
+        return self
+
+    @property
+    def count(self) -> int:
+        return int(self.bins[:, 0].sum())
+
+class SeasonalPresenceModel:
+    """
+    y(t, h) = base[h] + slope * t
+
+    `base` tem uma entrada por hora da semana; `slope` é a tendência em
+    pontos de presença por dia. Horas com poucos dados são suavizadas em
+    direção à média da mesma hora do dia nos outros dias da semana.
+    """
+
+    def __init__(self, base: np.ndarray, slope: float, n_observations: int):
+        self.base = base
+        self.slope = slope
+        self.n_observations = n_observations
+
+    def predict(self, start: datetime, days: int,
+                timezone_name: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Presença esperada para cada hora dos próximos `days` dias a partir de
+        `start` (arredondado para a hora), em uma única operação vetorizada.
+        Com `timezone_name`, os bins seguem o relógio desse fuso (inclusive
+        mudanças de horário de verão dentro do horizonte).
+        """
+        start = start.replace(minute=0, second=0, microsecond=0)
+        aware = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+        offsets = np.arange(days * 24, dtype=np.int64)
+        epoch = aware.timestamp() + offsets * 3600.0
+
+        if timezone_name:
+            hour, weekday, _ = local_time_fields(epoch, timezone_name)
+            hour_of_week = weekday * 24 + hour
+        else:
+            # Relógio local de `start` para os bins; epoch para a tendência
+            wall_clock = start.replace(tzinfo=None) - datetime(1970, 1, 1)
+            local_hours = (wall_clock.days * 24 + wall_clock.seconds // 3600) + offsets
+            # 01/01/1970 foi uma quinta-feira (weekday 3; 0=Monday)
+            hour_of_week = ((local_hours // 24 + 3) % 7) * 24 + local_hours % 24
+
+        expected = self.base[hour_of_week] + self.slope * time_in_days(epoch)
+        return {
+            'epoch': epoch,
+            'hour_of_week': hour_of_week,
+            'expected_presence': np.clip(expected, 0.0, 10.0)
+        }
+
+class PresenceForecaster:
+    """
+    Ajusta o modelo sazonal + tendência por mínimos quadrados em forma fechada
+    sobre as somas por hora da semana (O(168) por usuário, sem acessar os logs)
+    e aponta as janelas de baixa presença previstas.
+    """
+
+    def __init__(self, low_presence_threshold: float = 5.0, prior_strength: float = 3.0,
+                 min_observations: int = 10):
+        self.low_presence_threshold = low_presence_threshold
+        self.prior_strength = prior_strength
+        self.min_observations = min_observations
+
+    def fit(self, sums: HourOfWeekSums) -> Optional[SeasonalPresenceModel]:
+        count, sum_y, sum_t = sums.bins[:, 0], sums.bins[:, 1], sums.bins[:, 2]
+        n = count.sum()
+        if n < self.min_observations:
+            return None
+
+        present = count > 0
+        # Tendência comum com interceptos por bin (estimador "within")
+        numerator = sums.sum_ty - np.sum(sum_t[present] * sum_y[present] / count[present])
+        denominator = sums.sum_tt - np.sum(sum_t[present] ** 2 / count[present])
+        slope = numerator / denominator if denominator > 1e-9 * max(sums.sum_tt, 1.0) else 0.0
+
+        # Scores sem a tendência, agregados por bin e por hora do dia
+        detrended = sum_y - slope * sum_t
+        hour_count = count.reshape(7, 24).sum(axis=0)
+        hour_sum = detrended.reshape(7, 24).sum(axis=0)
+        overall = detrended.sum() / n
+        hour_mean = np.where(hour_count > 0, hour_sum / np.maximum(hour_count, 1), overall)
+
+        # Suavização: bins com poucos logs puxam para a média da hora do dia
+        prior = np.tile(hour_mean, 7)
+        base = (detrended + self.prior_strength * prior) / (count + self.prior_strength)
+        return SeasonalPresenceModel(base, float(slope), int(n))
+
+    def low_presence_windows(self, forecast: Dict[str, np.ndarray]) -> List[Dict]:
+        """Sequências contíguas de horas com presença prevista abaixo do limiar"""
+        expected = forecast['expected_presence']
+        low = np.concatenate([[False], expected < self.low_presence_threshold, [False]])
+        edges = np.flatnonzero(np.diff(low.astype(np.int8)))
+        windows = []
+        for start, end in zip(edges[::2], edges[1::2]):
+            windows.append({
+                'start': datetime.fromtimestamp(forecast['epoch'][start], timezone.utc).isoformat(),
+                'end': datetime.fromtimestamp(forecast['epoch'][end - 1] + 3600, timezone.utc).isoformat(),
+                'hours': int(end - start),
+                'expected_presence': round(float(expected[start:end].mean()), 2)
+            })
+        return windows
+
+    def forecast(self, sums: HourOfWeekSums, days: int = 7,
+                 start: Optional[datetime] = None, timezone_name: Optional[str] = None) -> Dict:
+        model = self.fit(sums)
+        if model is None:
+            return {'message': 'Dados insuficientes para previsão'}
+
+        start = start or datetime.now(timezone.utc) + timedelta(hours=1)
+        forecast = model.predict(start, days, timezone_name)
+        return {
+            'horizon_days': days,
+            'trend_per_day': round(model.slope, 4),
+            'observations': model.n_observations,
+            'expected_presence': np.round(forecast['expected_presence'], 2).tolist(),
+            'low_presence_windows': self.low_presence_windows(forecast),
+            'forecast_start': datetime.fromtimestamp(forecast['epoch'][0], timezone.utc).isoformat()
+        }
+
+    def forecast_many(self, sums_by_user: Dict, days: int = 7,
+                      start: Optional[datetime] = None,
+                      timezones: Optional[Dict] = None) -> Dict:
+        """Previsão para vários usuários (ex.: job noturno sobre toda a base)
+
+        `timezones` mapeia user_id -> fuso em que as somas foram agrupadas.
+        """
+        timezones = timezones or {}
+        results = {}
+        for user_id, sums in sums_by_user.items():
+            if isinstance(sums, dict):
+                sums = HourOfWeekSums.from_dict(sums)
+            results[user_id] = self.forecast(sums, days, start, timezones.get(user_id))
+        logger.info(f"Previsão de presença gerada para {len(results)} usuários")
+        return results
@@ -0,0 +1,84 @@
+"""
+Seletor de Passos de Ritual por Bandit - Kairos AI Engine
+UCB sobre posteriores Beta por usuário, com atualização O(1) e pontuação vetorizada
+"""
+
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+def update_posteriors(params: np.ndarray, step_indices: Sequence[int], reward: float):
+    """Soma a recompensa (limitada a [0, 1]) às posteriores Beta dos passos executados"""
+    reward = min(1.0, max(0.0, float(reward)))
+    params[0, step_indices] += reward
+    params[1, step_indices] += 1.0 - reward
+
+class RitualStepBandit:
+    """
+    Bandit contextual sobre o catálogo de passos de ritual.
+
+    Cada usuário tem um array compacto (2 x passos) com os parâmetros
+    (alpha, beta) da posterior Beta da efetividade de cada passo. O contexto
+    (necessidades identificadas) define os passos candidatos; entre eles,
+    os passos são ordenados pelo limite superior de confiança (UCB):
+
+        média da posterior + c * sqrt(ln(N) / n)
+
+    A seleção é determinística para uma mesma posterior, o que mantém os
+    rituais compatíveis com o cache por estado quantizado.
+    """
+
+    def __init__(self, step_ids: Sequence[str], prior_alpha: float = 1.0,
+                 prior_beta: float = 1.0, exploration: float = 0.5):
+        self.step_ids = tuple(step_ids)
+        self.step_index = {step_id: i for i, step_id in enumerate(self.step_ids)}
+        self.prior_alpha = prior_alpha
+        self.prior_beta = prior_beta
+        self.exploration = exploration
+
+    @property
+    def n_steps(self) -> int:
+        return len(self.step_ids)
+
+    def new_params(self) -> np.ndarray:
+        """Parâmetros iniciais (prior) para um novo usuário"""
+        params = np.empty((2, self.n_steps), dtype=np.float32)
+        params[0] = self.prior_alpha
+        params[1] = self.prior_beta
+        return params
+
+    def params_from_means(self, means: np.ndarray) -> np.ndarray:
+        """Prior informativo com a mesma massa do prior padrão, centrado em `means`"""
+        mass = self.prior_alpha + self.prior_beta
+        means = np.clip(np.asarray(means, dtype=np.float64), 0.01, 0.99)
+        return np.stack([means * mass, (1.0 - means) * mass]).astype(np.float32)
+
+    def indices(self, step_ids: Iterable[str]) -> List[int]:
+        return [self.step_index[step_id] for step_id in step_ids if step_id in self.step_index]
+
+    def scores(self, params: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        """Pontuação UCB de todos os candidatos em uma operação vetorizada"""
+        alpha = params[0, candidates].astype(np.float64)
+        beta = params[1, candidates].astype(np.float64)
+        trials = alpha + beta
+        pulls = np.maximum(trials - (self.prior_alpha + self.prior_beta), 0.0)
+        total = pulls.sum() + 1.0
+        return alpha / trials + self.exploration * np.sqrt(np.log(total) / trials)
+
+    def select(self, params: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+        """
+        Índices dos k melhores candidatos, preservando a ordem original dos
+        candidatos entre os selecionados (e em empates)
+        """
+        if len(candidates) <= k:
+            return candidates
+        order = np.argsort(-self.scores(params, candidates), kind='stable')[:k]
+        return candidates[np.sort(order)]
+
+    def update(self, params: np.ndarray, step_indices: Sequence[int], reward: float):
+        """Atualiza a posterior dos passos executados (O(1) por passo)"""
+        update_posteriors(params, step_indices, reward)
+
+    def posterior_means(self, params: np.ndarray) -> Dict[str, float]:
+        means = params[0] / (params[0] + params[1])
+        return dict(zip(self.step_ids, means.tolist()))
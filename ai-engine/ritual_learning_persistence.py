@@ -0,0 +1,290 @@
+"""
+Persistência do Aprendizado dos Rituais - Kairos AI Engine
+Grava os feedbacks de rituais por usuário no SQLite da aplicação como eventos
+(append-only, com escrita em lote) e compacta os eventos em snapshots do estado
+"""
+
+import atexit
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ritual_learning_state import EffectivenessRings, UserLearningState, apply_feedback_event
+
+logger = logging.getLogger(__name__)
+
+# Banco SQLite compartilhado com o backend
+DEFAULT_DATABASE_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', 'backend', 'kairos-backend', 'src', 'database', 'app.db'
+))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ritual_learning_state (
+    user_id TEXT PRIMARY KEY,
+    state BLOB NOT NULL,
+    preferences TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    last_event_id INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS ritual_learning_event (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_ritual_learning_event_user ON ritual_learning_event (user_id, id);
+"""
+
+# Leituras otimistas antes de esperar o lock de gravação (ver RitualLearningRepository.load)
+_READ_ATTEMPTS = 3
+
+def _pack_arrays(arrays: Dict[str, np.ndarray]) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+def _unpack_arrays(blob: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+def _state_arrays(state: UserLearningState) -> Dict[str, np.ndarray]:
+    arrays = dict(state.effectiveness.to_arrays())
+    if state.step_params is not None:
+        arrays['step_params'] = state.step_params
+    return arrays
+
+def _restore_snapshot(row) -> UserLearningState:
+    arrays = _unpack_arrays(row[0])
+    return UserLearningState.restore(
+        EffectivenessRings.from_arrays(arrays), json.loads(row[1]),
+        step_params=arrays['step_params'].copy() if 'step_params' in arrays else None
+    )
+
+def _same_shape(state: UserLearningState, template: UserLearningState) -> bool:
+    if state.effectiveness.scores.shape != template.effectiveness.scores.shape:
+        return False
+    if template.step_params is None:
+        return True
+    return state.step_params is not None and state.step_params.shape == template.step_params.shape
+
+class RitualLearningRepository:
+    """
+    Repositório do estado aprendido do AdaptiveRitualEngine.
+
+    - Eventos: cada feedback vira uma linha em `ritual_learning_event`
+      (passos, componentes, score, preferências). Workers só inserem, então
+      feedbacks de processos diferentes nunca se sobrescrevem
+    - Leitura: snapshot do usuário + eventos posteriores a ele, na ordem de
+      gravação, + eventos deste processo ainda não gravados. A leitura não
+      segura o lock de gravação: um contador de gravações (par: ocioso, ímpar:
+      gravando) detecta um lote gravado durante a leitura, que é refeita
+    - Compactação: com `compact_threshold` eventos após o snapshot, a leitura
+      os incorpora a um novo snapshot e apaga os eventos incorporados, em uma
+      transação IMMEDIATE (o resultado é o mesmo em qualquer worker)
+    - Escrita em lote: os eventos pendentes são gravados em uma única
+      transação quando o intervalo `flush_interval_seconds` vence ou
+      `flush_threshold` eventos estão pendentes
+    - Encerramento: `close()` (também registrado no atexit) grava o restante
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DATABASE_PATH,
+                 flush_interval_seconds: float = 5.0, flush_threshold: int = 100,
+                 compact_threshold: int = 50):
+        self.db_path = db_path
+        self.flush_interval_seconds = flush_interval_seconds
+        self.flush_threshold = flush_threshold
+        self.compact_threshold = compact_threshold
+
+        self._pending: List[Tuple[str, Dict]] = []  # (user_id, evento) na ordem dos feedbacks
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # uma gravação por vez
+        self._flush_generation = 0  # protegido por _pending_lock; ímpar durante uma gravação
+        self._closed = threading.Event()
+
+        with closing(self._connect()) as conn, conn:
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(ritual_learning_state)')}
+            if columns and 'last_event_id' not in columns:
+                # Bancos criados antes dos eventos
+                conn.execute(
+                    'ALTER TABLE ritual_learning_state ADD COLUMN last_event_id INTEGER NOT NULL DEFAULT 0'
+                )
+            conn.executescript(SCHEMA)
+
+        self._flusher = threading.Thread(
+            target=self._flush_periodically, name='ritual-learning-flusher', daemon=True
+        )
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, user_id: str):
+        """Snapshot (ou None) e eventos posteriores a ele: [(id, evento)], na transação aberta"""
+        row = conn.execute(
+            'SELECT state, preferences, last_event_id FROM ritual_learning_state WHERE user_id = ?',
+            (user_id,)
+        ).fetchone()
+        events = conn.execute(
+            'SELECT id, event FROM ritual_learning_event WHERE user_id = ? AND id > ? ORDER BY id',
+            (user_id, row[2] if row else 0)
+        ).fetchall()
+        return row, [(event_id, json.loads(event)) for event_id, event in events]
+
+    @staticmethod
+    def _replay(row, events, new_state: Callable[[], UserLearningState]) -> UserLearningState:
+        template = new_state()
+        state = _restore_snapshot(row) if row is not None else template
+        if not _same_shape(state, template):
+            # Snapshot de outra configuração de componentes/catálogo: recomeçar
+            state = template
+        for _, event in events:
+            apply_feedback_event(state, event)
+        return state
+
+    def load(self, user_id, new_state: Callable[[], UserLearningState]) -> Optional[UserLearningState]:
+        """
+        Estado atual do usuário (None se não houver nada gravado nem pendente).
+        `new_state` cria o estado inicial sobre o qual os eventos são aplicados.
+        """
+        key = str(user_id)
+        row, events, local = self._read_consistent(key)
+        if row is None and not events and not local:
+            return None
+        state = self._replay(row, events + [(None, event) for event in local], new_state)
+        if len(events) >= self.compact_threshold:
+            self._compact(key, new_state)
+        return state
+
+    def _read_stored(self, user_id: str):
+        # Snapshot e eventos na mesma transação: uma compactação concorrente não some com eventos
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN')
+            try:
+                return self._read(conn, user_id)
+            finally:
+                conn.rollback()
+
+    def _read_consistent(self, user_id: str):
+        """
+        Snapshot, eventos gravados e eventos pendentes do usuário sem que um lote
+        apareça duas vezes (pendente e gravado) ou em nenhuma das duas
+        """
+        for _ in range(_READ_ATTEMPTS):
+            with self._pending_lock:
+                generation = self._flush_generation
+            if generation % 2 == 0:
+                row, events = self._read_stored(user_id)
+                with self._pending_lock:
+                    if self._flush_generation == generation:
+                        local = [event for pending_id, event in self._pending if pending_id == user_id]
+                        return row, events, local
+            # Gravação em andamento: esperar que termine e tentar de novo
+            with self._flush_lock:
+                pass
+
+        with self._flush_lock:
+            row, events = self._read_stored(user_id)
+            with self._pending_lock:
+                local = [event for pending_id, event in self._pending if pending_id == user_id]
+        return row, events, local
+
+    def _compact(self, user_id: str, new_state: Callable[[], UserLearningState]):
+        """Incorpora os eventos gravados do usuário ao snapshot e os apaga"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row, events = self._read(conn, user_id)
+            if events:
+                state = self._replay(row, events, new_state)
+                last_event_id = events[-1][0]
+                conn.execute(
+                    'INSERT INTO ritual_learning_state (user_id, state, preferences, updated_at, last_event_id) '
+                    'VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, '
+                    'preferences = excluded.preferences, updated_at = excluded.updated_at, '
+                    'last_event_id = excluded.last_event_id',
+                    (user_id, _pack_arrays(_state_arrays(state)), json.dumps(state.preferences),
+                     datetime.utcnow().isoformat(), last_event_id)
+                )
+                conn.execute(
+                    'DELETE FROM ritual_learning_event WHERE user_id = ? AND id <= ?',
+                    (user_id, last_event_id)
+                )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            logger.exception(f"Falha ao compactar eventos de aprendizado do usuário {user_id}")
+        finally:
+            conn.close()
+
+    def record(self, user_id, event: Dict):
+        """
+        Agenda a gravação de um evento de feedback (sem acesso ao banco).
+        O evento é o mesmo já aplicado ao estado em memória (ver apply_feedback_event).
+        """
+        with self._pending_lock:
+            self._pending.append((str(user_id), event))
+            pending_count = len(self._pending)
+
+        if pending_count >= self.flush_threshold:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Grava todos os eventos pendentes em uma única transação
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+                if not batch:
+                    return 0
+                self._flush_generation += 1
+
+            now = datetime.utcnow().isoformat()
+            rows = [(user_id, json.dumps(event), now) for user_id, event in batch]
+
+            try:
+                with closing(self._connect()) as conn, conn:
+                    conn.executemany(
+                        'INSERT INTO ritual_learning_event (user_id, event, created_at) VALUES (?, ?, ?)',
+                        rows
+                    )
+            except sqlite3.Error:
+                # Devolver ao buffer antes dos eventos registrados durante a gravação
+                with self._pending_lock:
+                    self._pending[:0] = batch
+                    self._flush_generation += 1
+                logger.exception("Falha ao gravar eventos de aprendizado dos rituais")
+                return 0
+
+            with self._pending_lock:
+                self._flush_generation += 1
+
+        logger.info(f"{len(rows)} eventos de aprendizado gravados")
+        return len(rows)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval_seconds):
+            self.flush()
+
+    def close(self):
+        """
+        Interrompe a gravação periódica e grava o que estiver pendente
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._flusher.join(timeout=self.flush_interval_seconds)
+        self.flush()
+        atexit.unregister(self.close)
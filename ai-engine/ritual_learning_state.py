@@ -0,0 +1,337 @@
+"""
+Estado de Aprendizado dos Rituais - Kairos AI Engine
+Estatísticas de efetividade em memória limitada, com despejo LRU/TTL por usuário
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ritual_bandit import update_posteriors
+
+# Gerações únicas no processo para `UserLearningState.version`: um estado recriado
+# (após despejo ou releitura) nunca repete a versão de um estado anterior
+_generations = itertools.count(1)
+
+def next_generation() -> int:
+    return next(_generations)
+
+# Custo fixo estimado por usuário além dos arrays (objetos Python, dict de preferências)
+USER_STATE_OVERHEAD_BYTES = 1024
+
+def default_user_preferences() -> Dict:
+    return {
+        'preferred_duration': 10,  # minutos
+        'detailed_instructions': False,
+        'preferred_components': [],
+        'avoided_components': []
+    }
+
+def apply_preference_feedback(prefs: Dict, feedback: Dict):
+    """Aplica o feedback de duração e clareza às preferências"""
+    # Atualizar duração preferida
+    if 'duration_feedback' in feedback:
+        if feedback['duration_feedback'] == 'too_short':
+            prefs['preferred_duration'] = min(30, prefs['preferred_duration'] + 2)
+        elif feedback['duration_feedback'] == 'too_long':
+            prefs['preferred_duration'] = max(5, prefs['preferred_duration'] - 2)
+
+    # Atualizar preferência por instruções detalhadas
+    if 'instruction_clarity' in feedback:
+        if feedback['instruction_clarity'] < 0.5:
+            prefs['detailed_instructions'] = True
+
+def apply_feedback_event(state: 'UserLearningState', event: Dict):
+    """
+    Aplica um evento de feedback ao estado. O evento é a unidade persistida,
+    então replicar os mesmos eventos na mesma ordem reconstrói o mesmo estado:
+
+        {'steps': [índices no catálogo], 'components': [índices de componente],
+         'score': efetividade 0-1, 'preferences': {duration_feedback, instruction_clarity}}
+    """
+    state.version = next_generation()
+    steps = event.get('steps') or []
+    if steps and state.step_params is not None:
+        # Índices fora do catálogo atual (catálogo mudou desde o evento) são ignorados
+        steps = [i for i in steps if i < state.step_params.shape[1]]
+        update_posteriors(state.step_params, steps, event['score'])
+    for index in event.get('components') or []:
+        if index < len(state.effectiveness.counts):
+            state.effectiveness.add(index, event['score'])
+    apply_preference_feedback(state.preferences, event.get('preferences') or {})
+
+class EffectivenessRings:
+    """
+    Buffers circulares de tamanho fixo (um por componente) com somas acumuladas.
+    Atualização e média em O(1), sem realocação.
+    """
+    __slots__ = ('scores', 'heads', 'counts', 'sums')
+
+    def __init__(self, n_components: int, window: int = 20):
+        self.scores = np.zeros((n_components, window), dtype=np.float64)
+        self.heads = np.zeros(n_components, dtype=np.int32)
+        self.counts = np.zeros(n_components, dtype=np.int32)
+        self.sums = np.zeros(n_components, dtype=np.float64)
+
+    @property
+    def window(self) -> int:
+        return self.scores.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.scores.nbytes + self.heads.nbytes + self.counts.nbytes + self.sums.nbytes
+
+    def add(self, index: int, score: float):
+        """Insere um score no buffer do componente, descartando o mais antigo"""
+        head = self.heads[index]
+        value = float(score)
+        if self.counts[index] == self.window:
+            self.sums[index] -= self.scores[index, head]
+        else:
+            self.counts[index] += 1
+        self.scores[index, head] = value
+        self.sums[index] += value
+        self.heads[index] = (head + 1) % self.window
+
+    def mean(self, index: int) -> Optional[float]:
+        count = self.counts[index]
+        if count == 0:
+            return None
+        return float(self.sums[index] / count)
+
+    def means(self) -> np.ndarray:
+        """Médias de todos os componentes (NaN onde não há histórico)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts > 0, self.sums / np.maximum(self.counts, 1), np.nan)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {'scores': self.scores, 'heads': self.heads, 'counts': self.counts, 'sums': self.sums}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'EffectivenessRings':
+        rings = cls.__new__(cls)
+        rings.scores = np.array(arrays['scores'], dtype=np.float64)
+        rings.heads = np.array(arrays['heads'], dtype=np.int32)
+        rings.counts = np.array(arrays['counts'], dtype=np.int32)
+        rings.sums = np.array(arrays['sums'], dtype=np.float64)
+        return rings
+
+    def history(self, index: int) -> List[float]:
+        """Scores do componente em ordem cronológica"""
+        count = self.counts[index]
+        start = (self.heads[index] - count) % self.window
+        order = (start + np.arange(count)) % self.window
+        return self.scores[index, order].tolist()
+
+class UserLearningState:
+    """
+    Estado aprendido de um usuário: efetividade por componente, posteriores
+    do bandit de passos (`step_params`) e preferências.
+    `version` recebe uma nova geração (única no processo) na criação, na
+    carga e a cada feedback, e invalida respostas em cache.
+    `loaded_at` marca quando o estado foi lido da fonte (ver `refresh_seconds`).
+    """
+    __slots__ = ('effectiveness', 'step_params', 'preferences', 'version', 'last_access', 'loaded_at')
+
+    def __init__(self, n_components: int, window: int, step_params: Optional[np.ndarray] = None):
+        self.effectiveness = EffectivenessRings(n_components, window)
+        self.step_params = step_params
+        self.preferences = default_user_preferences()
+        self.version = next_generation()
+        self.last_access = time.monotonic()
+        self.loaded_at = self.last_access
+
+    @property
+    def nbytes(self) -> int:
+        step_bytes = self.step_params.nbytes if self.step_params is not None else 0
+        return self.effectiveness.nbytes + step_bytes + USER_STATE_OVERHEAD_BYTES
+
+    def snapshot(self) -> 'UserLearningState':
+        """Cópia independente (para gravação assíncrona sem corrida com novos feedbacks)"""
+        return UserLearningState.restore(
+            EffectivenessRings.from_arrays(self.effectiveness.to_arrays()),
+            {key: list(value) if isinstance(value, list) else value
+             for key, value in self.preferences.items()},
+            version=self.version,
+            step_params=self.step_params.copy() if self.step_params is not None else None
+        )
+
+    @classmethod
+    def restore(cls, effectiveness: EffectivenessRings, preferences: Dict,
+                version: Optional[int] = None, step_params: Optional[np.ndarray] = None) -> 'UserLearningState':
+        state = cls.__new__(cls)
+        state.effectiveness = effectiveness
+        state.step_params = step_params
+        state.preferences = {**default_user_preferences(), **preferences}
+        state.version = version if version is not None else next_generation()
+        state.last_access = time.monotonic()
+        state.loaded_at = state.last_access
+        return state
+
+class UserStateStore:
+    """
+    Armazena o estado aprendido por usuário com política de despejo:
+    - LRU: usuários menos recentemente acessados saem primeiro
+    - TTL: estados sem acesso há mais de `ttl_seconds` expiram
+    - Teto de memória: o total estimado não ultrapassa `max_bytes`
+    
+    Com um `loader(user_id, new_state)`, usuários ausentes da memória são
+    carregados sob demanda (ex.: do SQLite) no primeiro acesso; ausências são
+    lembradas em um cache negativo limitado para não consultar a fonte a cada
+    requisição. Com `refresh_seconds`, estados carregados e ausências expiram
+    e são relidos da fonte, para enxergar o aprendizado gravado por outros
+    workers.
+    """
+
+    def __init__(self, component_names: Sequence[str], window: int = 20,
+                 max_users: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 max_bytes: Optional[int] = 64 * 1024 * 1024,
+                 loader: Optional[Callable[[object], Optional[UserLearningState]]] = None,
+                 max_known_absent: int = 10000,
+                 new_step_params: Optional[Callable[[], np.ndarray]] = None,
+                 refresh_seconds: Optional[float] = None):
+        self.component_index = {name: i for i, name in enumerate(component_names)}
+        self.window = window
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.resident_bytes = 0
+        self.evictions = 0
+        self.loader = loader
+        self.new_step_params = new_step_params
+        self.max_known_absent = max_known_absent
+        self.refresh_seconds = refresh_seconds
+        self._states = OrderedDict()
+        self._known_absent = OrderedDict()  # user_id -> instante da consulta
+        # Protege apenas a estrutura LRU; mutações do estado de cada usuário
+        # são serializadas pelo chamador (ex.: ShardedLock por usuário)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __contains__(self, user_id) -> bool:
+        return self.get(user_id) is not None
+
+    def _expired(self, checked_at: float, now: float) -> bool:
+        return self.refresh_seconds is not None and now - checked_at > self.refresh_seconds
+
+    def get(self, user_id) -> Optional[UserLearningState]:
+        """Retorna o estado do usuário (marcando o acesso) ou None"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._states.get(user_id)
+            if state is not None:
+                if self.ttl_seconds is not None and now - state.last_access > self.ttl_seconds:
+                    self._remove(user_id)
+                    state = None
+                else:
+                    state.last_access = now
+                    self._states.move_to_end(user_id)
+                    if self.loader is None or not self._expired(state.loaded_at, now):
+                        return state
+
+            if self.loader is None:
+                return None
+            if state is None:
+                checked_at = self._known_absent.get(user_id)
+                if checked_at is not None and not self._expired(checked_at, now):
+                    return None
+
+        # Leitura da fonte fora do lock para não bloquear os demais usuários
+        loaded = self._load(user_id)
+
+        with self._lock:
+            current = self._states.get(user_id)
+            if current is not None and current is not state:
+                return current  # carregado por outra thread nesse meio tempo
+            if loaded is None:
+                if current is not None:
+                    # Estado criado localmente e ainda sem nada gravado na fonte
+                    current.loaded_at = time.monotonic()
+                    return current
+                self._known_absent[user_id] = time.monotonic()
+                self._known_absent.move_to_end(user_id)
+                if len(self._known_absent) > self.max_known_absent:
+                    self._known_absent.popitem(last=False)
+                return None
+            if current is not None:
+                # Releitura: substitui o estado antigo sem contar como despejo
+                self.resident_bytes -= self._states.pop(user_id).nbytes
+            self._known_absent.pop(user_id, None)
+            self._insert(user_id, loaded)
+            return loaded
+
+    def new_state(self) -> UserLearningState:
+        """Estado inicial de um usuário sem histórico"""
+        return UserLearningState(len(self.component_index), self.window, self._initial_step_params())
+
+    def get_or_create(self, user_id) -> UserLearningState:
+        state = self.get(user_id)
+        if state is not None:
+            return state
+
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is None:
+                state = self.new_state()
+                self._known_absent.pop(user_id, None)
+                self._insert(user_id, state)
+            return state
+
+    def _load(self, user_id) -> Optional[UserLearningState]:
+        state = self.loader(user_id, self.new_state)
+        expected_shape = (len(self.component_index), self.window)
+        if state is None or state.effectiveness.scores.shape != expected_shape:
+            # Estado gravado com outra configuração de componentes/janela: recomeçar
+            return None
+
+        initial = self._initial_step_params()
+        if initial is not None and (state.step_params is None or
+                                    state.step_params.shape != initial.shape):
+            # Catálogo de passos mudou: reiniciar apenas as posteriores do bandit
+            state.step_params = initial
+        return state
+
+    def _initial_step_params(self) -> Optional[np.ndarray]:
+        return self.new_step_params() if self.new_step_params else None
+
+    def _insert(self, user_id, state: UserLearningState):
+        self._states[user_id] = state
+        self.resident_bytes += state.nbytes
+        self._evict()
+
+    def _remove(self, user_id):
+        state = self._states.pop(user_id)
+        self.resident_bytes -= state.nbytes
+        self.evictions += 1
+
+    def _evict(self):
+        """Aplica TTL, limite de usuários e teto de memória, do mais antigo ao mais novo"""
+        if self.ttl_seconds is not None:
+            cutoff = time.monotonic() - self.ttl_seconds
+            while self._states:
+                oldest_id, oldest = next(iter(self._states.items()))
+                if oldest.last_access >= cutoff:
+                    break
+                self._remove(oldest_id)
+
+        # Sempre mantém ao menos o usuário mais recente
+        while len(self._states) > 1 and (
+            (self.max_users is not None and len(self._states) > self.max_users) or
+            (self.max_bytes is not None and self.resident_bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._states)))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'users': len(self._states),
+                'resident_bytes': self.resident_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,197 @@
+"""
+Priors de Efetividade dos Rituais - Kairos AI Engine
+Agrega periodicamente as execuções de rituais de todos os usuários em uma tabela
+pequena de priors por tipo de ritual e faixa horária, lida pelo motor na inicialização
+"""
+
+import logging
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from ritual_learning_persistence import DEFAULT_DATABASE_PATH
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Faixas horárias dos priors (horas inclusivas); o restante é 'night'
+TIME_BUCKETS = (
+    ('morning', 5, 11),
+    ('afternoon', 12, 17),
+    ('evening', 18, 22),
+)
+ALL_DAY = 'all'
+
+# Tipos do backend (`rituals.ritual_type`) -> tipos do motor (valores de RitualType).
+# 'custom' e tipos sem correspondência entram só no agregado de todos os tipos
+BACKEND_RITUAL_TYPES = {
+    'morning': ('morning',),
+    'evening': ('evening',),
+    'break': ('stress_relief', 'energy_boost', 'transition', 'mindfulness'),
+}
+ALL_TYPES = '*'
+
+# Peso (em execuções) do prior do tipo ao suavizar a média de cada faixa
+SHRINKAGE_EXECUTIONS = 10
+
+PRIORS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ritual_effectiveness_priors (
+    ritual_type TEXT NOT NULL,
+    time_bucket TEXT NOT NULL,
+    sample_count INTEGER NOT NULL,
+    mean_effectiveness REAL NOT NULL,
+    shrunk_effectiveness REAL NOT NULL,
+    effectiveness_variance REAL NOT NULL,
+    duration_ratio REAL,
+    computed_at TEXT NOT NULL,
+    PRIMARY KEY (ritual_type, time_bucket)
+)
+"""
+
+def _time_bucket_sql(column: str) -> str:
+    hour = f"CAST(strftime('%H', {column}) AS INTEGER)"
+    cases = ' '.join(f"WHEN {hour} BETWEEN {start} AND {end} THEN '{name}'"
+                     for name, start, end in TIME_BUCKETS)
+    return f"CASE {cases} ELSE 'night' END"
+
+# completion_rating (1-5) é normalizado para efetividade 0-1. A média de cada
+# faixa é suavizada em direção à média do tipo (funções de janela), e cada
+# tipo também recebe uma linha agregada para o dia inteiro.
+PRIORS_QUERY = f"""
+WITH executions AS (
+    SELECT
+        r.ritual_type AS ritual_type,
+        {_time_bucket_sql('e.executed_at')} AS time_bucket,
+        (MIN(MAX(e.completion_rating, 1), 5) - 1) / 4.0 AS effectiveness,
+        CASE WHEN r.duration_minutes > 0 AND e.duration_actual IS NOT NULL
+             THEN e.duration_actual * 1.0 / r.duration_minutes END AS duration_ratio
+    FROM ritual_executions e
+    JOIN rituals r ON r.id = e.ritual_id
+    WHERE e.completion_rating IS NOT NULL AND e.executed_at IS NOT NULL
+),
+by_bucket AS (
+    SELECT ritual_type, time_bucket,
+           COUNT(*) AS sample_count,
+           AVG(effectiveness) AS mean_effectiveness,
+           AVG(effectiveness * effectiveness) AS mean_square,
+           AVG(duration_ratio) AS duration_ratio,
+           SUM(COALESCE(duration_ratio, 0)) AS duration_ratio_sum,
+           COUNT(duration_ratio) AS duration_ratio_count
+    FROM executions
+    GROUP BY ritual_type, time_bucket
+),
+with_type AS (
+    SELECT *,
+           SUM(sample_count * mean_effectiveness) OVER by_type * 1.0
+               / SUM(sample_count) OVER by_type AS type_mean,
+           SUM(sample_count * mean_square) OVER by_type * 1.0
+               / SUM(sample_count) OVER by_type AS type_mean_square,
+           SUM(sample_count) OVER by_type AS type_count,
+           SUM(duration_ratio_sum) OVER by_type AS type_duration_sum,
+           SUM(duration_ratio_count) OVER by_type AS type_duration_count,
+           ROW_NUMBER() OVER by_type AS type_row
+    FROM by_bucket
+    WINDOW by_type AS (PARTITION BY ritual_type)
+)
+SELECT ritual_type, time_bucket, sample_count, mean_effectiveness,
+       (sample_count * mean_effectiveness + {SHRINKAGE_EXECUTIONS} * type_mean)
+           / (sample_count + {SHRINKAGE_EXECUTIONS}),
+       MAX(mean_square - mean_effectiveness * mean_effectiveness, 0),
+       duration_ratio
+FROM with_type
+UNION ALL
+SELECT ritual_type, '{ALL_DAY}', type_count, type_mean, type_mean,
+       MAX(type_mean_square - type_mean * type_mean, 0),
+       CASE WHEN type_duration_count > 0 THEN type_duration_sum / type_duration_count END
+FROM with_type
+WHERE type_row = 1
+"""
+
+def time_bucket_for_hour(hour: int) -> str:
+    for name, start, end in TIME_BUCKETS:
+        if start <= hour <= end:
+            return name
+    return 'night'
+
+def refresh_ritual_priors(db_path: str = DEFAULT_DATABASE_PATH) -> int:
+    """
+    Recalcula a tabela de priors a partir de todas as execuções (job periódico).
+    A substituição acontece em uma única transação.
+    """
+    computed_at = datetime.utcnow().isoformat()
+    with sqlite3.connect(db_path, timeout=30) as conn:
+        conn.execute(PRIORS_SCHEMA)
+        rows = [row + (computed_at,) for row in conn.execute(PRIORS_QUERY)]
+        conn.execute('DELETE FROM ritual_effectiveness_priors')
+        conn.executemany(
+            'INSERT INTO ritual_effectiveness_priors (ritual_type, time_bucket, sample_count, '
+            'mean_effectiveness, shrunk_effectiveness, effectiveness_variance, duration_ratio, '
+            'computed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            rows
+        )
+
+    logger.info(f"Priors de rituais recalculados: {len(rows)} linhas")
+    return len(rows)
+
+class RitualPriors:
+    """
+    Priors de efetividade por (tipo de ritual do motor, faixa horária),
+    carregados uma única vez e consultados em memória pelo motor.
+
+    A tabela guarda os tipos do backend; `load` os traduz com
+    BACKEND_RITUAL_TYPES e acrescenta, por faixa, a média de todos os tipos
+    (ALL_TYPES), usada pelos tipos do motor sem execuções correspondentes
+    """
+
+    def __init__(self, priors: Optional[Dict[Tuple[str, str], Tuple[float, int]]] = None):
+        self.priors = priors or {}
+
+    @classmethod
+    def load(cls, db_path: str = DEFAULT_DATABASE_PATH) -> 'RitualPriors':
+        try:
+            with closing(sqlite3.connect(db_path, timeout=30)) as conn:
+                rows = conn.execute(
+                    'SELECT ritual_type, time_bucket, shrunk_effectiveness, sample_count '
+                    'FROM ritual_effectiveness_priors'
+                ).fetchall()
+        except sqlite3.OperationalError:
+            logger.warning("Tabela de priors de rituais indisponível; usando prior neutro")
+            return cls()
+
+        priors = {}
+        totals: Dict[str, Tuple[float, int]] = {}
+        for backend_type, bucket, mean, count in rows:
+            for ritual_type in BACKEND_RITUAL_TYPES.get(backend_type, ()):
+                priors[(ritual_type, bucket)] = (mean, count)
+            weighted, samples = totals.get(bucket, (0.0, 0))
+            totals[bucket] = (weighted + mean * count, samples + count)
+        for bucket, (weighted, samples) in totals.items():
+            if samples:
+                priors[(ALL_TYPES, bucket)] = (weighted / samples, samples)
+        return cls(priors)
+
+    def __bool__(self) -> bool:
+        return bool(self.priors)
+
+    def effectiveness(self, ritual_type: str, time_bucket: str = ALL_DAY,
+                      default: float = 0.5) -> float:
+        """Efetividade esperada, recorrendo ao agregado do tipo, ao de todos os tipos e ao padrão"""
+        for key in ((ritual_type, time_bucket), (ritual_type, ALL_DAY),
+                    (ALL_TYPES, time_bucket), (ALL_TYPES, ALL_DAY)):
+            prior = self.priors.get(key)
+            if prior:
+                return prior[0]
+        return default
+
+def main():
+    """
+    Execução periódica (ex.: cron) do job de agregação
+    """
+    refresh_ritual_priors()
+    priors = RitualPriors.load()
+    for (ritual_type, bucket), (mean, count) in sorted(priors.priors.items()):
+        print(f"{ritual_type:>15} {bucket:>10}: {mean:.2f} ({count} execuções)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Locks Particionados - Kairos AI Engine
+Exclusão mútua por usuário sem um lock global que serialize todas as requisições
+"""
+
+import threading
+from typing import Hashable
+
+class ShardedLock:
+    """
+    Conjunto fixo de locks reentrantes; cada chave (ex.: user_id) sempre cai
+    no mesmo shard. Requisições de usuários em shards diferentes rodam em
+    paralelo, e a memória não cresce com o número de usuários.
+    """
+
+    def __init__(self, n_shards: int = 64):
+        self._locks = tuple(threading.RLock() for _ in range(n_shards))
+
+    def for_key(self, key: Hashable) -> threading.RLock:
+        return self._locks[hash(key) % len(self._locks)]
@@ -1,13 +1,136 @@
 # ai-engine/task-optimizer.py
 import json
 import numpy as np
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional
+
+from sharded_locks import ShardedLock
+from timezone_buckets import local_time_fields
+
+def _parse_completed_at(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _epoch(completed_time: datetime) -> float:
+    """Epoch do horário (sem fuso = UTC)"""
+    aware = completed_time if completed_time.tzinfo else completed_time.replace(tzinfo=timezone.utc)
+    return aware.timestamp()
+
+class HourlyProductivityStats:
+    """Agregado incremental de eficiência por hora do dia (24 slots)
+    
+    Mantém contagem, soma e soma dos quadrados de `efficiency_score` por hora,
+    atualizados em O(1) a cada tarefa concluída e serializáveis em JSON.
+    A hora é a do fuso `timezone_name` do usuário, quando informado; sem fuso,
+    vale o relógio do próprio `completed_at`.
+    """
+    
+    def __init__(self):
+        self.counts = np.zeros(24, dtype=np.int64)
+        self.sums = np.zeros(24, dtype=np.float64)
+        self.sums_sq = np.zeros(24, dtype=np.float64)
+        self.total_tasks = 0
+    
+    def add(self, hour: int, efficiency_score: float):
+        """Adiciona uma observação de eficiência no slot da hora"""
+        self.counts[hour] += 1
+        self.sums[hour] += efficiency_score
+        self.sums_sq[hour] += efficiency_score * efficiency_score
+    
+    def add_task(self, task: Dict, timezone_name: Optional[str] = None) -> bool:
+        """Adiciona uma tarefa concluída; retorna False se não houver horário válido"""
+        self.total_tasks += 1
+        completed_time = _parse_completed_at(task.get('completed_at'))
+        if completed_time is None:
+            return False
+        
+        if timezone_name:
+            hour = int(local_time_fields([_epoch(completed_time)], timezone_name)[0][0])
+        else:
+            hour = completed_time.hour
+        
+        # Score baseado na eficiência (assumindo que temos dados de tempo estimado vs real)
+        self.add(hour, task.get('efficiency_score', 0.8))  # Default 80%
+        return True
+    
+    def add_tasks(self, tasks: List[Dict], timezone_name: Optional[str] = None) -> int:
+        """Adiciona um lote de tarefas concluídas; as horas locais de todo o lote
+        são calculadas de uma vez. Retorna quantas tinham horário válido."""
+        self.total_tasks += len(tasks)
+        hours, epochs, scores = [], [], []
+        for task in tasks:
+            completed_time = _parse_completed_at(task.get('completed_at'))
+            if completed_time is None:
+                continue
+            hours.append(completed_time.hour)
+            epochs.append(_epoch(completed_time))
+            scores.append(task.get('efficiency_score', 0.8))  # Default 80%
+        
+        if not scores:
+            return 0
+        hours = local_time_fields(epochs, timezone_name)[0] if timezone_name else np.array(hours)
+        scores = np.asarray(scores, dtype=np.float64)
+        self.counts += np.bincount(hours, minlength=24)
+        self.sums += np.bincount(hours, weights=scores, minlength=24)
+        self.sums_sq += np.bincount(hours, weights=scores * scores, minlength=24)
+        return len(scores)
+    
+    def hourly_averages(self) -> Dict[int, float]:
+        """Médias por hora, apenas para as horas com dados"""
+        hours = np.flatnonzero(self.counts)
+        means = self.sums[hours] / self.counts[hours]
+        return {int(hour): float(mean) for hour, mean in zip(hours, means)}
+    
+    def hourly_std(self) -> Dict[int, float]:
+        """Desvio padrão por hora, apenas para as horas com dados"""
+        hours = np.flatnonzero(self.counts)
+        means = self.sums[hours] / self.counts[hours]
+        variances = np.maximum(self.sums_sq[hours] / self.counts[hours] - means ** 2, 0.0)
+        return {int(hour): float(std) for hour, std in zip(hours, np.sqrt(variances))}
+    
+    def band_average(self, start_hour: int, end_hour: int):
+        """Média das médias horárias em uma faixa [start_hour, end_hour], ou None"""
+        counts = self.counts[start_hour:end_hour + 1]
+        mask = counts > 0
+        if not mask.any():
+            return None
+        return float(np.mean(self.sums[start_hour:end_hour + 1][mask] / counts[mask]))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'counts': self.counts.tolist(),
+            'sums': self.sums.tolist(),
+            'sums_sq': self.sums_sq.tolist(),
+            'total_tasks': self.total_tasks
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HourlyProductivityStats':
+        stats = cls()
+        stats.counts = np.asarray(data['counts'], dtype=np.int64)
+        stats.sums = np.asarray(data['sums'], dtype=np.float64)
+        stats.sums_sq = np.asarray(data['sums_sq'], dtype=np.float64)
+        stats.total_tasks = int(data.get('total_tasks', 0))
+        return stats
+    
+    def copy(self) -> 'HourlyProductivityStats':
+        stats = HourlyProductivityStats()
+        stats.counts = self.counts.copy()
+        stats.sums = self.sums.copy()
+        stats.sums_sq = self.sums_sq.copy()
+        stats.total_tasks = self.total_tasks
+        return stats
 
 class TaskOptimizer:
     def __init__(self):
         self.user_preferences = {}
         self.energy_patterns = {}
+        self.productivity_stats = {}  # user_id -> HourlyProductivityStats
+        self.user_locks = ShardedLock()  # serializa atualizações de um mesmo usuário
         self.presence_weights = {
             'morning': 0.8,
             'afternoon': 0.6,
@@ -214,31 +337,40 @@ class TaskOptimizer:
                 'suggestion': 'Pausa respiratória consciente'
             }
     
-    def analyze_productivity_patterns(self, completed_tasks: List[Dict]) -> Dict[str, Any]:
-        """Analisa padrões de produtividade para melhorar futuras otimizações"""
-        if not completed_tasks:
-            return {'message': 'Dados insuficientes para análise'}
-        
-        # Análise de horários mais produtivos
-        hourly_productivity = {}
-        for task in completed_tasks:
-            if task.get('completed_at'):
-                try:
-                    completed_time = datetime.fromisoformat(task['completed_at'].replace('Z', '+00:00'))
-                    hour = completed_time.hour
-                    if hour not in hourly_productivity:
-                        hourly_productivity[hour] = []
-                    
-                    # Score baseado na eficiência (assumindo que temos dados de tempo estimado vs real)
-                    efficiency_score = task.get('efficiency_score', 0.8)  # Default 80%
-                    hourly_productivity[hour].append(efficiency_score)
-                except:
-                    continue
+    def record_task_completion(self, user_id: str, task: Dict,
+                               timezone_name: Optional[str] = None) -> bool:
+        """Registra uma tarefa concluída no agregado incremental do usuário
+        
+        `timezone_name` (User.timezone) deve ser o mesmo em todos os registros do usuário.
+        """
+        with self.user_locks.for_key(user_id):
+            stats = self.productivity_stats.setdefault(user_id, HourlyProductivityStats())
+            return stats.add_task(task, timezone_name)
+    
+    def analyze_productivity_patterns(self, completed_tasks: List[Dict] = None,
+                                      user_id: str = None,
+                                      timezone_name: Optional[str] = None) -> Dict[str, Any]:
+        """Analisa padrões de produtividade para melhorar futuras otimizações
+        
+        Com `user_id`, responde a partir do agregado incremental do usuário,
+        em tempo constante. Uma lista de tarefas é agregada em uma única passada,
+        com as horas no fuso `timezone_name` do usuário.
+        """
+        if completed_tasks:
+            stats = HourlyProductivityStats()
+            stats.add_tasks(completed_tasks, timezone_name)
+        else:
+            stats = None
+            if user_id is not None:
+                # Cópia consistente: atualizações concorrentes não afetam a análise
+                with self.user_locks.for_key(user_id):
+                    if user_id in self.productivity_stats:
+                        stats = self.productivity_stats[user_id].copy()
+            if stats is None:
+                return {'message': 'Dados insuficientes para análise'}
         
         # Calcular médias por hora
-        hourly_averages = {
-            hour: np.mean(scores) for hour, scores in hourly_productivity.items()
-        }
+        hourly_averages = stats.hourly_averages()
         
         # Identificar picos de produtividade
         if hourly_averages:
@@ -251,36 +383,30 @@ class TaskOptimizer:
             'hourly_productivity': hourly_averages,
             'peak_productivity_hour': best_hour,
             'lowest_productivity_hour': worst_hour,
-            'total_tasks_analyzed': len(completed_tasks),
-            'recommendations': self._generate_productivity_recommendations(hourly_averages)
+            'total_tasks_analyzed': stats.total_tasks,
+            'recommendations': self._generate_productivity_recommendations(stats)
         }
     
-    def _generate_productivity_recommendations(self, hourly_data: Dict[int, float]) -> List[str]:
+    def _generate_productivity_recommendations(self, stats: 'HourlyProductivityStats') -> List[str]:
         """Gera recomendações baseadas nos padrões de produtividade"""
         recommendations = []
         
-        if not hourly_data:
+        if not stats.counts.any():
             return ['Colete mais dados completando tarefas para receber recomendações personalizadas']
         
         # Encontrar padrões
-        morning_hours = [h for h in hourly_data.keys() if 6 <= h <= 11]
-        afternoon_hours = [h for h in hourly_data.keys() if 12 <= h <= 17]
-        evening_hours = [h for h in hourly_data.keys() if 18 <= h <= 22]
-        
-        if morning_hours:
-            morning_avg = np.mean([hourly_data[h] for h in morning_hours])
-            if morning_avg > 0.8:
-                recommendations.append('Você é mais produtivo pela manhã. Agende tarefas importantes entre 6h-11h.')
-        
-        if afternoon_hours:
-            afternoon_avg = np.mean([hourly_data[h] for h in afternoon_hours])
-            if afternoon_avg > 0.8:
-                recommendations.append('Sua produtividade à tarde é excelente. Use este período para tarefas complexas.')
-        
-        if evening_hours:
-            evening_avg = np.mean([hourly_data[h] for h in evening_hours])
-            if evening_avg < 0.6:
-                recommendations.append('Evite tarefas complexas à noite. Use este período para reflexão e planejamento.')
+        morning_avg = stats.band_average(6, 11)
+        afternoon_avg = stats.band_average(12, 17)
+        evening_avg = stats.band_average(18, 22)
+        
+        if morning_avg is not None and morning_avg > 0.8:
+            recommendations.append('Você é mais produtivo pela manhã. Agende tarefas importantes entre 6h-11h.')
+        
+        if afternoon_avg is not None and afternoon_avg > 0.8:
+            recommendations.append('Sua produtividade à tarde é excelente. Use este período para tarefas complexas.')
+        
+        if evening_avg is not None and evening_avg < 0.6:
+            recommendations.append('Evite tarefas complexas à noite. Use este período para reflexão e planejamento.')
         
         return recommendations if recommendations else ['Continue coletando dados para recomendações mais precisas']
 
@@ -0,0 +1,90 @@
+"""
+Agrupamento por Fuso Horário do Usuário - Kairos AI Engine
+Converte arrays inteiros de epochs para hora/dia locais com tabelas de transição
+de deslocamento UTC por fuso (incluindo horário de verão), sem astimezone por linha
+"""
+
+import importlib.util
+import logging
+import os
+from functools import lru_cache
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfoNotFoundError
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# A construção das tabelas é a do backend (uma única implementação, só biblioteca
+# padrão), carregada pelo caminho: o backend não é um pacote instalável
+BACKEND_TIMEZONES_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', 'backend', 'kairos-backend', 'src', 'services', 'timezones.py'
+))
+
+def _load_backend_timezones():
+    spec = importlib.util.spec_from_file_location('kairos_backend_timezones', BACKEND_TIMEZONES_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+_backend_timezones = _load_backend_timezones()
+
+# Intervalo coberto pelas tabelas; fora dele vale o deslocamento da borda
+TABLE_START_EPOCH = _backend_timezones.TABLE_START_EPOCH
+TABLE_END_EPOCH = _backend_timezones.TABLE_END_EPOCH
+SAMPLE_SECONDS = _backend_timezones.SAMPLE_SECONDS
+
+class OffsetTable:
+    """
+    Deslocamentos UTC de um fuso como degraus: `offsets[i]` vale a partir de
+    `transitions[i]` (epoch em segundos). A consulta de um array de epochs é
+    uma única busca binária vetorizada.
+    """
+    __slots__ = ('zone_name', 'transitions', 'offsets')
+
+    def __init__(self, zone_name: str, transitions: np.ndarray, offsets: np.ndarray):
+        self.zone_name = zone_name
+        self.transitions = transitions
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, zone_name: str) -> 'OffsetTable':
+        """Tabela a partir de `offset_transitions` do backend"""
+        transitions, offsets = _backend_timezones.offset_transitions(zone_name)
+        return cls(zone_name, np.array([np.iinfo(np.int64).min] + transitions, dtype=np.int64),
+                   np.array(offsets, dtype=np.int64))
+
+    def offsets_at(self, epoch: np.ndarray) -> np.ndarray:
+        epoch = np.asarray(epoch, dtype=np.float64)
+        index = np.searchsorted(self.transitions, np.nan_to_num(epoch), side='right') - 1
+        return self.offsets[index]
+
+    def local_seconds(self, epoch: np.ndarray) -> np.ndarray:
+        """Segundos do relógio local desde 01/01/1970 (NaN permanece NaN)"""
+        epoch = np.asarray(epoch, dtype=np.float64)
+        return epoch + self.offsets_at(epoch)
+
+@lru_cache(maxsize=256)
+def offset_table(zone_name: Optional[str]) -> OffsetTable:
+    """Tabela do fuso (construída uma vez por processo); fusos inválidos usam UTC"""
+    try:
+        return OffsetTable.build(zone_name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Fuso horário desconhecido '{zone_name}'; usando UTC")
+        return OffsetTable('UTC', np.array([np.iinfo(np.int64).min], dtype=np.int64),
+                           np.zeros(1, dtype=np.int64))
+
+def local_time_fields(epoch: np.ndarray, zone_name: Optional[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Hora (0-23), dia da semana (0=Monday) e dia local (dias desde 01/01/1970)
+    de cada epoch no fuso; -1 onde o epoch é NaN
+    """
+    epoch = np.asarray(epoch, dtype=np.float64)
+    valid = ~np.isnan(epoch)
+    local = np.floor(np.where(valid, offset_table(zone_name).local_seconds(epoch), 0.0)).astype(np.int64)
+    day = local // 86400
+    # 01/01/1970 foi uma quinta-feira (weekday 3)
+    hour = np.where(valid, (local % 86400) // 3600, -1)
+    weekday = np.where(valid, (day + 3) % 7, -1)
+    return hour, weekday, np.where(valid, day, -1)
@@ -0,0 +1,194 @@
+"""
+Orquestrador de Treinamento - Kairos AI Engine
+Atualiza os modelos personalizados de todos os usuários com dados novos,
+distribuindo os jobs em um pool de processos com limite de tempo por job,
+diário para retomar execuções interrompidas e relatório de throughput
+"""
+
+import json
+import logging
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from advanced_presence_analyzer import update_and_publish, user_model_name
+from model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = 'training_journal.jsonl'
+
+# Assinatura do carregador de sessões: (user_id, sessões já treinadas) -> sessões novas,
+# como lista de dicts ou par (X, y) (ex.: feature_store.load_new_features). Roda no
+# processo worker, então precisa ser picklable (função de módulo ou functools.partial).
+SessionLoader = Callable[[Any, int], Union[List[Dict[str, Any]], Tuple[Any, Any]]]
+
+class JobTimeout(Exception):
+    """Job de treinamento excedeu o limite de tempo"""
+
+@contextmanager
+def _time_limit(seconds: Optional[float]):
+    """Interrompe o bloco com JobTimeout após `seconds` (SIGALRM; sem limite onde não existir)"""
+    if not seconds or not hasattr(signal, 'setitimer'):
+        yield
+        return
+
+    def _expire(signum, frame):
+        raise JobTimeout(f"Limite de {seconds}s excedido")
+
+    previous = signal.signal(signal.SIGALRM, _expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def _init_worker():
+    # Uma thread de BLAS/OpenMP por processo: o paralelismo vem do pool
+    from threadpoolctl import threadpool_limits
+    global _thread_limits
+    _thread_limits = threadpool_limits(limits=1)
+
+def _run_job(registry_root: str, user_id, trained_sessions: int, load_sessions: SessionLoader,
+             timeout: Optional[float], keep_versions: int) -> Dict[str, Any]:
+    """Job executado no worker; erros viram status para não depender de exceções picklable"""
+    started = time.monotonic()
+    result = {'user_id': user_id, 'version': None, 'sessions': 0}
+    try:
+        with _time_limit(timeout):
+            registry = ModelRegistry(registry_root)
+            sessions = load_sessions(user_id, trained_sessions)
+            result['sessions'] = len(sessions[0]) if isinstance(sessions, tuple) else len(sessions)
+            # Publicação atômica: um job interrompido não deixa versão parcial
+            result['version'] = update_and_publish(user_id, sessions, registry)
+        registry.prune(user_model_name(user_id), keep_versions)
+        result['status'] = 'published'
+    except JobTimeout as error:
+        result.update(status='timeout', error=str(error))
+    except Exception as error:
+        result.update(status='failed', error=f"{type(error).__name__}: {error}")
+    result['seconds'] = round(time.monotonic() - started, 3)
+    return result
+
+class TrainingOrchestrator:
+    """
+    Treino em massa dos modelos incrementais por usuário.
+
+    - `pending_users` seleciona quem tem ao menos `min_new_sessions` sessões
+      além das já treinadas (contagem lida dos metadados no registro)
+    - `run` distribui os jobs em `processes` processos; cada job tem
+      `job_timeout` segundos e publica no registro de forma atômica
+    - Cada resultado é gravado no diário (`<registro>/training_journal.jsonl`);
+      repetir `run` com o mesmo `run_id` pula os usuários já publicados
+    - O relatório final traz contagens por status e usuários por minuto
+    """
+
+    def __init__(self, registry: ModelRegistry = None, processes: Optional[int] = None,
+                 job_timeout: Optional[float] = 600.0, min_new_sessions: int = 50,
+                 keep_versions: int = 3, journal_path: Optional[str] = None):
+        self.registry = registry or ModelRegistry()
+        self.processes = processes or os.cpu_count() or 1
+        self.job_timeout = job_timeout
+        self.min_new_sessions = min_new_sessions
+        self.keep_versions = keep_versions
+        self.journal_path = journal_path or os.path.join(self.registry.root, JOURNAL_FILE)
+
+    def trained_sessions(self, user_id) -> int:
+        """Sessões já incorporadas ao modelo publicado do usuário"""
+        name = user_model_name(user_id)
+        version = self.registry.latest_version(name)
+        if version is None:
+            return 0
+        return int(self.registry.read_metadata(name, version).get('training', {}).get('n_samples', 0))
+
+    def pending_users(self, session_counts: Dict[Any, int]) -> Dict[Any, int]:
+        """
+        Usuários com dados novos suficientes: {user_id: sessões já treinadas},
+        a partir de {user_id: total de sessões registradas}
+        """
+        pending = {}
+        for user_id, total in session_counts.items():
+            trained = self.trained_sessions(user_id)
+            if total - trained >= self.min_new_sessions:
+                pending[user_id] = trained
+        return pending
+
+    def completed_users(self, run_id: str) -> Set[Any]:
+        """Usuários já publicados em uma execução anterior com o mesmo run_id"""
+        completed = set()
+        if not os.path.exists(self.journal_path):
+            return completed
+        with open(self.journal_path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # linha truncada por interrupção
+                if entry.get('run_id') == run_id and entry.get('status') == 'published':
+                    completed.add(entry['user_id'])
+        return completed
+
+    def _journal(self, entry: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+        with open(self.journal_path, 'a') as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def run(self, session_counts: Dict[Any, int], load_sessions: SessionLoader,
+            run_id: Optional[str] = None) -> Dict[str, Any]:
+        """Treina os usuários pendentes e devolve o relatório da execução"""
+        run_id = run_id or datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        completed = self.completed_users(run_id)
+        pending = {
+            user_id: trained for user_id, trained in self.pending_users(session_counts).items()
+            if user_id not in completed
+        }
+        logger.info(
+            f"Execução {run_id}: {len(pending)} usuários pendentes "
+            f"({len(completed)} já publicados), {self.processes} processos"
+        )
+
+        counts = {'published': 0, 'failed': 0, 'timeout': 0}
+        sessions = 0
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker) as executor:
+            futures = [
+                executor.submit(
+                    _run_job, self.registry.root, user_id, trained, load_sessions,
+                    self.job_timeout, self.keep_versions
+                )
+                for user_id, trained in pending.items()
+            ]
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    result = future.result()
+                    counts[result['status']] += 1
+                    sessions += result['sessions']
+                    self._journal({'run_id': run_id, **result})
+                    if result['status'] != 'published':
+                        logger.warning(f"Usuário {result['user_id']}: {result['status']} ({result.get('error')})")
+                    if done % 100 == 0:
+                        logger.info(f"{done}/{len(futures)} jobs concluídos")
+            except BaseException:
+                # Interrompido: descarta a fila; o diário permite retomar com o mesmo run_id
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+
+        elapsed = time.monotonic() - started
+        report = {
+            'run_id': run_id,
+            'scheduled': len(pending),
+            'skipped_completed': len(completed),
+            **counts,
+            'sessions': sessions,
+            'elapsed_seconds': round(elapsed, 2),
+            'users_per_minute': round(counts['published'] / elapsed * 60, 2) if elapsed > 0 else 0.0
+        }
+        logger.info(f"Execução {run_id} concluída: {report}")
+        return report
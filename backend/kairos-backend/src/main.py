@@ -13,6 +13,8 @@ from src.routes.user import user_bp
 from src.routes.tasks import tasks_bp
 from src.routes.rituals import rituals_bp
 from src.routes.reflections import reflections_bp
+from src.services.presence_aggregates import backfill_presence_aggregates
+from src.services.ritual_scheduler import ritual_scheduler
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'kairos-companion-of-presence-secret-key'
@@ -35,6 +37,24 @@ db.init_app(app)
 with app.app_context():
     db.create_all()
 
+@app.cli.command('backfill-presence-aggregates')
+def backfill_presence_aggregates_command():
+    """Monta os agregados de presença ausentes ou em fuso desatualizado
+    (após atualizar o banco ou alterar fusos: flask --app src.main backfill-presence-aggregates)"""
+    print(f"{backfill_presence_aggregates()} agregados de presença reconstruídos")
+
+def active_rituals():
+    """Rituais ativos, lidos pelo agendador de lembretes na sua própria thread"""
+    with app.app_context():
+        return Ritual.query.filter_by(is_active=True).all()
+
+# Cada worker WSGI inicia a thread do agendador, mas só o que obtiver o flock em
+# SCHEDULER_LOCK_PATH emite lembretes (os outros assumem se ele parar). No modo
+# debug, apenas o processo filho do reloader (que atende as requisições) participa
+SCHEDULER_LOCK_PATH = os.path.join(os.path.dirname(__file__), 'database', 'ritual_scheduler.lock')
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    ritual_scheduler.start(lock_path=SCHEDULER_LOCK_PATH, source=active_rituals)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Endpoint de verificação de saúde da API"""
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
+import json
 from src.models.user import db
 
 class DailyReflection(db.Model):
@@ -81,3 +82,155 @@ class PresenceLog(db.Model):
             'user_id': self.user_id
         }
 
+# Estatísticas de um grupo: [contagem, soma, soma dos quadrados, soma de posição * score, mínimo, máximo]
+# A posição é a ordem do log dentro do grupo (variável x da regressão de tendência)
+def _add_to_group(groups, key, score):
+    row = groups.get(key)
+    if row is None:
+        groups[key] = [1, score, score * score, 0, score, score]
+        return
+    row[3] += row[0] * score
+    row[0] += 1
+    row[1] += score
+    row[2] += score * score
+    row[4] = min(row[4], score)
+    row[5] = max(row[5], score)
+
+PRESENCE_HISTOGRAM_BUCKETS = 10
+
+# Origem da variável de tempo do modelo de previsão (mesma do motor de IA)
+PRESENCE_TIME_ORIGIN = datetime(2020, 1, 1)
+
+class PresenceAggregate(db.Model):
+    """Agregado incremental de presença por usuário, atualizado a cada log.
+    
+    Mantém somas por hora, dia da semana, contexto e humor, o agregado geral
+    (com a soma da regressão de tendência), um histograma de scores em 10
+    baldes e o primeiro/último log. Hora, dia da semana e hora da semana
+    usam o relógio local do fuso em `timezone` (o do usuário quando o agregado
+    foi montado). `to_dict()` é o formato aceito por
+    `PresenceAnalyzer.analyze_from_aggregate` no motor de IA.
+    """
+    __tablename__ = 'presence_aggregates'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_logs = db.Column(db.Integer, nullable=False, default=0)
+    first_logged_at = db.Column(db.DateTime)
+    last_logged_at = db.Column(db.DateTime)
+    timezone = db.Column(db.String(50), nullable=False, default='UTC')
+    
+    # Estatísticas por grupo (JSON)
+    hourly = db.Column(db.Text, nullable=False, default='{}')
+    weekday = db.Column(db.Text, nullable=False, default='{}')
+    context = db.Column(db.Text, nullable=False, default='{}')
+    mood = db.Column(db.Text, nullable=False, default='{}')
+    overall = db.Column(db.Text, nullable=False, default='null')
+    histogram = db.Column(db.Text, nullable=False, default='[]')
+    # Somas por hora da semana para o modelo de previsão: {'bins': {dia*24+hora: [n, Σy, Σt]}, 'sum_tt', 'sum_ty'}
+    hour_of_week = db.Column(db.Text, nullable=False, default='{}')
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def add_log(self, log, local_time=None):
+        """Incorpora um log em O(1); mesmos filtros da análise a partir dos logs brutos
+        
+        `local_time` é `logged_at` no fuso do agregado (padrão: o próprio logged_at, UTC).
+        """
+        self.total_logs = (self.total_logs or 0) + 1
+        if log.logged_at is not None:
+            if self.first_logged_at is None:
+                self.first_logged_at = log.logged_at
+            self.last_logged_at = log.logged_at
+        
+        score = log.presence_score
+        if score is None:
+            return
+        
+        if log.logged_at is not None:
+            local_time = local_time or log.logged_at
+            self._add_to_hour_of_week(log.logged_at, local_time, score)
+        
+        if score and log.logged_at is not None:
+            hourly = json.loads(self.hourly or '{}')
+            _add_to_group(hourly, str(local_time.hour), score)
+            self.hourly = json.dumps(hourly)
+            
+            weekday = json.loads(self.weekday or '{}')
+            _add_to_group(weekday, str(local_time.weekday()), score)
+            self.weekday = json.dumps(weekday)
+        
+        context = json.loads(self.context or '{}')
+        _add_to_group(context, log.context if log.context is not None else 'unknown', score)
+        self.context = json.dumps(context)
+        
+        if log.mood:
+            mood = json.loads(self.mood or '{}')
+            _add_to_group(mood, log.mood, score)
+            self.mood = json.dumps(mood)
+        
+        overall = json.loads(self.overall or 'null')
+        groups = {'all': overall} if overall else {}
+        _add_to_group(groups, 'all', score)
+        self.overall = json.dumps(groups['all'])
+        
+        # Balde [1, 2) -> 0, ..., [10, ∞) -> 9
+        histogram = json.loads(self.histogram or '[]') or [0] * PRESENCE_HISTOGRAM_BUCKETS
+        histogram[min(max(int(score) - 1, 0), PRESENCE_HISTOGRAM_BUCKETS - 1)] += 1
+        self.histogram = json.dumps(histogram)
+    
+    def _add_to_hour_of_week(self, logged_at, local_time, score):
+        hour_of_week = json.loads(self.hour_of_week or '{}')
+        bins = hour_of_week.setdefault('bins', {})
+        t = (logged_at - PRESENCE_TIME_ORIGIN).total_seconds() / 86400.0
+        row = bins.setdefault(str(local_time.weekday() * 24 + local_time.hour), [0, 0.0, 0.0])
+        row[0] += 1
+        row[1] += score
+        row[2] += t
+        hour_of_week['sum_tt'] = hour_of_week.get('sum_tt', 0.0) + t * t
+        hour_of_week['sum_ty'] = hour_of_week.get('sum_ty', 0.0) + t * score
+        self.hour_of_week = json.dumps(hour_of_week)
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'total_logs': self.total_logs or 0,
+            'first_logged_at': self.first_logged_at.isoformat() if self.first_logged_at else None,
+            'last_logged_at': self.last_logged_at.isoformat() if self.last_logged_at else None,
+            'timezone': self.timezone or 'UTC',
+            'hourly': json.loads(self.hourly or '{}'),
+            'weekday': json.loads(self.weekday or '{}'),
+            'context': json.loads(self.context or '{}'),
+            'mood': json.loads(self.mood or '{}'),
+            'overall': json.loads(self.overall or 'null'),
+            'histogram': json.loads(self.histogram or '[]') or [0] * PRESENCE_HISTOGRAM_BUCKETS,
+            'hour_of_week': json.loads(self.hour_of_week or '{}'),
+            'integer_scores': True,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class PresenceDailyAggregate(db.Model):
+    """Totais de presença de um usuário em um dia do seu fuso, para consultas por período"""
+    __tablename__ = 'presence_daily_aggregates'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    
+    log_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    mood_counts = db.Column(db.Text, nullable=False, default='{}')     # JSON humor -> contagem
+    context_counts = db.Column(db.Text, nullable=False, default='{}')  # JSON contexto -> contagem
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', name='unique_presence_day'),)
+    
+    def add_log(self, log):
+        self.log_count = (self.log_count or 0) + 1
+        self.score_sum = (self.score_sum or 0.0) + (log.presence_score or 0)
+        if log.mood:
+            mood_counts = json.loads(self.mood_counts or '{}')
+            mood_counts[log.mood] = mood_counts.get(log.mood, 0) + 1
+            self.mood_counts = json.dumps(mood_counts)
+        if log.context:
+            context_counts = json.loads(self.context_counts or '{}')
+            context_counts[log.context] = context_counts.get(log.context, 0) + 1
+            self.context_counts = json.dumps(context_counts)
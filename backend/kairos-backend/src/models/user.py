@@ -21,7 +21,7 @@ class User(db.Model):
     # Relacionamentos
     tasks = db.relationship('Task', backref='user', lazy=True, cascade='all, delete-orphan')
     rituals = db.relationship('Ritual', backref='user', lazy=True, cascade='all, delete-orphan')
-    reflections = db.relationship('Reflection', backref='user', lazy=True, cascade='all, delete-orphan')
+    reflections = db.relationship('DailyReflection', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from datetime import datetime, date, timedelta
 from src.models.user import db
 from src.models.reflection import DailyReflection, PresenceLog
+from src.services.presence_aggregates import get_presence_aggregate, presence_window_stats, record_presence_log
 
 reflections_bp = Blueprint('reflections', __name__)
 
@@ -107,7 +108,7 @@ def log_presence_moment():
             notes=data.get('notes', '')
         )
         
-        db.session.add(presence_log)
+        record_presence_log(presence_log)
         db.session.commit()
         
         return jsonify({
@@ -126,68 +127,39 @@ def get_presence_stats():
         user_id = request.args.get('user_id', 1, type=int)
         days = request.args.get('days', 7, type=int)
         
-        # Buscar logs de presença dos últimos N dias
+        # Dias (no fuso do usuário) inteiros vêm dos agregados diários; só o dia inicial é lido dos logs
         start_date = datetime.utcnow() - timedelta(days=days)
-        presence_logs = PresenceLog.query.filter(
-            PresenceLog.user_id == user_id,
-            PresenceLog.logged_at >= start_date
-        ).all()
-        
-        if not presence_logs:
-            return jsonify({
-                'success': True,
-                'stats': {
-                    'average_presence': 0,
-                    'total_logs': 0,
-                    'mood_distribution': {},
-                    'context_distribution': {},
-                    'daily_averages': []
-                }
-            })
-        
-        # Calcular estatísticas
-        total_logs = len(presence_logs)
-        average_presence = sum(log.presence_score for log in presence_logs) / total_logs
-        
-        # Distribuição de humor
-        mood_counts = {}
-        for log in presence_logs:
-            if log.mood:
-                mood_counts[log.mood] = mood_counts.get(log.mood, 0) + 1
-        
-        # Distribuição de contexto
-        context_counts = {}
-        for log in presence_logs:
-            if log.context:
-                context_counts[log.context] = context_counts.get(log.context, 0) + 1
-        
-        # Médias diárias
-        daily_scores = {}
-        for log in presence_logs:
-            day_key = log.logged_at.date().isoformat()
-            if day_key not in daily_scores:
-                daily_scores[day_key] = []
-            daily_scores[day_key].append(log.presence_score)
-        
-        daily_averages = [
-            {
-                'date': day,
-                'average_presence': sum(scores) / len(scores)
-            }
-            for day, scores in daily_scores.items()
-        ]
+        stats = presence_window_stats(user_id, start_date)
         
         return jsonify({
             'success': True,
             'stats': {
-                'average_presence': round(average_presence, 2),
-                'total_logs': total_logs,
-                'mood_distribution': mood_counts,
-                'context_distribution': context_counts,
-                'daily_averages': sorted(daily_averages, key=lambda x: x['date'])
+                'average_presence': round(stats['average_presence'], 2),
+                'total_logs': stats['total_logs'],
+                'mood_distribution': stats['mood_distribution'],
+                'context_distribution': stats['context_distribution'],
+                'daily_averages': stats['daily_averages'],
+                'timezone': stats['timezone']
             }
         })
     except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@reflections_bp.route('/reflections/presence-aggregate', methods=['GET'])
+def get_presence_aggregate_route():
+    """Obter o agregado incremental de presença (entrada do PresenceAnalyzer)"""
+    try:
+        user_id = request.args.get('user_id', 1, type=int)
+        
+        aggregate = get_presence_aggregate(user_id)
+        
+        return jsonify({
+            'success': True,
+            'aggregate': aggregate.to_dict()
+        })
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @reflections_bp.route('/reflections/weekly-report', methods=['GET'])
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from datetime import datetime, time
 from src.models.user import db
 from src.models.ritual import Ritual, RitualExecution
+from src.services.ritual_scheduler import ritual_scheduler
 
 rituals_bp = Blueprint('rituals', __name__)
 
@@ -47,6 +48,7 @@ def create_ritual():
         
         db.session.add(ritual)
         db.session.commit()
+        ritual_scheduler.upsert(ritual)
         
         return jsonify({
             'success': True,
@@ -190,6 +192,7 @@ def update_ritual(ritual_id):
         
         ritual.updated_at = datetime.utcnow()
         db.session.commit()
+        ritual_scheduler.upsert(ritual)
         
         return jsonify({
             'success': True,
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
 from src.models.user import User, db
+from src.services.ritual_scheduler import ritual_scheduler
 
 user_bp = Blueprint('user', __name__)
 
@@ -36,4 +37,6 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    # Os rituais do usuário são excluídos em cascata
+    ritual_scheduler.remove_user(user_id)
     return '', 204
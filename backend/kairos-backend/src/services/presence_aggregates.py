@@ -0,0 +1,194 @@
+import json
+from datetime import datetime, time, timedelta
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db, User
+from src.models.reflection import PresenceLog, PresenceAggregate, PresenceDailyAggregate
+from src.services.timezones import local_to_utc, offset_table
+
+def _new_daily_aggregate(user_id, day):
+    return PresenceDailyAggregate(user_id=user_id, day=day, log_count=0, score_sum=0.0,
+                                  mood_counts='{}', context_counts='{}')
+
+def _reset_aggregate(aggregate, zone_name):
+    aggregate.timezone = zone_name
+    aggregate.total_logs = 0
+    aggregate.first_logged_at = aggregate.last_logged_at = None
+    aggregate.hourly = aggregate.weekday = aggregate.context = aggregate.mood = '{}'
+    aggregate.overall = 'null'
+    aggregate.histogram = '[]'
+    aggregate.hour_of_week = '{}'
+
+def user_timezone(user_id):
+    user = db.session.get(User, user_id)
+    return (user.timezone if user is not None else None) or 'UTC'
+
+def _aggregate_history(aggregate, user_id, zone_name):
+    """Incorpora todo o histórico ao agregado (já zerado); devolve {dia: agregado diário}"""
+    daily = {}
+    table = offset_table(zone_name)
+    logs = PresenceLog.query.filter_by(user_id=user_id).order_by(PresenceLog.id).yield_per(1000)
+    with db.session.no_autoflush:
+        for log in logs:
+            local_time = table.to_local(log.logged_at) if log.logged_at is not None else None
+            aggregate.add_log(log, local_time)
+            if local_time is not None:
+                day = local_time.date()
+                if day not in daily:
+                    daily[day] = _new_daily_aggregate(user_id, day)
+                daily[day].add_log(log)
+    return daily
+
+def build_presence_aggregate(user_id, zone_name='UTC'):
+    """Agregados calculados de todo o histórico, fora da sessão (sem escrita):
+    (agregado, {dia: agregado diário}). Usado nas leituras enquanto o
+    agregado gravado não existe ou foi montado em outro fuso"""
+    aggregate = PresenceAggregate(user_id=user_id)
+    _reset_aggregate(aggregate, zone_name)
+    return aggregate, _aggregate_history(aggregate, user_id, zone_name)
+
+def lock_presence_aggregate(user_id, zone_name):
+    """
+    Trava a linha do agregado do usuário até o fim da transação e a devolve
+    atualizada, criando-a se não existir. Escritas concorrentes do mesmo
+    usuário (no SQLite, do banco todo) esperam aqui, então o read-modify-write
+    das colunas JSON não perde atualizações.
+    """
+    # UPDATE sem efeito: trava a linha (PostgreSQL) ou o banco (SQLite) antes de qualquer leitura
+    locked = db.session.execute(
+        update(PresenceAggregate)
+        .where(PresenceAggregate.user_id == user_id)
+        .values(total_logs=PresenceAggregate.total_logs)
+    ).rowcount
+    created = False
+    if not locked:
+        created = db.session.execute(
+            insert(PresenceAggregate)
+            .values(user_id=user_id, timezone=zone_name, total_logs=0, hourly='{}', weekday='{}',
+                    context='{}', mood='{}', overall='null', histogram='[]', hour_of_week='{}')
+            .on_conflict_do_nothing(index_elements=['user_id'])
+        ).rowcount == 1
+    aggregate = db.session.get(PresenceAggregate, user_id, populate_existing=True)
+    # Agregado novo (histórico anterior a ele) ou montado em outro fuso: reconstruir aqui, na escrita
+    if created or (aggregate.timezone or 'UTC') != zone_name:
+        rebuild_presence_aggregate(aggregate, zone_name)
+    return aggregate
+
+def rebuild_presence_aggregate(aggregate, zone_name='UTC'):
+    """Reconstrói o agregado (já travado) e os diários do usuário a partir de
+    todo o histórico, no fuso `zone_name`"""
+    PresenceDailyAggregate.query.filter_by(user_id=aggregate.user_id).delete()
+    _reset_aggregate(aggregate, zone_name)
+    daily = _aggregate_history(aggregate, aggregate.user_id, zone_name)
+    db.session.add_all(daily.values())
+    return aggregate
+
+def backfill_presence_aggregates():
+    """Monta os agregados ausentes ou em fuso desatualizado, um usuário por
+    transação (job de migração; as leituras não gravam). Devolve quantos mudaram"""
+    rebuilt = 0
+    for user_id, zone_name in db.session.query(User.id, User.timezone).all():
+        zone_name = zone_name or 'UTC'
+        aggregate = db.session.get(PresenceAggregate, user_id)
+        if aggregate is not None and (aggregate.timezone or 'UTC') == zone_name:
+            continue
+        lock_presence_aggregate(user_id, zone_name)
+        db.session.commit()
+        rebuilt += 1
+    return rebuilt
+
+def _locked_daily_aggregate(user_id, day):
+    """Agregado diário do dia, criado com upsert (o primeiro log do dia não
+    conflita com outro criando a mesma linha)"""
+    db.session.execute(
+        insert(PresenceDailyAggregate)
+        .values(user_id=user_id, day=day, log_count=0, score_sum=0.0, mood_counts='{}', context_counts='{}')
+        .on_conflict_do_nothing(index_elements=['user_id', 'day'])
+    )
+    return PresenceDailyAggregate.query.filter_by(user_id=user_id, day=day).populate_existing().one()
+
+def get_presence_aggregate(user_id):
+    """Agregado do usuário no seu fuso atual, sem escrita: o gravado ou, se
+    ausente ou montado em outro fuso, um calculado do histórico"""
+    zone_name = user_timezone(user_id)
+    aggregate = db.session.get(PresenceAggregate, user_id)
+    if aggregate is None or (aggregate.timezone or 'UTC') != zone_name:
+        aggregate, _ = build_presence_aggregate(user_id, zone_name)
+    return aggregate
+
+def record_presence_log(presence_log):
+    """Adiciona o log à sessão e atualiza os agregados na mesma transação (O(1)),
+    com a linha do agregado travada até o commit"""
+    aggregate = lock_presence_aggregate(presence_log.user_id, user_timezone(presence_log.user_id))
+    db.session.add(presence_log)
+    db.session.flush()  # aplica o default de logged_at
+    
+    local_time = None
+    if presence_log.logged_at is not None:
+        local_time = offset_table(aggregate.timezone).to_local(presence_log.logged_at)
+    aggregate.add_log(presence_log, local_time)
+    if local_time is not None:
+        _locked_daily_aggregate(presence_log.user_id, local_time.date()).add_log(presence_log)
+    return aggregate
+
+def presence_window_stats(user_id, start_date):
+    """
+    Estatísticas dos logs com logged_at >= start_date (UTC): dias inteiros
+    vêm dos agregados diários e apenas o dia parcial do início é lido dos
+    logs brutos. Os dias são os do fuso do usuário.
+    """
+    zone_name = user_timezone(user_id)
+    aggregate = db.session.get(PresenceAggregate, user_id)
+    transient_days = None
+    if aggregate is None or (aggregate.timezone or 'UTC') != zone_name:
+        _, transient_days = build_presence_aggregate(user_id, zone_name)
+    local_start = offset_table(zone_name).to_local(start_date)
+    local_boundary_end = datetime.combine(local_start.date() + timedelta(days=1), time.min)
+    boundary_end = local_to_utc(local_boundary_end, zone_name)
+    
+    boundary_logs = PresenceLog.query.filter(
+        PresenceLog.user_id == user_id,
+        PresenceLog.logged_at >= start_date,
+        PresenceLog.logged_at < boundary_end
+    ).order_by(PresenceLog.id).all()
+    boundary_day = PresenceDailyAggregate(user_id=user_id, day=local_start.date(),
+                                          log_count=0, score_sum=0.0)
+    for log in boundary_logs:
+        boundary_day.add_log(log)
+    
+    if transient_days is not None:
+        full_days = [transient_days[day] for day in sorted(transient_days)
+                     if day >= local_boundary_end.date()]
+    else:
+        full_days = PresenceDailyAggregate.query.filter(
+            PresenceDailyAggregate.user_id == user_id,
+            PresenceDailyAggregate.day >= local_boundary_end.date()
+        ).order_by(PresenceDailyAggregate.day).all()
+    
+    total_logs = 0
+    score_sum = 0.0
+    mood_counts = {}
+    context_counts = {}
+    daily_averages = []
+    for daily in ([boundary_day] if boundary_logs else []) + full_days:
+        if not daily.log_count:
+            continue
+        total_logs += daily.log_count
+        score_sum += daily.score_sum
+        for mood, count in json.loads(daily.mood_counts or '{}').items():
+            mood_counts[mood] = mood_counts.get(mood, 0) + count
+        for context, count in json.loads(daily.context_counts or '{}').items():
+            context_counts[context] = context_counts.get(context, 0) + count
+        daily_averages.append({
+            'date': daily.day.isoformat(),
+            'average_presence': daily.score_sum / daily.log_count
+        })
+    
+    return {
+        'total_logs': total_logs,
+        'average_presence': score_sum / total_logs if total_logs else 0,
+        'mood_distribution': mood_counts,
+        'context_distribution': context_counts,
+        'daily_averages': daily_averages,
+        'timezone': zone_name
+    }
@@ -0,0 +1,271 @@
+import fcntl
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Frequências com regra de repetição conhecida; 'custom' não é agendado
+SCHEDULABLE_FREQUENCIES = ('daily', 'weekly')
+
+def logging_sink(due):
+    """Destino padrão: apenas registra o lembrete no log"""
+    logger.info(
+        f"Ritual {due['ritual_id']} ({due['name']}) do usuário {due['user_id']} "
+        f"devido em {due['due_at']}"
+    )
+
+def next_occurrence(entry, after):
+    """Próximo horário do ritual estritamente depois de `after`, ou None"""
+    candidate = datetime.combine(after.date(), entry['scheduled_time'])
+    if entry['frequency'] == 'daily':
+        if candidate <= after:
+            candidate += timedelta(days=1)
+        return candidate
+    if entry['frequency'] == 'weekly':
+        candidate += timedelta(days=(entry['weekday'] - candidate.weekday()) % 7)
+        if candidate <= after:
+            candidate += timedelta(days=7)
+        return candidate
+    return None
+
+class RitualScheduler:
+    """
+    Agenda os lembretes de todos os rituais ativos em um heap de próximas ocorrências.
+
+    - Cada ritual tem no máximo uma ocorrência viva no heap; `upsert` e `remove`
+      apenas trocam a versão do ritual, e entradas de versões antigas são
+      descartadas quando chegam ao topo (invalidação preguiçosa)
+    - `tick` retira só o que já venceu: O(vencidos * log n) por execução,
+      independente do total de rituais
+    - Rituais vencidos são enviados ao `sink` e reagendados para a próxima
+      ocorrência
+    - Na carga, ocorrências dos últimos `catch_up` antes da subida (lembretes
+      perdidos enquanto o processo estava parado) são emitidas uma única vez
+      no primeiro `tick`; as mais antigas são descartadas. Como o último envio
+      não é persistido, reiniciar (ou trocar de líder) logo após um envio repete
+      esse lembrete
+    - Horários são interpretados em UTC, como o restante da API
+    - Com vários processos (workers WSGI), só um emite lembretes: `start` com
+      `lock_path` disputa um flock nesse arquivo e apenas o processo que o
+      obtém executa `tick`; os demais tentam de novo a cada intervalo e assumem
+      se o líder morrer. O líder recarrega os rituais de `source` ao assumir
+      e a cada `sync_seconds`, para ver o que outros workers alteraram
+    """
+
+    def __init__(self, sink=None, clock=datetime.utcnow, catch_up=timedelta(minutes=30)):
+        self.sink = sink or logging_sink
+        self.clock = clock
+        self.catch_up = catch_up
+        self._heap = []  # (due_at, ritual_id, version)
+        self._entries = {}  # ritual_id -> dados do ritual agendado
+        self._versions = {}  # ritual_id -> versão atual
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None  # aberto enquanto este processo é o líder
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _entry_from_ritual(ritual):
+        if not ritual.is_active or ritual.scheduled_time is None:
+            return None
+        if ritual.frequency not in SCHEDULABLE_FREQUENCIES:
+            return None
+        # Rituais semanais repetem no dia da semana em que foram criados
+        anchor = ritual.created_at or datetime.utcnow()
+        return {
+            'ritual_id': ritual.id,
+            'user_id': ritual.user_id,
+            'name': ritual.name,
+            'ritual_type': ritual.ritual_type,
+            'frequency': ritual.frequency,
+            'scheduled_time': ritual.scheduled_time,
+            'weekday': anchor.weekday()
+        }
+
+    def load(self, rituals):
+        """Carga completa (na subida ou ao assumir a liderança) com um único heapify"""
+        # Ocorrências dentro da janela de recuperação ficam vencidas para o primeiro tick
+        since = self.clock() - self.catch_up
+        with self._lock:
+            for ritual_id in self._entries:
+                self._versions[ritual_id] += 1
+            self._entries = {}
+            self._heap = []
+            for ritual in rituals:
+                entry = self._entry_from_ritual(ritual)
+                if entry is None:
+                    continue
+                version = self._versions.get(ritual.id, 0) + 1
+                self._versions[ritual.id] = version
+                self._entries[ritual.id] = entry
+                self._heap.append((next_occurrence(entry, since), ritual.id, version))
+            heapq.heapify(self._heap)
+
+        logger.info(f"Agendador de rituais carregado com {len(self._entries)} rituais")
+
+    def upsert(self, ritual):
+        """Agenda (ou reagenda) um ritual criado ou alterado; O(log n)"""
+        entry = self._entry_from_ritual(ritual)
+        now = self.clock()
+        with self._lock:
+            version = self._versions.get(ritual.id, 0) + 1
+            self._versions[ritual.id] = version
+            if entry is None:
+                self._entries.pop(ritual.id, None)
+            else:
+                self._entries[ritual.id] = entry
+                heapq.heappush(self._heap, (next_occurrence(entry, now), ritual.id, version))
+            self._compact()
+
+    def sync(self, rituals):
+        """
+        Reconcilia com a lista atual de rituais ativos: agenda os novos e os
+        alterados a partir de agora e descarta os ausentes; os inalterados
+        mantêm a ocorrência já agendada
+        """
+        now = self.clock()
+        with self._lock:
+            current = {}
+            for ritual in rituals:
+                entry = self._entry_from_ritual(ritual)
+                if entry is not None:
+                    current[ritual.id] = entry
+            for ritual_id in [ritual_id for ritual_id in self._entries if ritual_id not in current]:
+                del self._entries[ritual_id]
+                self._versions[ritual_id] += 1
+            for ritual_id, entry in current.items():
+                if self._entries.get(ritual_id) == entry:
+                    continue
+                version = self._versions.get(ritual_id, 0) + 1
+                self._versions[ritual_id] = version
+                self._entries[ritual_id] = entry
+                heapq.heappush(self._heap, (next_occurrence(entry, now), ritual_id, version))
+            self._compact()
+
+    def remove(self, ritual_id):
+        """Descarta um ritual excluído; O(1)"""
+        with self._lock:
+            if self._entries.pop(ritual_id, None) is not None:
+                self._versions[ritual_id] += 1
+            self._compact()
+
+    def remove_user(self, user_id):
+        """Descarta os rituais de um usuário excluído (a exclusão remove os rituais em cascata)"""
+        with self._lock:
+            for ritual_id in [ritual_id for ritual_id, entry in self._entries.items()
+                              if entry['user_id'] == user_id]:
+                del self._entries[ritual_id]
+                self._versions[ritual_id] += 1
+            self._compact()
+
+    def _compact(self):
+        """Reconstrói o heap quando as entradas obsoletas passam das vivas"""
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [item for item in self._heap
+                          if item[1] in self._entries and self._versions[item[1]] == item[2]]
+            heapq.heapify(self._heap)
+
+    def tick(self, now=None):
+        """Emite os rituais vencidos até `now` e reagenda cada um"""
+        now = now or self.clock()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due_at, ritual_id, version = heapq.heappop(self._heap)
+                entry = self._entries.get(ritual_id)
+                if entry is None or self._versions[ritual_id] != version:
+                    continue  # ritual alterado ou removido depois do agendamento
+                due.append({**entry, 'due_at': due_at.isoformat(),
+                            'scheduled_time': entry['scheduled_time'].strftime('%H:%M')})
+                heapq.heappush(self._heap, (next_occurrence(entry, now), ritual_id, version))
+
+        # Sink fora do lock para não bloquear as rotas
+        for item in due:
+            try:
+                self.sink(item)
+            except Exception:
+                logger.exception(f"Falha ao emitir lembrete do ritual {item['ritual_id']}")
+        return due
+
+    def next_due_at(self):
+        with self._lock:
+            while self._heap:
+                due_at, ritual_id, version = self._heap[0]
+                if ritual_id in self._entries and self._versions[ritual_id] == version:
+                    return due_at
+                heapq.heappop(self._heap)
+            return None
+
+    def start(self, interval_seconds=30, lock_path=None, source=None, sync_seconds=300):
+        """
+        Executa `tick` periodicamente em uma thread daemon. Com `lock_path`,
+        só no processo que detiver o lock; `source()` devolve os rituais ativos
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval_seconds, lock_path, source, sync_seconds),
+            name='ritual-scheduler', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()  # libera o flock para outro processo
+            self._lock_file = None
+
+    def _acquire_leadership(self, lock_path):
+        """True se este processo detém (ou acabou de obter) o lock de agendamento"""
+        if lock_path is None or self._lock_file is not None:
+            return True
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info(f"Processo {os.getpid()} assumiu o agendamento de lembretes")
+        return True
+
+    def _refresh(self, source, full):
+        try:
+            rituals = source()
+        except Exception:
+            logger.exception("Falha ao recarregar os rituais do agendador")
+            return False
+        if full:
+            self.load(rituals)
+        else:
+            self.sync(rituals)
+        return True
+
+    def _run(self, interval_seconds, lock_path, source, sync_seconds):
+        leader = False
+        synced_at = None
+        while True:
+            if not leader and self._acquire_leadership(lock_path):
+                leader = True
+                # O heap de quem assume a liderança pode estar desatualizado: recarregar do banco
+                if source is not None and lock_path is not None and self._refresh(source, full=True):
+                    synced_at = self.clock()
+            if leader:
+                due_sync = synced_at is None or self.clock() - synced_at >= timedelta(seconds=sync_seconds)
+                if source is not None and due_sync and self._refresh(source, full=False):
+                    synced_at = self.clock()
+                self.tick()
+            if self._stop.wait(interval_seconds):
+                return
+
+ritual_scheduler = RitualScheduler()
@@ -0,0 +1,97 @@
+import logging
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+# Intervalo coberto pelas tabelas; fora dele vale o deslocamento da borda
+TABLE_START_EPOCH = int(datetime(1990, 1, 1, tzinfo=timezone.utc).timestamp())
+TABLE_END_EPOCH = int(datetime(2050, 1, 1, tzinfo=timezone.utc).timestamp())
+SAMPLE_SECONDS = 86400
+
+def offset_transitions(zone_name):
+    """
+    Mudanças de deslocamento UTC do fuso entre TABLE_START_EPOCH e
+    TABLE_END_EPOCH: (transições, deslocamentos), com `offsets[0]` valendo
+    antes da primeira transição e `offsets[i + 1]` a partir de
+    `transitions[i]` (epoch em segundos).
+
+    Amostra o deslocamento uma vez por dia e localiza cada mudança com
+    precisão de segundo por bisseção. Implementação única: o motor de IA
+    (ai-engine/timezone_buckets.py) carrega este módulo, então ele usa só a
+    biblioteca padrão.
+    """
+    zone = ZoneInfo(zone_name)
+
+    def offset_at(epoch):
+        return int(datetime.fromtimestamp(epoch, zone).utcoffset().total_seconds())
+
+    previous_epoch = TABLE_START_EPOCH
+    previous_offset = offset_at(previous_epoch)
+    transitions = []
+    offsets = [previous_offset]
+
+    for epoch in range(TABLE_START_EPOCH + SAMPLE_SECONDS, TABLE_END_EPOCH, SAMPLE_SECONDS):
+        offset = offset_at(epoch)
+        if offset != previous_offset:
+            # Primeiro segundo com o novo deslocamento em (previous_epoch, epoch]
+            low, high = previous_epoch, epoch
+            while high - low > 1:
+                middle = (low + high) // 2
+                if offset_at(middle) == previous_offset:
+                    low = middle
+                else:
+                    high = middle
+            transitions.append(high)
+            offsets.append(offset)
+            previous_offset = offset
+        previous_epoch = epoch
+
+    return transitions, offsets
+
+class UtcOffsetTable:
+    """
+    Deslocamentos UTC de um fuso como degraus: `offsets[i]` vale a partir de
+    `transitions[i]` (epoch em segundos). Converter um horário é uma busca
+    binária na tabela, sem consultar o zoneinfo a cada log.
+    """
+
+    def __init__(self, zone_name, transitions, offsets):
+        self.zone_name = zone_name
+        self.transitions = transitions
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, zone_name):
+        transitions, offsets = offset_transitions(zone_name)
+        return cls(zone_name, [float('-inf')] + transitions, offsets)
+
+    def offset_at(self, utc_time):
+        """Deslocamento (segundos) em um horário UTC sem fuso, como os gravados no banco"""
+        epoch = (utc_time - EPOCH).total_seconds()
+        return self.offsets[bisect_right(self.transitions, epoch) - 1]
+
+    def to_local(self, utc_time):
+        """Horário UTC sem fuso -> relógio local do usuário (sem fuso)"""
+        return utc_time + timedelta(seconds=self.offset_at(utc_time))
+
+@lru_cache(maxsize=256)
+def offset_table(zone_name):
+    """Tabela do fuso (construída uma vez por processo); fusos inválidos usam UTC"""
+    try:
+        return UtcOffsetTable.build(zone_name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Fuso horário desconhecido '{zone_name}'; usando UTC")
+        return UtcOffsetTable('UTC', [float('-inf')], [0])
+
+def local_to_utc(local_time, zone_name):
+    """Relógio local (sem fuso) -> UTC sem fuso; horários ambíguos usam a primeira ocorrência"""
+    try:
+        zone = ZoneInfo(zone_name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        zone = timezone.utc
+    return local_time.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)